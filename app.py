@@ -1,8 +1,7 @@
 from flask import Flask
 from flask_restful import Api
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
 from models import db
+from rate_limiting import init_rate_limiting
 from redis_config import redis_client
 from datetime import datetime
 import logging
@@ -36,9 +35,13 @@ def create_app():
     except Exception as e:
         logger.error(f"Database initialization failed: {str(e)}")
 
+    init_rate_limiting(app)
+
     
     from resources import (
-        RecommendCourses, CourseEnrollment, DeleteEnrollment, 
+        RecommendCourses, BatchRecommendCourses, RecommendationCacheStats, StudentGradesPosted,
+        CatalogVersion, CatalogInvalidation,
+        CourseEnrollment, DeleteEnrollment, EnrollmentTicket, CourseWaitlist, GeneratedTimetables,
         EnrollmentPeriod, EnrollmentPeriodStatus,
         GraduationEligibility, GraduationRequirements,
         AcademicPerformanceEvaluation,RecommendCoursesWithCredits,
@@ -47,6 +50,12 @@ def create_app():
 
     # endpoints
     api.add_resource(RecommendCourses, '/recommend-courses/<int:student_id>')
+    api.add_resource(BatchRecommendCourses, '/recommend-courses/batch')
+    api.add_resource(RecommendationCacheStats, '/recommend-courses/cache-stats')
+    api.add_resource(StudentGradesPosted, '/students/<int:student_id>/grades-posted')
+
+    api.add_resource(CatalogVersion, '/catalog/version')
+    api.add_resource(CatalogInvalidation, '/catalog/invalidate')
     
 
     api.add_resource(EnrollmentPeriod, '/enrollment-period')
@@ -57,10 +66,13 @@ def create_app():
 
     api.add_resource(CourseEnrollment, '/enrollment/add/<int:student_id>')
     api.add_resource(DeleteEnrollment, '/enrollment/delete/<int:student_id>')
+    api.add_resource(EnrollmentTicket, '/enrollment/tickets/<string:ticket_id>')
+    api.add_resource(CourseWaitlist, '/waitlist/<int:student_id>/<int:course_id>')
+    api.add_resource(GeneratedTimetables, '/timetables/<int:student_id>')
 
     api.add_resource(AcademicPerformanceEvaluation, '/academic-evaluation/<int:student_id>')
 
-    api.add_resource(GraduationCheckResource, '/graduation-check/<int:student_id>')
+    api.add_resource(GraduationCheckResource, '/graduation-audit/<int:student_id>')
 
     return app
 
@@ -0,0 +1,582 @@
+from models import db, Course, CourseDepartment
+from redis_config import redis_client, subscribe
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sqlalchemy.orm import joinedload
+from scipy.sparse import csr_matrix
+from collections import deque
+import numpy as np
+import threading
+import random
+import json
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_CHANNEL = 'catalog:invalidate'
+
+# نسخة مشتركة من صفوف بيانات المواد حتى لا تقرأ كل العمليات قاعدة البيانات معًا
+CATALOG_SNAPSHOT_KEY = 'catalog:snapshot:{version}'
+CATALOG_SNAPSHOT_TTL_SECONDS = 3600
+CATALOG_REBUILD_LOCK_KEY = 'catalog:rebuild:{version}'
+CATALOG_REBUILD_LOCK_SECONDS = 30
+
+# التحقق الدوري من رقم النسخة في حال فاتت رسالة الإلغاء
+CATALOG_VERSION_CHECK_SECONDS = 5
+
+
+class CourseIndex:
+    """
+    فهرس متجهات TF-IDF لأوصاف المواد يُبنى مرة واحدة لكل نسخة من بيانات المواد
+
+    Args:
+        course_data (dict): بيانات المواد كما تعيدها get_course_data
+        version (int): رقم نسخة بيانات المواد التي بُني منها الفهرس
+    """
+
+    def __init__(self, course_data, version=None):
+        self.version = version
+        self.course_ids = list(course_data.keys())
+        self.positions = {course_id: i for i, course_id in enumerate(self.course_ids)}
+        descriptions = [course_data[course_id].get("description") or "" for course_id in self.course_ids]
+
+        self.vectorizer = TfidfVectorizer()
+        try:
+            # صفوف المصفوفة مطبّعة (L2) لذلك حاصل الضرب يساوي تشابه جيب التمام
+            self.matrix = self.vectorizer.fit_transform(descriptions).tocsr()
+        except ValueError:
+            # لا توجد كلمات صالحة في أوصاف المواد
+            self.matrix = None
+
+    def rows(self, course_ids):
+        """أرقام صفوف المواد الموجودة في الفهرس"""
+        return [self.positions[course_id] for course_id in course_ids if course_id in self.positions]
+
+    def mean_similarity(self, studied_courses, candidate_courses):
+        """
+        متوسط تشابه جيب التمام بين كل مادة مرشحة والمواد المدروسة
+
+        Args:
+            studied_courses (list): المواد التي درسها الطالب
+            candidate_courses (list): المواد المرشحة
+
+        Returns:
+            numpy.ndarray: درجة تشابه لكل مادة مرشحة بنفس الترتيب
+        """
+        if self.matrix is None or not studied_courses:
+            return np.zeros(len(candidate_courses))
+
+        # متوسط متجهات المواد المدروسة ثم ضرب مصفوفي واحد مع المواد المرشحة
+        return self.score(self.vector_sum(studied_courses) / len(studied_courses), candidate_courses)
+
+    def vector_sum(self, course_ids):
+        """
+        مجموع متجهات TF-IDF للمواد
+
+        Returns:
+            numpy.ndarray: متجه كثيف بطول المفردات
+        """
+        if self.matrix is None:
+            return np.zeros(0)
+        rows = self.rows(course_ids)
+        if not rows:
+            return np.zeros(self.matrix.shape[1])
+        return np.asarray(self.matrix[rows].sum(axis=0)).ravel()
+
+    def score(self, profile, candidate_courses):
+        """
+        حاصل الضرب النقطي بين متجه اهتمامات الطالب وكل مادة مرشحة
+
+        Args:
+            profile (numpy.ndarray): متجه اهتمامات الطالب
+            candidate_courses (list): المواد المرشحة
+
+        Returns:
+            numpy.ndarray: درجة لكل مادة مرشحة بنفس الترتيب
+        """
+        scores = np.zeros(len(candidate_courses))
+        if self.matrix is None or not candidate_courses or not profile.any():
+            return scores
+
+        candidate_positions = [self.positions.get(course_id) for course_id in candidate_courses]
+        known = [i for i, position in enumerate(candidate_positions) if position is not None]
+        if known:
+            scores[known] = self.matrix[[candidate_positions[i] for i in known]] @ profile
+
+        return scores
+
+    def mean_similarity_matrix(self, studied_lists, candidate_courses):
+        """
+        متوسط التشابه لمجموعة من الطلاب دفعة واحدة
+        (مصفوفة المواد المدروسة × مصفوفة متجهات المواد)
+
+        Args:
+            studied_lists (list): قائمة المواد المدروسة لكل طالب
+            candidate_courses (list): المواد المرشحة
+
+        Returns:
+            numpy.ndarray: مصفوفة (عدد الطلاب × عدد المواد المرشحة)
+        """
+        scores = np.zeros((len(studied_lists), len(candidate_courses)))
+        if self.matrix is None or not studied_lists or not candidate_courses:
+            return scores
+
+        rows, cols, weights = [], [], []
+        for i, studied_courses in enumerate(studied_lists):
+            for position in self.rows(studied_courses):
+                rows.append(i)
+                cols.append(position)
+                weights.append(1.0 / len(studied_courses))
+
+        if not rows:
+            return scores
+
+        completed_matrix = csr_matrix(
+            (weights, (rows, cols)),
+            shape=(len(studied_lists), self.matrix.shape[0])
+        )
+
+        candidate_positions = [self.positions.get(course_id) for course_id in candidate_courses]
+        known = [i for i, position in enumerate(candidate_positions) if position is not None]
+        if known:
+            profiles = completed_matrix @ self.matrix
+            candidates = self.matrix[[candidate_positions[i] for i in known]]
+            scores[:, known] = (profiles @ candidates.T).toarray()
+
+        return scores
+
+
+class PrerequisiteGraph:
+    """
+    مخطط المتطلبات السابقة المترجم من جدول المواد
+
+    يحتوي على الاتجاهين (المتطلبات والمواد المعتمدة عليها) والترتيب الطوبولوجي
+    والإغلاق المتعدي وعدد المواد التي تفتحها كل مادة، وكلها محسوبة مرة واحدة
+
+    Args:
+        prerequisites (dict): المتطلبات السابقة المباشرة لكل مادة
+    """
+
+    def __init__(self, prerequisites):
+        self.forward = {
+            course_id: tuple(p for p in prereqs if p is not None)
+            for course_id, prereqs in prerequisites.items()
+        }
+
+        reverse = {course_id: [] for course_id in self.forward}
+        for course_id, prereqs in self.forward.items():
+            for prereq in prereqs:
+                reverse.setdefault(prereq, []).append(course_id)
+        self.reverse = {course_id: tuple(dependents) for course_id, dependents in reverse.items()}
+
+        self.topological_order = self._topological_sort()
+        self.cyclic = frozenset(self.reverse) - frozenset(self.topological_order)
+        if self.cyclic:
+            logger.warning(f"Prerequisite cycle detected between courses: {sorted(self.cyclic)}")
+
+        self.ancestors = self._closure(self.forward, self.topological_order)
+        self.descendants = self._closure(self.reverse, list(reversed(self.topological_order)))
+        self.unlock_counts = {course_id: len(d) for course_id, d in self.descendants.items()}
+
+    def _topological_sort(self):
+        in_degree = {course_id: len(self.forward.get(course_id, ())) for course_id in self.reverse}
+        queue = deque(sorted(course_id for course_id, degree in in_degree.items() if degree == 0))
+        order = []
+        while queue:
+            course_id = queue.popleft()
+            order.append(course_id)
+            for dependent in self.reverse.get(course_id, ()):
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    queue.append(dependent)
+        return order
+
+    def _closure(self, edges, order):
+        closure = {}
+        for course_id in order:
+            reachable = set()
+            for neighbour in edges.get(course_id, ()):
+                reachable.add(neighbour)
+                reachable |= closure.get(neighbour, frozenset())
+            closure[course_id] = frozenset(reachable)
+
+        # المواد الداخلة في دورة لا تظهر في الترتيب الطوبولوجي فتُحسب بالبحث المباشر
+        for course_id in self.cyclic:
+            reachable = set()
+            stack = list(edges.get(course_id, ()))
+            while stack:
+                neighbour = stack.pop()
+                if neighbour not in reachable:
+                    reachable.add(neighbour)
+                    stack.extend(edges.get(neighbour, ()))
+            closure[course_id] = frozenset(reachable)
+
+        return closure
+
+    def prerequisites_of(self, course_id):
+        """المتطلبات السابقة المباشرة للمادة"""
+        return self.forward.get(course_id, ())
+
+    def dependents_of(self, course_id):
+        """المواد التي تعتمد مباشرة على المادة"""
+        return self.reverse.get(course_id, ())
+
+    def all_prerequisites(self, course_id):
+        """جميع المتطلبات السابقة للمادة (الإغلاق المتعدي)"""
+        return self.ancestors.get(course_id, frozenset())
+
+    def is_prerequisite_for_others(self, course_id):
+        return bool(self.reverse.get(course_id))
+
+    def unlock_count(self, course_id):
+        """عدد المواد التي تعتمد على المادة بشكل مباشر أو غير مباشر"""
+        return self.unlock_counts.get(course_id, 0)
+
+    def is_unlocked(self, course_id, completed_courses):
+        """
+        التحقق من استيفاء المتطلبات السابقة المباشرة
+
+        Args:
+            course_id (int): معرف المادة
+            completed_courses (set): المواد المكتملة
+        """
+        return all(prereq in completed_courses for prereq in self.forward.get(course_id, ()))
+
+
+class EligibilityIndex:
+    """
+    ترقيم المواد بأرقام تسلسلية متصلة لتمثيل تاريخ الطالب كمصفوفات منطقية
+
+    تُحسب الأهلية لكل المواد (أو لدفعة طلاب كاملة) بعمليات AND/OR على المصفوفات
+    بدلاً من البحث في القوائم
+
+    Args:
+        course_data (dict): بيانات المواد
+        prerequisite_graph (PrerequisiteGraph): مخطط المتطلبات السابقة
+    """
+
+    def __init__(self, course_data, prerequisite_graph):
+        self.course_ids = np.array(sorted(course_data), dtype=np.int64)
+        self.ordinals = {int(course_id): i for i, course_id in enumerate(self.course_ids)}
+        size = len(self.course_ids)
+
+        courses = [course_data[int(course_id)] for course_id in self.course_ids]
+        self.semesters = np.array([course.get("semester") or 0 for course in courses], dtype=np.int64)
+        self.departments = np.array(
+            [course.get("department_id") if course.get("department_id") is not None else -1 for course in courses],
+            dtype=np.int64
+        )
+        self.mandatory = np.array([course.get("is_mandatory") == True for course in courses], dtype=bool)
+        self.elective = np.array([course.get("is_mandatory") == False for course in courses], dtype=bool)
+
+        # مصفوفة المتطلبات: الصف = المادة، العمود = متطلبها السابق
+        rows, cols = [], []
+        self.unknown_prerequisite = np.zeros(size, dtype=bool)
+        for course_id, ordinal in self.ordinals.items():
+            for prereq in prerequisite_graph.prerequisites_of(course_id):
+                if prereq in self.ordinals:
+                    rows.append(ordinal)
+                    cols.append(self.ordinals[prereq])
+                else:
+                    self.unknown_prerequisite[ordinal] = True
+        self.prerequisite_matrix = csr_matrix(
+            (np.ones(len(rows)), (rows, cols)), shape=(size, size)
+        )
+
+    @property
+    def size(self):
+        return len(self.course_ids)
+
+    def mask(self, course_ids):
+        """مصفوفة منطقية للمواد المحددة"""
+        mask = np.zeros(self.size, dtype=bool)
+        mask[[self.ordinals[c] for c in course_ids if c in self.ordinals]] = True
+        return mask
+
+    def matrix(self, course_lists):
+        """مصفوفة منطقية (عدد القوائم × عدد المواد) لمجموعة من قوائم المواد"""
+        matrix = np.zeros((len(course_lists), self.size), dtype=bool)
+        rows, cols = [], []
+        for i, course_ids in enumerate(course_lists):
+            for course_id in course_ids:
+                if course_id in self.ordinals:
+                    rows.append(i)
+                    cols.append(self.ordinals[course_id])
+        matrix[rows, cols] = True
+        return matrix
+
+    def courses(self, mask):
+        """معرفات المواد المحددة في المصفوفة المنطقية"""
+        return [int(course_id) for course_id in self.course_ids[mask]]
+
+    def unlocked(self, completed):
+        """
+        المواد التي استوفيت جميع متطلباتها السابقة
+
+        Args:
+            completed (numpy.ndarray): مصفوفة المواد المكتملة لطالب أو لعدة طلاب (صف لكل طالب)
+        """
+        missing = np.asarray(self.prerequisite_matrix @ (~completed).T.astype(np.float64)).T
+        return (missing == 0) & ~self.unknown_prerequisite
+
+    def registerable(self, available, failed, semester, department_id):
+        """مواد الفصل الحالي في قسم الطالب والمواد الإجبارية التي رسب فيها"""
+        in_department = self.departments == department_id
+        current_semester = available & (self.semesters == semester) & in_department
+        failed_mandatory = failed & self.mandatory & in_department
+        return current_semester | failed_mandatory
+
+    def eligible(self, completed, failed, available, semester, department_id):
+        """
+        المواد الإجبارية والاختيارية المؤهل لها الطالب (أو كل طالب في الدفعة)
+
+        Returns:
+            tuple: (مصفوفة الإجباري, مصفوفة الاختياري)
+        """
+        eligible = self.registerable(available, failed, semester, department_id) & self.unlocked(completed)
+        return eligible & self.mandatory, eligible & self.elective
+
+
+class CatalogSnapshot:
+    """
+    نسخة ثابتة من بيانات المواد في ذاكرة العملية مع الفهارس المشتقة منها
+
+    Args:
+        version (int): رقم نسخة بيانات المواد
+        course_data (dict): بيانات كل مادة
+        prerequisites (dict): المتطلبات السابقة لكل مادة
+        available_courses (dict): المواد النشطة لكل (فصل، قسم)
+    """
+
+    def __init__(self, version, course_data, prerequisites, available_courses):
+        self.version = version
+        self.course_data = course_data
+        self.prerequisites = prerequisites
+        self.available_courses = available_courses
+        self.course_index = CourseIndex(course_data, version)
+        self.prerequisite_graph = PrerequisiteGraph(prerequisites)
+        self.eligibility_index = EligibilityIndex(course_data, self.prerequisite_graph)
+
+
+def _query_prerequisites():
+    """قراءة المتطلبات السابقة من جدول المواد"""
+    return [
+        [course_id, [pre_course_id] if pre_course_id else []]
+        for course_id, pre_course_id in db.session.query(Course.Id, Course.PreCourseId).all()
+    ]
+
+
+def _query_course_data():
+    """قراءة بيانات المواد مع الأقسام من قاعدة البيانات"""
+    courses = (db.session.query(Course)
+              .options(joinedload(Course.course_departments))
+              .all())
+
+    result = {}
+    for course in courses:
+        course_departments = course.course_departments
+
+        if course_departments:
+            for cd in course_departments:
+                result[course.Id] = {
+                    "id": course.Id,
+                    "name": course.Name,
+                    "code": course.Code,
+                    "description": course.Description,
+                    "semester": course.Semester,
+                    "department_id": cd.DepartmentId,
+                    "is_mandatory": bool(cd.IsMandatory)
+                }
+        else:
+            result[course.Id] = {
+                "id": course.Id,
+                "name": course.Name,
+                "code": course.Code,
+                "description": course.Description,
+                "semester": course.Semester,
+                "department_id": None,
+                "is_mandatory": False
+            }
+
+    return list(result.values())
+
+
+def _query_available_courses():
+    """قراءة المواد النشطة مع أقسامها"""
+    return [
+        [semester, department_id, course_id]
+        for course_id, semester, department_id in (
+            db.session.query(Course.Id, Course.Semester, CourseDepartment.DepartmentId)
+            .join(CourseDepartment, Course.Id == CourseDepartment.CourseId)
+            .filter(Course.Status == 'نشط')
+            .all()
+        )
+    ]
+
+
+def _query_catalog():
+    return {
+        "courses": _query_course_data(),
+        "prerequisites": _query_prerequisites(),
+        "available": _query_available_courses()
+    }
+
+
+def _read_shared_catalog(version):
+    try:
+        payload = redis_client.get(CATALOG_SNAPSHOT_KEY.format(version=version))
+        return json.loads(payload) if payload else None
+    except Exception as e:
+        logger.error(f"Error reading shared catalog v{version}: {str(e)}")
+        return None
+
+
+def _load_catalog(version):
+    """
+    تحميل صفوف بيانات المواد لنسخة معينة
+
+    عملية واحدة فقط تقرأ قاعدة البيانات لكل نسخة (قفل في Redis) وتشارك النتيجة،
+    والعمليات الأخرى تنتظر النسخة المشتركة بدلاً من الاستعلام في نفس اللحظة
+    """
+    payload = _read_shared_catalog(version)
+    if payload is not None:
+        return payload
+
+    try:
+        is_builder = redis_client.set(
+            CATALOG_REBUILD_LOCK_KEY.format(version=version), os.getpid(),
+            nx=True, ex=CATALOG_REBUILD_LOCK_SECONDS
+        )
+    except Exception as e:
+        logger.error(f"Error acquiring catalog rebuild lock: {str(e)}")
+        return _query_catalog()
+
+    if is_builder:
+        payload = _query_catalog()
+        try:
+            redis_client.setex(
+                CATALOG_SNAPSHOT_KEY.format(version=version),
+                CATALOG_SNAPSHOT_TTL_SECONDS,
+                json.dumps(payload, ensure_ascii=False)
+            )
+        except Exception as e:
+            logger.error(f"Error sharing catalog v{version}: {str(e)}")
+        return payload
+
+    deadline = time.monotonic() + CATALOG_REBUILD_LOCK_SECONDS
+    while time.monotonic() < deadline:
+        time.sleep(0.1 + random.random() * 0.1)
+        payload = _read_shared_catalog(version)
+        if payload is not None:
+            return payload
+
+    logger.warning(f"Timed out waiting for shared catalog v{version}, loading from database")
+    return _query_catalog()
+
+
+def _build_snapshot(version):
+    payload = _load_catalog(version)
+    course_data = {course["id"]: course for course in payload["courses"]}
+    prerequisites = {course_id: prereqs for course_id, prereqs in payload["prerequisites"]}
+    available_courses = {}
+    for semester, department_id, course_id in payload["available"]:
+        available_courses.setdefault((semester, department_id), []).append(course_id)
+    logger.info(f"Built catalog snapshot v{version} with {len(course_data)} courses")
+    return CatalogSnapshot(version, course_data, prerequisites, available_courses)
+
+
+_snapshot = None
+_snapshot_checked_at = 0.0
+_snapshot_lock = threading.Lock()
+_stale = threading.Event()
+_subscribed_pid = None
+
+
+def _on_catalog_invalidated(message):
+    _stale.set()
+
+
+def _ensure_subscribed():
+    global _subscribed_pid
+    if _subscribed_pid != os.getpid():
+        _subscribed_pid = os.getpid()
+        subscribe(CATALOG_CHANNEL, _on_catalog_invalidated)
+
+
+def _is_fresh():
+    return (
+        _snapshot is not None
+        and not _stale.is_set()
+        and time.monotonic() - _snapshot_checked_at < CATALOG_VERSION_CHECK_SECONDS
+    )
+
+
+def _read_catalog_version():
+    return int(redis_client.get(CATALOG_VERSION_KEY) or 0)
+
+
+def get_catalog_version():
+    """
+    الحصول على رقم نسخة بيانات المواد الحالية
+
+    Returns:
+        int: رقم النسخة (0 إذا لم يتم تعيينه)
+    """
+    snapshot = _snapshot
+    if snapshot is not None and _is_fresh():
+        return snapshot.version
+    try:
+        return _read_catalog_version()
+    except Exception as e:
+        logger.error(f"Error in get_catalog_version: {str(e)}")
+        return snapshot.version if snapshot else 0
+
+
+def get_catalog_snapshot():
+    """
+    الحصول على نسخة بيانات المواد الحالية
+
+    يُعاد بناء النسخة داخل العملية فقط عند تغير رقم النسخة في Redis
+
+    Returns:
+        CatalogSnapshot: نسخة بيانات المواد
+    """
+    global _snapshot, _snapshot_checked_at
+
+    _ensure_subscribed()
+    if _is_fresh():
+        return _snapshot
+
+    with _snapshot_lock:
+        if _is_fresh():
+            return _snapshot
+
+        _stale.clear()
+        try:
+            version = _read_catalog_version()
+        except Exception as e:
+            logger.error(f"Error reading catalog version: {str(e)}")
+            if _snapshot is not None:
+                return _snapshot
+            version = 0
+
+        if _snapshot is None or _snapshot.version != version:
+            _snapshot = _build_snapshot(version)
+        _snapshot_checked_at = time.monotonic()
+
+        return _snapshot
+
+
+def invalidate_catalog():
+    """
+    زيادة رقم نسخة بيانات المواد وإبلاغ جميع العمليات
+
+    Returns:
+        int: رقم النسخة الجديد
+    """
+    version = redis_client.incr(CATALOG_VERSION_KEY)
+    redis_client.publish(CATALOG_CHANNEL, version)
+    logger.info(f"Catalog invalidated, new version {version}")
+    return version
@@ -0,0 +1,244 @@
+from models import db, Enrollment
+from redis_config import redis_client, subscribe
+from scipy.sparse import csr_matrix, coo_matrix
+import numpy as np
+import threading
+import json
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+CO_ENROLLMENT_CHANNEL = 'co-enrollment:completed'
+
+# إعادة البناء الكامل من جدول التسجيلات بشكل دوري، وبين ذلك تُطبق التحديثات تدريجيًا
+CO_ENROLLMENT_REBUILD_SECONDS = 6 * 3600
+
+
+class CoEnrollmentModel:
+    """
+    مصفوفة تكرار النجاح المشترك بين المواد (مادة × مادة) من جدول التسجيلات
+
+    العنصر (i, j) هو عدد الطلاب الذين نجحوا في المادتين معًا، والقطر هو عدد
+    الناجحين في كل مادة
+
+    Args:
+        student_courses (dict): المواد التي نجح فيها كل طالب
+    """
+
+    def __init__(self, student_courses):
+        self.built_at = time.monotonic()
+        self.student_courses = {student_id: set(courses) for student_id, courses in student_courses.items()}
+        self.course_ids = sorted({course_id for courses in self.student_courses.values() for course_id in courses})
+        self.positions = {course_id: i for i, course_id in enumerate(self.course_ids)}
+
+        rows, cols = [], []
+        for row, courses in enumerate(self.student_courses.values()):
+            for course_id in courses:
+                rows.append(row)
+                cols.append(self.positions[course_id])
+        history = csr_matrix(
+            (np.ones(len(rows)), (rows, cols)),
+            shape=(len(self.student_courses), len(self.course_ids))
+        )
+        self.matrix = (history.T @ history).tocsr()
+
+    def update(self, student_id, completed_courses):
+        """
+        تطبيق تغير المواد التي نجح فيها طالب على المصفوفة
+
+        Returns:
+            bool: False إذا ظهرت مادة غير موجودة في المصفوفة (تلزم إعادة البناء)
+        """
+        new = set(completed_courses)
+        old = self.student_courses.get(student_id, set())
+        if new == old:
+            return True
+        if any(course_id not in self.positions for course_id in new):
+            return False
+
+        # الفرق بين حاصل الضرب الخارجي للمواد الجديدة والقديمة في الكتلة المتأثرة فقط
+        touched = sorted(new | old)
+        positions = np.array([self.positions[course_id] for course_id in touched])
+        after = np.array([course_id in new for course_id in touched], dtype=float)
+        before = np.array([course_id in old for course_id in touched], dtype=float)
+        delta = np.outer(after, after) - np.outer(before, before)
+
+        rows, cols = np.nonzero(delta)
+        size = len(self.course_ids)
+        change = coo_matrix((delta[rows, cols], (positions[rows], positions[cols])), shape=(size, size))
+        matrix = (self.matrix + change).tocsr()
+        matrix.eliminate_zeros()
+
+        self.matrix = matrix
+        self.student_courses[student_id] = new
+        return True
+
+    def score(self, studied_courses, candidate_courses):
+        """
+        درجة التوافق بين المواد المرشحة والمواد التي نجح فيها الطالب
+
+        متوسط تشابه جيب التمام بين كل مادة مرشحة والمواد المدروسة حسب تكرار
+        النجاح المشترك، بضرب مصفوفي واحد
+
+        Returns:
+            numpy.ndarray: درجة لكل مادة مرشحة بنفس الترتيب
+        """
+        if not studied_courses:
+            return np.zeros(len(candidate_courses))
+        return self.score_matrix([studied_courses], candidate_courses)[0]
+
+    def score_matrix(self, studied_lists, candidate_courses):
+        """
+        درجات التوافق لمجموعة من الطلاب بضرب مصفوفي واحد
+
+        Args:
+            studied_lists (list): قائمة المواد المدروسة لكل طالب
+            candidate_courses (list): المواد المرشحة (أعمدة النتيجة)
+
+        Returns:
+            numpy.ndarray: مصفوفة (طالب × مادة مرشحة)
+        """
+        scores = np.zeros((len(studied_lists), len(candidate_courses)))
+        matrix = self.matrix
+        known = [i for i, course_id in enumerate(candidate_courses) if course_id in self.positions]
+        if not studied_lists or not known:
+            return scores
+
+        norms = np.sqrt(matrix.diagonal())
+        rows, cols, weights = [], [], []
+        for row, studied_courses in enumerate(studied_lists):
+            for course_id in studied_courses:
+                position = self.positions.get(course_id)
+                if position is not None:
+                    rows.append(row)
+                    cols.append(position)
+                    weights.append(1.0 / max(norms[position], 1.0) / len(studied_courses))
+        if not rows:
+            return scores
+
+        profiles = csr_matrix((weights, (rows, cols)), shape=(len(studied_lists), len(self.course_ids)))
+        positions = [self.positions[candidate_courses[i]] for i in known]
+        related = (profiles @ matrix[:, positions]).toarray()
+        scores[:, known] = related / np.maximum(norms[positions], 1.0)
+        return scores
+
+
+def _query_student_courses():
+    student_courses = {}
+    rows = (db.session.query(Enrollment.StudentId, Enrollment.CourseId)
+            .filter(Enrollment.IsCompleted == 'ناجح')
+            .distinct()
+            .all())
+    for student_id, course_id in rows:
+        student_courses.setdefault(student_id, []).append(course_id)
+    return student_courses
+
+
+_model = None
+_model_lock = threading.Lock()
+_build_lock = threading.Lock()
+_building = False
+_pending = []
+_missed_at = 0.0
+_subscribed_pid = None
+
+
+def _apply(student_id, completed_courses):
+    global _model
+    if _model is not None and not _model.update(student_id, completed_courses):
+        _model = None
+
+
+def _on_completed(message):
+    global _missed_at
+    if message is None:
+        # انقطع الاشتراك وقد تكون تحديثات فاتت
+        _missed_at = time.monotonic()
+        return
+    try:
+        data = json.loads(message)
+        with _model_lock:
+            if _building:
+                _pending.append((data["student_id"], data["completed_courses"]))
+            else:
+                _apply(data["student_id"], data["completed_courses"])
+    except Exception as e:
+        logger.error(f"Error applying co-enrollment update: {str(e)}")
+
+
+def _ensure_subscribed():
+    global _subscribed_pid
+    if _subscribed_pid != os.getpid():
+        _subscribed_pid = os.getpid()
+        subscribe(CO_ENROLLMENT_CHANNEL, _on_completed)
+
+
+def _is_fresh(model):
+    return (
+        model is not None
+        and model.built_at > _missed_at
+        and time.monotonic() - model.built_at < CO_ENROLLMENT_REBUILD_SECONDS
+    )
+
+
+def get_co_enrollment_model():
+    """
+    الحصول على مصفوفة النجاح المشترك الحالية
+
+    تُبنى مرة لكل عملية وتُحدّث تدريجيًا مع رسائل رصد الدرجات
+
+    Returns:
+        CoEnrollmentModel: مصفوفة النجاح المشترك
+    """
+    global _model, _building, _missed_at
+
+    _ensure_subscribed()
+    model = _model
+    if _is_fresh(model):
+        return model
+
+    with _build_lock:
+        if _is_fresh(_model):
+            return _model
+
+        with _model_lock:
+            _building = True
+        try:
+            model = CoEnrollmentModel(_query_student_courses())
+        except Exception:
+            with _model_lock:
+                _building = False
+                _pending.clear()
+            raise
+
+        with _model_lock:
+            # التحديثات التي وصلت أثناء القراءة (تطبيقها مرة ثانية لا يغير النتيجة)
+            for student_id, completed_courses in _pending:
+                if not model.update(student_id, completed_courses):
+                    _missed_at = time.monotonic()
+                    break
+            _pending.clear()
+            _building = False
+            _model = model
+
+    logger.info(f"Built co-enrollment matrix for {len(model.course_ids)} courses")
+    return model
+
+
+def record_completed_courses(student_id, completed_courses):
+    """
+    إبلاغ جميع العمليات بالمواد التي نجح فيها الطالب بعد رصد درجاته
+
+    Args:
+        student_id (int): معرف الطالب
+        completed_courses (list): جميع المواد التي نجح فيها الطالب
+    """
+    try:
+        redis_client.publish(CO_ENROLLMENT_CHANNEL, json.dumps({
+            "student_id": student_id,
+            "completed_courses": list(completed_courses)
+        }))
+    except Exception as e:
+        logger.error(f"Error publishing completed courses for student {student_id}: {str(e)}")
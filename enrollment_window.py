@@ -0,0 +1,219 @@
+from redis_config import redis_client, subscribe
+from datetime import datetime
+import threading
+import json
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+ENROLLMENT_START_KEY = 'enrollment:start_time'
+ENROLLMENT_END_KEY = 'enrollment:end_time'
+ENROLLMENT_WINDOW_CHANNEL = 'enrollment:window'
+
+# فترات تسجيل خاصة بقسم أو مستوى أو فئة معدل (حقل لكل نطاق)
+ENROLLMENT_WINDOWS_KEY = 'enrollment:windows'
+
+# الحد الأدنى لكل فئة معدل من الأعلى للأقل
+ENROLLMENT_GPA_BANDS = (3.5, 3.0, 2.5, 2.0, 0.0)
+ENROLLMENT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# مدة الاحتفاظ بفترة التسجيل داخل العملية في حال فاتت رسالة التحديث
+ENROLLMENT_WINDOW_TTL_SECONDS = 5
+
+
+class EnrollmentWindow:
+    """
+    فترة التسجيل بعد تحويل أوقاتها
+
+    Args:
+        start_time (str): وقت البداية بالصيغة YYYY-MM-DD HH:MM:SS
+        end_time (str): وقت النهاية بنفس الصيغة
+    """
+
+    def __init__(self, start_time, end_time):
+        self.start_time = start_time
+        self.end_time = end_time
+        self.start_dt = datetime.strptime(start_time, ENROLLMENT_TIME_FORMAT)
+        self.end_dt = datetime.strptime(end_time, ENROLLMENT_TIME_FORMAT)
+
+    def is_open(self, now=None):
+        now = now or datetime.now()
+        return self.start_dt <= now <= self.end_dt
+
+    def to_dict(self):
+        return {
+            "start_time": self.start_time,
+            "end_time": self.end_time
+        }
+
+
+def gpa_band(gpa):
+    """فئة المعدل: أعلى حد أدنى لا يتجاوزه المعدل"""
+    gpa = gpa or 0.0
+    for bound in ENROLLMENT_GPA_BANDS:
+        if gpa >= bound:
+            return bound
+    return ENROLLMENT_GPA_BANDS[-1]
+
+
+def window_scope(department_id=None, student_level=None, band=None):
+    """
+    اسم نطاق فترة التسجيل (نطاق واحد فقط لكل فترة)
+
+    Returns:
+        str: النطاق أو None للفترة العامة
+    """
+    if department_id is not None:
+        return f"department:{int(department_id)}"
+    if student_level is not None:
+        return f"level:{int(student_level)}"
+    if band is not None:
+        return f"gpa:{gpa_band(float(band)):.1f}"
+    return None
+
+
+class EnrollmentWindows:
+    """
+    الفترة العامة والفترات الخاصة بالنطاقات
+
+    أولوية الاختيار للطالب: القسم ثم المستوى ثم فئة المعدل ثم الفترة العامة
+
+    Args:
+        global_window (EnrollmentWindow): الفترة العامة أو None
+        scoped (dict): الفترة لكل نطاق
+    """
+
+    def __init__(self, global_window, scoped):
+        self.global_window = global_window
+        self.scoped = scoped
+
+    def resolve(self, student=None):
+        """فترة التسجيل التي تنطبق على الطالب (نموذج Student)"""
+        if student is None or not self.scoped:
+            return self.global_window
+
+        gpa = getattr(student, f'GPA{student.Semester}', None)
+        scopes = (
+            window_scope(department_id=student.DepartmentId),
+            window_scope(student_level=student.StudentLevel) if student.StudentLevel is not None else None,
+            window_scope(band=gpa) if gpa is not None else None
+        )
+        for scope in scopes:
+            window = self.scoped.get(scope)
+            if window is not None:
+                return window
+        return self.global_window
+
+
+def _parse_windows(start_time, end_time, scoped):
+    global_window = EnrollmentWindow(start_time, end_time) if start_time and end_time else None
+    windows = {}
+    for scope, payload in scoped.items():
+        try:
+            period = json.loads(payload)
+            windows[scope] = EnrollmentWindow(period["start_time"], period["end_time"])
+        except Exception as e:
+            logger.error(f"Invalid enrollment window for {scope}: {str(e)}")
+    return EnrollmentWindows(global_window, windows)
+
+
+_windows = None
+_window_loaded_at = None
+_window_lock = threading.Lock()
+_stale = threading.Event()
+_subscribed_pid = None
+
+
+def _on_window_changed(message):
+    _stale.set()
+
+
+def _ensure_subscribed():
+    global _subscribed_pid
+    if _subscribed_pid != os.getpid():
+        _subscribed_pid = os.getpid()
+        subscribe(ENROLLMENT_WINDOW_CHANNEL, _on_window_changed)
+
+
+def _is_fresh():
+    return (
+        _window_loaded_at is not None
+        and not _stale.is_set()
+        and time.monotonic() - _window_loaded_at < ENROLLMENT_WINDOW_TTL_SECONDS
+    )
+
+
+def get_enrollment_windows():
+    """
+    جميع فترات التسجيل من الذاكرة داخل العملية، وتُقرأ من Redis بطلب واحد عند انتهاء صلاحيتها
+
+    Returns:
+        EnrollmentWindows: الفترة العامة والفترات الخاصة
+    """
+    global _windows, _window_loaded_at
+
+    _ensure_subscribed()
+    if _is_fresh():
+        return _windows
+
+    with _window_lock:
+        if _is_fresh():
+            return _windows
+
+        _stale.clear()
+        try:
+            pipe = redis_client.pipeline()
+            pipe.mget(ENROLLMENT_START_KEY, ENROLLMENT_END_KEY)
+            pipe.hgetall(ENROLLMENT_WINDOWS_KEY)
+            (start_time, end_time), scoped = pipe.execute()
+        except Exception as e:
+            if _window_loaded_at is None:
+                raise
+            logger.error(f"Error reading enrollment windows, using cached value: {str(e)}")
+            return _windows
+
+        _windows = _parse_windows(start_time, end_time, scoped)
+        _window_loaded_at = time.monotonic()
+        return _windows
+
+
+def get_enrollment_window(student=None):
+    """
+    فترة التسجيل التي تنطبق على الطالب
+
+    Args:
+        student (Student): الطالب (الفترة العامة إذا لم يُحدد)
+
+    Returns:
+        EnrollmentWindow: فترة التسجيل أو None إذا لم يتم تعيينها
+    """
+    return get_enrollment_windows().resolve(student)
+
+
+def set_enrollment_window(start_time, end_time, scope=None):
+    """حفظ فترة التسجيل (العامة أو الخاصة بنطاق) وإبلاغ جميع العمليات"""
+    pipe = redis_client.pipeline()
+    if scope is None:
+        pipe.mset({ENROLLMENT_START_KEY: start_time, ENROLLMENT_END_KEY: end_time})
+    else:
+        pipe.hset(ENROLLMENT_WINDOWS_KEY, scope, json.dumps({"start_time": start_time, "end_time": end_time}))
+    pipe.publish(ENROLLMENT_WINDOW_CHANNEL, scope or "global")
+    pipe.execute()
+    _stale.set()
+
+
+def delete_enrollment_window(scope):
+    """
+    حذف فترة تسجيل خاصة بنطاق
+
+    Returns:
+        bool: True إذا كانت الفترة موجودة
+    """
+    pipe = redis_client.pipeline()
+    pipe.hdel(ENROLLMENT_WINDOWS_KEY, scope)
+    pipe.publish(ENROLLMENT_WINDOW_CHANNEL, scope)
+    deleted, _ = pipe.execute()
+    _stale.set()
+    return bool(deleted)
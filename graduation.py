@@ -0,0 +1,240 @@
+from models import db, Student, Department, Course, CourseDepartment, Enrollment
+from redis_config import redis_client
+from catalog import get_catalog_version
+import threading
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+GRADUATION_REQUIRED_CREDITS = 136
+
+# مراجعة التخرج المخزنة لكل طالب (تُحذف عند تغيير تسجيلاته أو درجاته)
+GRADUATION_AUDIT_KEY = 'graduation:audit:{student_id}:v{version}'
+GRADUATION_AUDIT_TTL_SECONDS = 3600
+
+COURSE_TYPE_MANDATORY = "إجباري"
+COURSE_TYPE_ELECTIVE = "اختياري"
+
+
+class DepartmentRequirements:
+    """
+    مواد الخطة الدراسية للقسم (الإجبارية والاختيارية)
+
+    Args:
+        department_id (int): معرف القسم
+        courses (dict): بيانات كل مادة في الخطة مع نوعها
+    """
+
+    def __init__(self, department_id, courses):
+        self.department_id = department_id
+        self.courses = courses
+        self.mandatory = frozenset(course_id for course_id, course in courses.items() if course["type"] == COURSE_TYPE_MANDATORY)
+
+    def course_type(self, course_id):
+        """نوع المادة في الخطة (المواد خارج الخطة تُعتبر إجبارية)"""
+        course = self.courses.get(course_id)
+        return course["type"] if course else COURSE_TYPE_MANDATORY
+
+
+def _load_requirements(department_id):
+    rows = (db.session.query(Course.Id, Course.Code, Course.Name, Course.Credits, Course.Description, CourseDepartment.IsMandatory)
+           .join(CourseDepartment, Course.Id == CourseDepartment.CourseId)
+           .filter(CourseDepartment.DepartmentId == department_id)
+           .all())
+    return DepartmentRequirements(department_id, {
+        course_id: {
+            "id": course_id,
+            "code": code or "",
+            "name": name,
+            "credits": credits or 0,
+            "type": COURSE_TYPE_MANDATORY if is_mandatory else COURSE_TYPE_ELECTIVE,
+            "description": description or ""
+        }
+        for course_id, code, name, credits, description, is_mandatory in rows
+    })
+
+
+_requirements = {}
+_requirements_version = None
+_requirements_lock = threading.Lock()
+
+
+def get_department_requirements(department_id):
+    """
+    مواد خطة القسم من الذاكرة داخل العملية، وتُقرأ من قاعدة البيانات مرة واحدة لكل نسخة من بيانات المواد
+
+    Returns:
+        DepartmentRequirements: مواد الخطة
+    """
+    global _requirements, _requirements_version
+
+    version = get_catalog_version()
+    requirements = _requirements.get(department_id) if _requirements_version == version else None
+    if requirements is not None:
+        return requirements
+
+    with _requirements_lock:
+        if _requirements_version != version:
+            _requirements = {}
+            _requirements_version = version
+        if department_id not in _requirements:
+            _requirements[department_id] = _load_requirements(department_id)
+            logger.debug(f"Loaded requirements of department {department_id} (catalog v{version})")
+        return _requirements[department_id]
+
+
+class DegreeAudit:
+    """
+    نتيجة مراجعة متطلبات التخرج للطالب (تُحسب مرة واحدة وتُعرض منها جميع استجابات التخرج)
+
+    Args:
+        student (dict): بيانات الطالب (المعرف، الاسم، الفصل، القسم، الساعات المكتملة)
+        completed (list): المواد التي اجتازها الطالب مع درجاتها
+        remaining (list): مواد خطة القسم التي لم يجتزها الطالب
+        total_mandatory (int): عدد المواد الإجبارية في خطة القسم
+    """
+
+    def __init__(self, student, completed, remaining, total_mandatory):
+        self.student = student
+        self.completed = completed
+        self.remaining = remaining
+        self.total_mandatory = total_mandatory
+        self.required_credits = GRADUATION_REQUIRED_CREDITS
+        self.missing_mandatory = [
+            course for course in remaining if course["type"] == COURSE_TYPE_MANDATORY
+        ]
+
+    @property
+    def completed_credits(self):
+        return self.student["credits_completed"] or 0
+
+    @property
+    def completed_mandatory(self):
+        return self.total_mandatory - len(self.missing_mandatory)
+
+    @property
+    def remaining_credits(self):
+        return max(0, self.required_credits - self.completed_credits)
+
+    @property
+    def is_eligible(self):
+        return self.completed_credits >= self.required_credits and not self.missing_mandatory
+
+    @property
+    def gpa(self):
+        """المعدل التراكمي من درجات المواد المكتملة (من 100 إلى 4.0)"""
+        total_points = 0.0
+        total_credits = 0.0
+        for course in self.completed:
+            grade = float(course["grade"]) if course["grade"] is not None else 0.0
+            total_points += grade * course["credits"]
+            total_credits += course["credits"]
+        if total_credits > 0:
+            return round(total_points / total_credits / 25, 2)
+        return 0.0
+
+    def to_dict(self):
+        return {
+            "student": self.student,
+            "completed": self.completed,
+            "remaining": self.remaining,
+            "total_mandatory": self.total_mandatory
+        }
+
+    @classmethod
+    def from_dict(cls, payload):
+        return cls(payload["student"], payload["completed"], payload["remaining"], payload["total_mandatory"])
+
+
+def audit_student(student, department=None):
+    """
+    مراجعة متطلبات التخرج للطالب باستعلام واحد للمواد المكتملة
+
+    Args:
+        student (Student): الطالب
+        department (Department): قسم الطالب أو None إذا لم يكن موجودًا
+
+    Returns:
+        DegreeAudit: نتيجة المراجعة
+    """
+    requirements = get_department_requirements(student.DepartmentId)
+
+    rows = (db.session.query(Enrollment.CourseId, Enrollment.Grade, Enrollment.Semester, Course.Code, Course.Name, Course.Credits)
+           .join(Course, Enrollment.CourseId == Course.Id)
+           .filter(
+               Enrollment.StudentId == student.Id,
+               Enrollment.IsCompleted == "ناجح"
+           )
+           .all())
+
+    completed = [
+        {
+            "id": course_id,
+            "code": code or "",
+            "name": name,
+            "credits": credits or 0,
+            "type": requirements.course_type(course_id),
+            "grade": grade,
+            "semester": semester
+        }
+        for course_id, grade, semester, code, name, credits in rows
+    ]
+
+    # المتبقي = مواد الخطة - المواد المكتملة (فرق مجموعات بدون استعلامات لكل مادة)
+    completed_ids = {course["id"] for course in completed}
+    remaining = [
+        course for course_id, course in requirements.courses.items()
+        if course_id not in completed_ids
+    ]
+
+    return DegreeAudit(
+        {
+            "id": student.Id,
+            "name": student.Name,
+            "semester": student.Semester,
+            "department_id": student.DepartmentId,
+            "department_name": department.Name if department else None,
+            "credits_completed": student.CreditsCompleted
+        },
+        completed, remaining, len(requirements.mandatory)
+    )
+
+
+def _audit_key(student_id, catalog_version):
+    return GRADUATION_AUDIT_KEY.format(student_id=student_id, version=catalog_version)
+
+
+def get_graduation_audit(student_id):
+    """
+    مراجعة متطلبات التخرج للطالب من Redis، وتُحسب وتُخزن عند عدم وجودها
+
+    Returns:
+        DegreeAudit: نتيجة المراجعة أو None إذا لم يكن الطالب موجودًا
+    """
+    key = _audit_key(student_id, get_catalog_version())
+    try:
+        cached = redis_client.get(key)
+        if cached:
+            return DegreeAudit.from_dict(json.loads(cached))
+    except Exception as e:
+        logger.error(f"Error reading graduation audit for student {student_id}: {str(e)}")
+
+    student = Student.query.get(student_id)
+    if not student:
+        return None
+
+    audit = audit_student(student, Department.query.get(student.DepartmentId))
+    try:
+        redis_client.setex(key, GRADUATION_AUDIT_TTL_SECONDS, json.dumps(audit.to_dict(), ensure_ascii=False))
+    except Exception as e:
+        logger.error(f"Error caching graduation audit for student {student_id}: {str(e)}")
+    return audit
+
+
+def invalidate_graduation_audit(student_id):
+    """حذف مراجعة التخرج المخزنة بعد تغيير تسجيلات الطالب أو درجاته"""
+    try:
+        redis_client.delete(_audit_key(student_id, get_catalog_version()))
+    except Exception as e:
+        logger.error(f"Error invalidating graduation audit for student {student_id}: {str(e)}")
@@ -0,0 +1,124 @@
+from redis_config import redis_client
+from flask import request
+from functools import wraps
+import threading
+import hashlib
+import json
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+IDEMPOTENCY_KEY = 'idempotency:{path}:{key}'
+
+# مدة الاحتفاظ بنتيجة الطلب الأول، ومدة قفل الطلب أثناء تنفيذه
+# القفل يُجدد كل ثلث المدة طالما الطلب قيد التنفيذ (مهما طال انتظار المقاعد أو قاعدة البيانات)،
+# فلا ينتهي إلا إذا توقفت العملية، وعندها يمكن إعادة المحاولة بعد IDEMPOTENCY_LOCK_SECONDS على الأكثر
+IDEMPOTENCY_TTL_SECONDS = 24 * 3600
+IDEMPOTENCY_LOCK_SECONDS = 30
+
+_PROCESSING = 'processing'
+_DONE = 'done'
+
+# تجديد القفل فقط إذا كان ما زال قفل هذا الطلب
+_RENEW_SCRIPT = redis_client.register_script("""
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+""")
+
+
+def _fingerprint():
+    """بصمة الطلب حتى لا يُعاد استخدام نفس المفتاح لطلب مختلف"""
+    payload = request.get_data(cache=True) or b''
+    return hashlib.sha256(request.method.encode() + b' ' + request.full_path.encode() + b'\n' + payload).hexdigest()
+
+
+def _split_result(result):
+    if isinstance(result, tuple):
+        return result[0], result[1] if len(result) > 1 else 200
+    return result, 200
+
+
+def idempotent(method):
+    """
+    تنفيذ الطلب مرة واحدة لكل قيمة من ترويسة Idempotency-Key
+
+    الطلب المكرر يعيد الاستجابة الأولى المخزنة في Redis دون الوصول لقاعدة البيانات،
+    ويعيد 409 إذا كان الطلب الأول ما زال قيد التنفيذ، و422 إذا اختلف محتوى الطلب.
+    قفل الطلب الأول يُجدد حتى ينتهي تنفيذه، واستجابات أخطاء الخادم (5xx) لا تُخزن
+    حتى يمكن إعادة المحاولة
+    """
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return method(*args, **kwargs)
+
+        redis_key = IDEMPOTENCY_KEY.format(path=request.path, key=key)
+        fingerprint = _fingerprint()
+        lock = json.dumps({"state": _PROCESSING, "fingerprint": fingerprint, "token": uuid.uuid4().hex})
+        try:
+            acquired = redis_client.set(redis_key, lock, nx=True, ex=IDEMPOTENCY_LOCK_SECONDS)
+            stored = None if acquired else redis_client.get(redis_key)
+        except Exception as e:
+            logger.error(f"Idempotency store unavailable, processing request without it: {str(e)}")
+            return method(*args, **kwargs)
+
+        if not acquired:
+            if stored is None:
+                # انتهت صلاحية القفل بين المحاولتين
+                return {"error": "الطلب الأصلي قيد التنفيذ، أعد المحاولة"}, 409, {"Retry-After": "1"}
+            stored = json.loads(stored)
+            if stored["fingerprint"] != fingerprint:
+                return {"error": f"تم استخدام {IDEMPOTENCY_HEADER} مع طلب مختلف"}, 422
+            if stored["state"] == _PROCESSING:
+                return {"error": "الطلب الأصلي قيد التنفيذ، أعد المحاولة"}, 409, {"Retry-After": "1"}
+            return stored["body"], stored["status"], {"Idempotent-Replayed": "true"}
+
+        stop = threading.Event()
+        threading.Thread(target=_renew_lock, args=(redis_key, lock, stop), daemon=True).start()
+        try:
+            result = method(*args, **kwargs)
+        except Exception:
+            _forget(redis_key)
+            raise
+        finally:
+            stop.set()
+
+        body, status = _split_result(result)
+        if status >= 500:
+            _forget(redis_key)
+            return result
+
+        try:
+            redis_client.setex(redis_key, IDEMPOTENCY_TTL_SECONDS, json.dumps({
+                "state": _DONE,
+                "fingerprint": fingerprint,
+                "body": body,
+                "status": status
+            }, ensure_ascii=False))
+        except Exception as e:
+            logger.error(f"Error storing idempotent response for {redis_key}: {str(e)}")
+        return result
+
+    return wrapper
+
+
+def _renew_lock(redis_key, lock, stop):
+    """تجديد قفل الطلب حتى ينتهي تنفيذه"""
+    while not stop.wait(IDEMPOTENCY_LOCK_SECONDS / 3):
+        try:
+            if not _RENEW_SCRIPT(keys=[redis_key], args=[lock, IDEMPOTENCY_LOCK_SECONDS]):
+                return
+        except Exception as e:
+            logger.error(f"Error renewing idempotency lock {redis_key}: {str(e)}")
+
+
+def _forget(redis_key):
+    try:
+        redis_client.delete(redis_key)
+    except Exception as e:
+        logger.error(f"Error releasing idempotency key {redis_key}: {str(e)}")
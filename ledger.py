@@ -0,0 +1,211 @@
+from redis_config import redis_client
+import uuid
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# سجل ساعات الطالب في كل فصل: الساعات المسجلة حاليًا والحد الأقصى المسموح به
+CREDIT_LEDGER_KEY = 'credits:{student_id}:{semester}'
+CREDIT_LEDGER_TTL_SECONDS = 7 * 24 * 3600
+
+# ساعات طلبات التسجيل التي لم تُحفظ أو تُلغَ بعد: حقل لكل طلب في السجل ("الساعات:وقت الانتهاء")
+# الحجز المنتهي (توقف العامل قبل الحفظ أو الإلغاء) تُعاد ساعاته عند الحاجة إليها
+CREDIT_HOLD_FIELD = 'hold:{token}'
+CREDIT_HOLD_SECONDS = 120
+
+# إضافة الساعات فقط إذا لم تتجاوز الحد الأقصى، مع تسجيلها كحجز جارٍ
+# عند تجاوز الحد تُعاد أولاً ساعات الحجوزات المنتهية
+# {-1}: السجل غير محمل، {0, الحالي, الحد}: تجاوز الحد، {1, الحالي, الحد}: تمت الإضافة
+_CHARGE_SCRIPT = redis_client.register_script("""
+local current = redis.call('HGET', KEYS[1], 'current')
+local cap = redis.call('HGET', KEYS[1], 'cap')
+if not current or not cap then
+    return {-1}
+end
+current = tonumber(current)
+cap = tonumber(cap)
+local credits = tonumber(ARGV[1])
+if current + credits > cap then
+    local fields = redis.call('HGETALL', KEYS[1])
+    local expired = 0
+    for i = 1, #fields, 2 do
+        if string.sub(fields[i], 1, 5) == 'hold:' then
+            local held, expires = string.match(fields[i + 1], '^(%d+):(%d+)$')
+            if tonumber(expires) <= tonumber(ARGV[4]) then
+                expired = expired + tonumber(held)
+                redis.call('HDEL', KEYS[1], fields[i])
+            end
+        end
+    end
+    if expired > 0 then
+        current = math.max(current - expired, 0)
+        redis.call('HSET', KEYS[1], 'current', current)
+    end
+    if current + credits > cap then
+        return {0, current, cap}
+    end
+end
+current = redis.call('HINCRBY', KEYS[1], 'current', credits)
+redis.call('HSET', KEYS[1], 'hold:' .. ARGV[3], credits .. ':' .. ARGV[5])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return {1, current, cap}
+""")
+
+# إنهاء الحجز بعد الحفظ (ARGV[3] = 0) أو الإلغاء (ARGV[3] = 1)
+# إذا كان الحجز قد انتهى وأُعيدت ساعاته، تُضاف الساعات المحفوظة مرة أخرى ولا يُنقص شيء عند الإلغاء
+_FINISH_SCRIPT = redis_client.register_script("""
+local held = redis.call('HDEL', KEYS[1], ARGV[1]) == 1
+if not redis.call('HGET', KEYS[1], 'current') then
+    return 0
+end
+if ARGV[3] == '1' then
+    if held then
+        local current = tonumber(redis.call('HGET', KEYS[1], 'current'))
+        redis.call('HSET', KEYS[1], 'current', math.max(current - tonumber(ARGV[2]), 0))
+    end
+elseif not held then
+    redis.call('HINCRBY', KEYS[1], 'current', ARGV[2])
+end
+return 1
+""")
+
+_RELEASE_SCRIPT = redis_client.register_script("""
+local current = tonumber(redis.call('HGET', KEYS[1], 'current'))
+if not current then
+    return 0
+end
+redis.call('HSET', KEYS[1], 'current', math.max(current - tonumber(ARGV[1]), 0))
+return 1
+""")
+
+# القيم من قاعدة البيانات تُكتب فقط إذا لم يحمّلها طلب آخر قبلها
+# الساعات المسجلة تشمل الحجوزات الجارية (غير المحفوظة في قاعدة البيانات بعد) حتى لا تضيع
+_LOAD_SCRIPT = redis_client.register_script("""
+if redis.call('HEXISTS', KEYS[1], 'current') == 0 then
+    local current = tonumber(ARGV[1])
+    local fields = redis.call('HGETALL', KEYS[1])
+    for i = 1, #fields, 2 do
+        if string.sub(fields[i], 1, 5) == 'hold:' then
+            current = current + tonumber(string.match(fields[i + 1], '^(%d+):'))
+        end
+    end
+    redis.call('HSET', KEYS[1], 'current', current)
+end
+redis.call('HSETNX', KEYS[1], 'cap', ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+return 1
+""")
+
+
+def _ledger_key(student_id, semester):
+    return CREDIT_LEDGER_KEY.format(student_id=student_id, semester=semester)
+
+
+class CreditCharge:
+    """
+    ساعات أضيفت إلى سجل الطالب لطلب تسجيل لم يُحفظ بعد
+
+    Args:
+        student_id (int): معرف الطالب
+        semester (str): اسم الفصل الدراسي
+        credits (int): عدد الساعات
+        token (str): معرف الحجز الجاري في السجل (None إذا لم تُضف الساعات إلى Redis)
+    """
+
+    def __init__(self, student_id, semester, credits, token=None):
+        self.student_id = student_id
+        self.semester = semester
+        self.credits = credits
+        self.token = token
+
+
+def charge_credits(student_id, semester, credits, load):
+    """
+    إضافة ساعات إلى سجل الطالب ذريًا إذا لم تتجاوز الحد الأقصى
+
+    عند عدم وجود السجل يُحمّل من قاعدة البيانات مرة واحدة، والرفض يعتمد على السجل
+    (الساعات المسجلة + الحجوزات الجارية)، وعند تعذر الوصول إلى Redis يتم التحقق من
+    قاعدة البيانات مباشرة
+
+    Args:
+        student_id (int): معرف الطالب
+        semester (str): اسم الفصل الدراسي
+        credits (int): الساعات المطلوب إضافتها
+        load (callable): تعيد (الساعات المسجلة, الحد الأقصى) من قاعدة البيانات
+
+    Returns:
+        tuple: (CreditCharge أو None إذا تجاوز الحد, الساعات المسجلة قبل الإضافة, الحد الأقصى)
+    """
+    key = _ledger_key(student_id, semester)
+    token = uuid.uuid4().hex
+    try:
+        for _ in range(2):
+            now = int(time.time())
+            result = _CHARGE_SCRIPT(
+                keys=[key],
+                args=[credits, CREDIT_LEDGER_TTL_SECONDS, token, now, now + CREDIT_HOLD_SECONDS]
+            )
+            if int(result[0]) != -1:
+                break
+            current, cap = load()
+            _LOAD_SCRIPT(keys=[key], args=[current, cap, CREDIT_LEDGER_TTL_SECONDS])
+    except Exception as e:
+        logger.error(f"Credit ledger unavailable for student {student_id}, checking database: {str(e)}")
+        current, cap = load()
+        if current + credits > cap:
+            return None, current, cap
+        return CreditCharge(student_id, semester, 0), current, cap
+
+    status, current, cap = (int(value) for value in result)
+    if status != 1:
+        return None, current, cap
+    return CreditCharge(student_id, semester, credits, token), current - credits, cap
+
+
+def _finish_charge(charge, cancel):
+    if charge is None or charge.token is None:
+        return
+    try:
+        _FINISH_SCRIPT(
+            keys=[_ledger_key(charge.student_id, charge.semester)],
+            args=[CREDIT_HOLD_FIELD.format(token=charge.token), charge.credits, 1 if cancel else 0]
+        )
+    except Exception as e:
+        # يُعاد تحميل السجل من قاعدة البيانات
+        logger.error(f"Error finishing credit charge for student {charge.student_id}: {str(e)}")
+        invalidate_credit_ledger(charge.student_id, charge.semester)
+
+
+def commit_charge(charge):
+    """إنهاء حجز ساعات طلب تسجيل بعد حفظه (تبقى الساعات في السجل)"""
+    _finish_charge(charge, cancel=False)
+
+
+def cancel_charge(charge):
+    """إلغاء ساعات طلب تسجيل لم يُحفظ"""
+    _finish_charge(charge, cancel=True)
+
+
+def release_credits(student_id, semester, credits):
+    """إنقاص الساعات المسجلة في سجل الطالب (بعد حذف مواد)"""
+    if not credits:
+        return
+    try:
+        _RELEASE_SCRIPT(keys=[_ledger_key(student_id, semester)], args=[credits])
+    except Exception as e:
+        # يُعاد تحميل السجل من قاعدة البيانات
+        logger.error(f"Error releasing {credits} credits for student {student_id}: {str(e)}")
+        invalidate_credit_ledger(student_id, semester)
+
+
+def invalidate_credit_ledger(student_id, semester):
+    """
+    إعادة تحميل الساعات المسجلة والحد الأقصى من قاعدة البيانات (مثلاً بعد تغير المعدل)
+
+    الحجوزات الجارية تبقى في السجل وتُضاف إلى الساعات عند التحميل
+    """
+    try:
+        redis_client.hdel(_ledger_key(student_id, semester), 'current', 'cap')
+    except Exception as e:
+        logger.error(f"Error invalidating credit ledger for student {student_id}: {str(e)}")
@@ -0,0 +1,144 @@
+from models import db, Course, Class, Professor, Enrollment
+from catalog import get_catalog_version
+from seats import get_taken_seats
+from sqlalchemy import func
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# مدة صلاحية بيانات الطرح الثابتة (الساعات، المحاضرة، الأستاذ، المكان) داخل العملية
+# ويُعاد تحميلها أيضًا عند تغير نسخة بيانات المواد
+OFFERINGS_TTL_SECONDS = 300
+
+_offerings = {}
+_offerings_version = None
+_offerings_loaded_at = 0.0
+_offerings_lock = threading.Lock()
+
+
+def _load_offerings():
+    """
+    تحميل بيانات طرح جميع المواد باستعلامين
+
+    Returns:
+        dict: قاموس يحتوي على بيانات الطرح لكل مادة
+    """
+    offerings = {}
+    courses = db.session.query(Course.Id, Course.MaxSeats, Course.Credits).all()
+    for course_id, max_seats, credits in courses:
+        offerings[course_id] = {
+            "max_seats": max_seats,
+            "credits": credits,
+            "class": None
+        }
+
+    # أول محاضرة لكل مادة مع اسم الأستاذ في استعلام واحد
+    first_classes = (db.session.query(Class.CourseId, func.min(Class.Id).label('class_id'))
+                    .group_by(Class.CourseId)
+                    .subquery())
+    classes = (db.session.query(Class, Professor.FullName)
+              .join(first_classes, Class.Id == first_classes.c.class_id)
+              .outerjoin(Professor, Professor.Id == Class.ProfessorId)
+              .all())
+
+    for class_info, professor_name in classes:
+        if class_info.CourseId not in offerings:
+            continue
+        offerings[class_info.CourseId]["class"] = {
+            "day": class_info.Day,
+            "start_time": str(class_info.StartTime),
+            "end_time": str(class_info.EndTime),
+            "location": class_info.Location or "غير محدد",
+            "professor": professor_name or "غير محدد"
+        }
+
+    return offerings
+
+
+def _offerings_expired(version):
+    return (
+        _offerings_version != version
+        or time.monotonic() - _offerings_loaded_at >= OFFERINGS_TTL_SECONDS
+    )
+
+
+def _get_offerings():
+    """بيانات الطرح الثابتة مع التخزين المؤقت داخل العملية"""
+    global _offerings, _offerings_version, _offerings_loaded_at
+
+    version = get_catalog_version()
+    if not _offerings_expired(version):
+        return _offerings
+
+    with _offerings_lock:
+        if _offerings_expired(version):
+            _offerings = _load_offerings()
+            _offerings_version = version
+            _offerings_loaded_at = time.monotonic()
+            logger.debug(f"Loaded offerings for {len(_offerings)} courses (catalog v{version})")
+
+    return _offerings
+
+
+def get_enrolled_counts(course_ids):
+    """
+    عدد الطلاب المسجلين حاليًا في كل مادة
+
+    يتم القراءة من مخزون المقاعد في Redis، ومن قاعدة البيانات باستعلام تجميعي واحد
+    إذا تعذر الوصول إليه
+
+    Args:
+        course_ids (list): معرفات المواد
+
+    Returns:
+        dict: عدد المسجلين لكل مادة
+    """
+    course_ids = list(dict.fromkeys(course_ids))
+    if not course_ids:
+        return {}
+
+    try:
+        return get_taken_seats(course_ids)
+    except Exception as e:
+        logger.error(f"Error reading seat inventory: {str(e)}")
+
+    rows = (db.session.query(Enrollment.CourseId, func.count(Enrollment.Id))
+           .filter(
+               Enrollment.CourseId.in_(course_ids),
+               Enrollment.IsCompleted == "قيد الدراسة",
+               Enrollment.DeletedEnrollmentDate == None
+           )
+           .group_by(Enrollment.CourseId)
+           .all())
+    counts = {course_id: 0 for course_id in course_ids}
+    counts.update({course_id: count for course_id, count in rows})
+    return counts
+
+
+def get_course_offerings(course_ids):
+    """
+    الحصول على بيانات طرح المواد (المقاعد، موعد المحاضرة، الأستاذ، المكان، الساعات)
+
+    Args:
+        course_ids (list): معرفات المواد
+
+    Returns:
+        dict: بيانات الطرح لكل مادة موجودة
+    """
+    try:
+        offerings = _get_offerings()
+        existing = [course_id for course_id in course_ids if course_id in offerings]
+        enrolled_counts = get_enrolled_counts(existing)
+
+        result = {}
+        for course_id in existing:
+            offering = dict(offerings[course_id])
+            offering["available_seats"] = offering["max_seats"] - enrolled_counts.get(course_id, 0)
+            result[course_id] = offering
+
+        return result
+    except Exception as e:
+        logger.error(f"Error in get_course_offerings: {str(e)}")
+        raise
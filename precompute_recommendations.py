@@ -0,0 +1,85 @@
+"""
+حساب توصيات المواد مسبقًا لجميع الطلاب بحالة معينة وتخزينها في Redis
+
+يُشغل ليلاً (cron أو جدولة المنصة) بقيمة حالة الطلاب المسجلين كما هي في جدول Students:
+    python precompute_recommendations.py --status <الحالة>
+"""
+from app import create_app
+from models import db, Student
+from services import (
+    get_students_data, get_course_data, recommend_courses_batch, get_current_semester
+)
+from offerings import get_course_offerings
+from recommendation_cache import store_materialized_recommendations
+from resources import RecommendCourses
+import argparse
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def precompute_recommendations(status):
+    """
+    حساب توصيات جميع الطلاب بالحالة المحددة قسمًا بقسم
+
+    Args:
+        status (str): حالة الطلاب المطلوب حساب توصياتهم
+
+    Returns:
+        int: عدد الطلاب الذين تم تخزين توصياتهم
+    """
+    _, current_semester_name = get_current_semester()
+    course_data = get_course_data()
+
+    department_ids = [
+        department_id for (department_id,) in
+        db.session.query(Student.DepartmentId).filter(Student.status == status).distinct().all()
+    ]
+
+    selected = 0
+    total = 0
+    for department_id in department_ids:
+        # وقت قراءة البيانات: أي تغيير بعده يجعل التوصيات تُحسب من جديد عند الطلب
+        computed_at = time.time()
+        students_data = get_students_data(department_id=department_id, status=status)
+        students_by_id = {student_data["id"]: student_data for student_data in students_data}
+        selected += len(students_data)
+
+        results = []
+        for student_id, result, error in recommend_courses_batch(students_data, course_data):
+            if error:
+                logger.warning(f"Skipping recommendations for student {student_id}: {error}")
+                continue
+            results.append((student_id, result))
+
+        offerings = get_course_offerings(sorted({
+            course_id for _, result in results
+            for course_id in result["mandatory"] + result["elective"]
+        }))
+
+        store_materialized_recommendations({
+            student_id: RecommendCourses.build_recommendations(
+                students_by_id[student_id], result, course_data, current_semester_name, offerings
+            )
+            for student_id, result in results
+        }, computed_at, current_semester_name)
+
+        total += len(results)
+        logger.info(f"Precomputed recommendations for {len(results)} students in department {department_id}")
+
+    logger.info(f"Selected {selected} students with status '{status}' in {len(department_ids)} departments")
+    if not selected:
+        logger.warning(f"No students found with status '{status}', nothing was precomputed")
+    return total
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="حساب توصيات المواد مسبقًا للطلاب بحالة معينة")
+    parser.add_argument("--status", required=True, help="حالة الطلاب المطلوب حساب توصياتهم (قيمة status في جدول Students)")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        count = precompute_recommendations(args.status)
+        logger.info(f"Precomputed recommendations for {count} students")
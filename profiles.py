@@ -0,0 +1,100 @@
+from redis_config import redis_client
+from collections import Counter
+import numpy as np
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+PROFILE_KEY = 'profile:{student_id}'
+PROFILE_TTL_SECONDS = 30 * 24 * 3600
+
+
+class InterestProfile:
+    """
+    ملف اهتمامات الطالب: مجموع متجهات TF-IDF للمواد المكتملة مع قائمة هذه المواد
+
+    Args:
+        catalog_version (int): نسخة بيانات المواد التي بُني عليها المتجه
+        courses (list): المواد المكتملة المحسوبة في المتجه
+        vector (numpy.ndarray): مجموع متجهات المواد
+    """
+
+    def __init__(self, catalog_version, courses, vector):
+        self.catalog_version = catalog_version
+        self.courses = courses
+        self.vector = vector
+
+    @property
+    def centroid(self):
+        """متوسط متجهات المواد المكتملة"""
+        if not self.courses:
+            return self.vector
+        return self.vector / len(self.courses)
+
+    def to_json(self):
+        nonzero = np.flatnonzero(self.vector)
+        return json.dumps({
+            "catalog_version": self.catalog_version,
+            "courses": self.courses,
+            "size": len(self.vector),
+            "indices": nonzero.tolist(),
+            "values": self.vector[nonzero].tolist()
+        })
+
+    @classmethod
+    def from_json(cls, payload):
+        data = json.loads(payload)
+        vector = np.zeros(data["size"])
+        vector[data["indices"]] = data["values"]
+        return cls(data["catalog_version"], data["courses"], vector)
+
+
+def _load_profile(student_id):
+    try:
+        payload = redis_client.get(PROFILE_KEY.format(student_id=student_id))
+        return InterestProfile.from_json(payload) if payload else None
+    except Exception as e:
+        logger.error(f"Error loading interest profile for student {student_id}: {str(e)}")
+        return None
+
+
+def _save_profile(student_id, profile):
+    try:
+        redis_client.setex(PROFILE_KEY.format(student_id=student_id), PROFILE_TTL_SECONDS, profile.to_json())
+    except Exception as e:
+        logger.error(f"Error saving interest profile for student {student_id}: {str(e)}")
+
+
+def get_interest_profile(student_id, completed_courses, course_index):
+    """
+    الحصول على ملف اهتمامات الطالب محدثًا
+
+    تُضاف متجهات المواد التي أصبحت "ناجح" منذ آخر تحديث فقط، ويُعاد بناء الملف
+    بالكامل إذا تغيرت نسخة بيانات المواد أو حُذفت مادة من المواد المكتملة
+
+    Args:
+        student_id (int): معرف الطالب
+        completed_courses (list): المواد المكتملة حاليًا
+        course_index (CourseIndex): فهرس أوصاف المواد
+
+    Returns:
+        InterestProfile: ملف اهتمامات الطالب
+    """
+    completed_courses = list(completed_courses)
+    profile = _load_profile(student_id)
+
+    if profile is not None and profile.catalog_version == course_index.version:
+        added = list((Counter(completed_courses) - Counter(profile.courses)).elements())
+        removed = Counter(profile.courses) - Counter(completed_courses)
+        if not added and not removed:
+            return profile
+        if not removed:
+            profile.vector = profile.vector + course_index.vector_sum(added)
+            profile.courses = profile.courses + added
+            _save_profile(student_id, profile)
+            return profile
+
+    profile = InterestProfile(course_index.version, completed_courses, course_index.vector_sum(completed_courses))
+    _save_profile(student_id, profile)
+    return profile
@@ -0,0 +1,145 @@
+from flask import request, has_request_context
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from enrollment_window import get_enrollment_windows
+from datetime import datetime
+import threading
+import math
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+RATE_LIMIT_STORAGE_URI = 'redis://localhost:6379/0'
+
+# حدود كل طالب لكل مسار (أشد أثناء فترة التسجيل)
+STUDENT_LIMIT = "120 per minute"
+STUDENT_PEAK_LIMIT = "30 per minute"
+ENROLLMENT_WRITE_LIMIT = "30 per minute"
+ENROLLMENT_WRITE_PEAK_LIMIT = "10 per minute"
+
+# حد إجمالي لكل مسار قراءة ثقيل أثناء فترة التسجيل (لجميع الطلاب معًا)
+LOW_PRIORITY_PEAK_LIMIT = "300 per minute"
+
+# تخفيف الحمل: رفض القراءات الأقل أولوية عند ارتفاع زمن استعلامات قاعدة البيانات
+SHEDDABLE_ENDPOINTS = {'academicperformanceevaluation', 'graduationrequirements'}
+DB_LATENCY_SHED_SECONDS = 0.5
+DB_LATENCY_EWMA_ALPHA = 0.2
+DB_LATENCY_DECAY_SECONDS = 10
+SHED_RETRY_AFTER_SECONDS = 5
+
+
+def rate_limit_key():
+    """مفتاح الحد: الطالب إذا كان في المسار، وإلا عنوان العميل"""
+    student_id = (request.view_args or {}).get('student_id')
+    if student_id is not None:
+        return f"student:{student_id}"
+    return get_remote_address()
+
+
+def registration_peak():
+    """هل توجد فترة تسجيل مفتوحة الآن (العامة أو أي فترة خاصة)"""
+    try:
+        windows = get_enrollment_windows()
+    except Exception as e:
+        logger.error(f"Error reading enrollment windows for rate limiting: {str(e)}")
+        return False
+
+    now = datetime.now()
+    candidates = list(windows.scoped.values())
+    if windows.global_window is not None:
+        candidates.append(windows.global_window)
+    return any(window.is_open(now) for window in candidates)
+
+
+def student_limit():
+    return STUDENT_PEAK_LIMIT if registration_peak() else STUDENT_LIMIT
+
+
+def enrollment_write_limit():
+    return ENROLLMENT_WRITE_PEAK_LIMIT if registration_peak() else ENROLLMENT_WRITE_LIMIT
+
+
+limiter = Limiter(
+    key_func=rate_limit_key,
+    default_limits=[student_limit],
+    storage_uri=RATE_LIMIT_STORAGE_URI,
+    headers_enabled=True
+)
+
+# حدود المسارات (تُستخدم في decorators الخاصة بكل Resource)
+enrollment_write_limits = [
+    limiter.limit(enrollment_write_limit)
+]
+low_priority_limits = [
+    limiter.limit(student_limit),
+    limiter.limit(LOW_PRIORITY_PEAK_LIMIT, key_func=lambda: "all", exempt_when=lambda: not registration_peak())
+]
+
+
+class _LatencyTracker:
+    """متوسط متحرك أسي لزمن استعلامات قاعدة البيانات داخل العملية يتناقص مع الوقت بدون استعلامات"""
+
+    def __init__(self):
+        self._value = 0.0
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _decayed(self, now):
+        return self._value * math.exp(-(now - self._updated_at) / DB_LATENCY_DECAY_SECONDS)
+
+    def observe(self, seconds):
+        now = time.monotonic()
+        with self._lock:
+            self._value = DB_LATENCY_EWMA_ALPHA * seconds + (1 - DB_LATENCY_EWMA_ALPHA) * self._decayed(now)
+            self._updated_at = now
+
+    @property
+    def value(self):
+        return self._decayed(time.monotonic())
+
+
+db_latency = _LatencyTracker()
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started_at')
+    if started:
+        elapsed = time.perf_counter() - started.pop()
+        # استعلامات العمال والمهام الخلفية لا تؤثر على تخفيف حمل الطلبات
+        if has_request_context():
+            db_latency.observe(elapsed)
+
+
+@event.listens_for(Engine, "handle_error")
+def _handle_error(exception_context):
+    # الاستعلام الفاشل لا يصل إلى after_cursor_execute، فيُحذف وقت بدايته حتى لا يُنسب لاستعلام آخر
+    conn = exception_context.connection
+    started = conn.info.get('query_started_at') if conn is not None else None
+    if started:
+        started.pop()
+
+
+def _shed_low_priority():
+    if request.endpoint in SHEDDABLE_ENDPOINTS and db_latency.value > DB_LATENCY_SHED_SECONDS:
+        logger.warning(f"Shedding {request.endpoint}: database latency {db_latency.value:.3f}s")
+        return (
+            {"error": "الخدمة مشغولة حاليًا، يرجى المحاولة لاحقًا"},
+            503,
+            {"Retry-After": str(SHED_RETRY_AFTER_SECONDS)}
+        )
+    return None
+
+
+def init_rate_limiting(app):
+    """تفعيل حدود الطلبات وتخفيف الحمل على التطبيق"""
+    limiter.init_app(app)
+    app.before_request(_shed_low_priority)
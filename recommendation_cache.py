@@ -0,0 +1,147 @@
+from redis_config import redis_client
+from catalog import get_catalog_version
+from services import RANKING_MODES
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# مدة صلاحية توصيات الطالب المخزنة
+RECOMMENDATION_CACHE_TTL_SECONDS = 600
+
+CACHE_HITS_KEY = 'recommendations:cache:hits'
+CACHE_MISSES_KEY = 'recommendations:cache:misses'
+
+# التوصيات المحسوبة مسبقًا لكل طالب، ووقت آخر تغيير في بيانات كل طالب
+MATERIALIZED_KEY = 'recommendations:materialized'
+CHANGED_STUDENTS_KEY = 'recommendations:changed'
+
+
+def _cache_key(student_id, catalog_version, ranking='content'):
+    if ranking == 'content':
+        return f"recommendations:{student_id}:v{catalog_version}"
+    return f"recommendations:{student_id}:v{catalog_version}:{ranking}"
+
+
+def get_cached_recommendations(student_id, ranking='content'):
+    """
+    الحصول على توصيات الطالب المخزنة لنسخة بيانات المواد الحالية
+
+    Args:
+        student_id (int): معرف الطالب
+        ranking (str): طريقة ترتيب المواد الاختيارية
+
+    Returns:
+        dict: التوصيات المخزنة أو None
+    """
+    try:
+        cached = redis_client.get(_cache_key(student_id, get_catalog_version(), ranking))
+        redis_client.incr(CACHE_HITS_KEY if cached else CACHE_MISSES_KEY)
+        return json.loads(cached) if cached else None
+    except Exception as e:
+        logger.error(f"Error reading cached recommendations for student {student_id}: {str(e)}")
+        return None
+
+
+def cache_recommendations(student_id, recommendations, ranking='content'):
+    """تخزين توصيات الطالب لمدة محدودة"""
+    try:
+        redis_client.setex(
+            _cache_key(student_id, get_catalog_version(), ranking),
+            RECOMMENDATION_CACHE_TTL_SECONDS,
+            json.dumps(recommendations, ensure_ascii=False)
+        )
+    except Exception as e:
+        logger.error(f"Error caching recommendations for student {student_id}: {str(e)}")
+
+
+def invalidate_recommendations(student_id):
+    """حذف توصيات الطالب المخزنة بعد تغيير تسجيلاته أو درجاته"""
+    try:
+        catalog_version = get_catalog_version()
+        pipe = redis_client.pipeline()
+        pipe.delete(*[_cache_key(student_id, catalog_version, ranking) for ranking in RANKING_MODES])
+        pipe.zadd(CHANGED_STUDENTS_KEY, {student_id: time.time()})
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Error invalidating recommendations for student {student_id}: {str(e)}")
+
+
+def get_materialized_recommendations(student_id, current_semester_name):
+    """
+    الحصول على التوصيات المحسوبة مسبقًا للطالب
+
+    تعتبر التوصيات قديمة إذا تغيرت نسخة بيانات المواد أو الفصل الدراسي
+    أو تغيرت بيانات الطالب بعد حسابها
+
+    Args:
+        student_id (int): معرف الطالب
+        current_semester_name (str): اسم الفصل الدراسي الحالي
+
+    Returns:
+        list: المواد المقترحة أو None
+    """
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hget(MATERIALIZED_KEY, student_id)
+        pipe.zscore(CHANGED_STUDENTS_KEY, student_id)
+        entry, changed_at = pipe.execute()
+
+        if not entry:
+            return None
+
+        entry = json.loads(entry)
+        if entry["catalog_version"] != get_catalog_version() or entry["semester"] != current_semester_name:
+            return None
+        if changed_at is not None and changed_at >= entry["computed_at"]:
+            return None
+
+        return entry["recommendations"]
+    except Exception as e:
+        logger.error(f"Error reading materialized recommendations for student {student_id}: {str(e)}")
+        return None
+
+
+def store_materialized_recommendations(recommendations_by_student, computed_at, current_semester_name):
+    """
+    تخزين التوصيات المحسوبة لمجموعة من الطلاب
+
+    Args:
+        recommendations_by_student (dict): المواد المقترحة لكل طالب
+        computed_at (float): وقت قراءة بيانات الطلاب قبل الحساب
+        current_semester_name (str): اسم الفصل الدراسي الحالي
+    """
+    if not recommendations_by_student:
+        return
+    try:
+        catalog_version = get_catalog_version()
+        redis_client.hset(MATERIALIZED_KEY, mapping={
+            student_id: json.dumps({
+                "catalog_version": catalog_version,
+                "semester": current_semester_name,
+                "computed_at": computed_at,
+                "recommendations": recommendations
+            }, ensure_ascii=False)
+            for student_id, recommendations in recommendations_by_student.items()
+        })
+    except Exception as e:
+        logger.error(f"Error storing materialized recommendations: {str(e)}")
+
+
+def get_recommendation_cache_stats():
+    """
+    عدادات الإصابة والإخفاق لذاكرة التوصيات المؤقتة
+
+    Returns:
+        dict: عدد مرات الإصابة والإخفاق ونسبة الإصابة
+    """
+    hits, misses = redis_client.mget(CACHE_HITS_KEY, CACHE_MISSES_KEY)
+    hits = int(hits or 0)
+    misses = int(misses or 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": round(hits / total, 4) if total else 0.0
+    }
@@ -1,5 +1,7 @@
 from redis import Redis
+import threading
 import logging
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -15,4 +17,28 @@ def create_redis_client(max_retries=3):
                 logger.error("All Redis connection attempts failed")
                 raise
     
-redis_client = create_redis_client() 
\ No newline at end of file
+redis_client = create_redis_client() 
+
+def _listen(channel, handler):
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(channel)
+            # قد تكون رسائل فاتت أثناء الانقطاع
+            handler(None)
+            for message in pubsub.listen():
+                if message["type"] == "message":
+                    handler(message["data"])
+        except Exception as e:
+            logger.warning(f"Redis subscription to {channel} failed: {str(e)}")
+            time.sleep(1)
+
+def subscribe(channel, handler):
+    """
+    الاستماع لقناة Redis في خيط خلفي يستدعي handler مع كل رسالة
+
+    يجب استدعاؤها داخل كل عملية (بعد fork) لأن الخيوط لا تنتقل للعمليات الفرعية
+    """
+    thread = threading.Thread(target=_listen, args=(channel, handler), daemon=True, name=f"redis-subscriber:{channel}")
+    thread.start()
+    return thread
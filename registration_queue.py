@@ -0,0 +1,158 @@
+from redis_config import redis_client
+import uuid
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# طلبات التسجيل المنتظرة بترتيب وصولها
+REGISTRATION_QUEUE_KEY = 'registration:queue'
+
+# الطلبات التي سحبها كل عامل ولم تُخزن نتائجها بعد (تُعاد إلى الطابور إذا توقف العامل)
+REGISTRATION_PROCESSING_KEY = 'registration:processing:{worker_id}'
+
+# حالة ونتيجة كل تذكرة
+REGISTRATION_TICKET_KEY = 'registration:ticket:{ticket_id}'
+REGISTRATION_TICKET_TTL_SECONDS = 24 * 3600
+
+TICKET_QUEUED = 'queued'
+TICKET_PROCESSING = 'processing'
+TICKET_DONE = 'done'
+TICKET_FAILED = 'failed'
+
+
+def _ticket_key(ticket_id):
+    return REGISTRATION_TICKET_KEY.format(ticket_id=ticket_id)
+
+
+def enqueue_registration(student_id, courses):
+    """
+    إضافة طلب تسجيل إلى الطابور
+
+    Args:
+        student_id (int): معرف الطالب
+        courses (list): معرفات المواد المطلوبة
+
+    Returns:
+        str: رقم التذكرة
+    """
+    ticket_id = uuid.uuid4().hex
+    pipe = redis_client.pipeline()
+    pipe.hset(_ticket_key(ticket_id), mapping={
+        "status": TICKET_QUEUED,
+        "student_id": student_id,
+        "courses": json.dumps(courses),
+        "created_at": time.time()
+    })
+    pipe.expire(_ticket_key(ticket_id), REGISTRATION_TICKET_TTL_SECONDS)
+    pipe.rpush(REGISTRATION_QUEUE_KEY, json.dumps({
+        "ticket_id": ticket_id,
+        "student_id": student_id,
+        "courses": courses
+    }))
+    pipe.execute()
+    return ticket_id
+
+
+def _processing_key(worker_id):
+    return REGISTRATION_PROCESSING_KEY.format(worker_id=worker_id)
+
+
+def pop_registrations(batch_size, worker_id, timeout=1):
+    """
+    نقل دفعة من طلبات التسجيل بترتيب وصولها إلى قائمة العامل (انتظار أول طلب حتى timeout ثانية)
+
+    تبقى الطلبات في قائمة العامل حتى تُخزن نتائجها بـ complete_tickets
+
+    Returns:
+        list: الطلبات (ticket_id, student_id, courses)
+    """
+    processing_key = _processing_key(worker_id)
+    first = redis_client.blmove(REGISTRATION_QUEUE_KEY, processing_key, timeout, "LEFT", "RIGHT")
+    if not first:
+        return []
+    items = [first]
+    if batch_size > 1:
+        pipe = redis_client.pipeline(transaction=False)
+        for _ in range(batch_size - 1):
+            pipe.lmove(REGISTRATION_QUEUE_KEY, processing_key, "LEFT", "RIGHT")
+        items.extend(item for item in pipe.execute() if item)
+
+    requests = [json.loads(item) for item in items]
+    pipe = redis_client.pipeline()
+    for registration in requests:
+        pipe.hset(_ticket_key(registration["ticket_id"]), "status", TICKET_PROCESSING)
+    pipe.execute()
+    return requests
+
+
+def complete_tickets(results, worker_id):
+    """
+    تخزين نتائج مجموعة من التذاكر وحذف طلباتها من قائمة العامل في معاملة واحدة
+
+    Args:
+        results (dict): لكل تذكرة (نص الاستجابة, رمز الحالة)
+        worker_id (str): معرف العامل
+    """
+    pipe = redis_client.pipeline()
+    for ticket_id, (body, status_code) in results.items():
+        pipe.hset(_ticket_key(ticket_id), mapping={
+            "status": TICKET_DONE if status_code < 500 else TICKET_FAILED,
+            "status_code": status_code,
+            "result": json.dumps(body, ensure_ascii=False),
+            "finished_at": time.time()
+        })
+        pipe.expire(_ticket_key(ticket_id), REGISTRATION_TICKET_TTL_SECONDS)
+    # العامل يعالج دفعة واحدة في كل مرة، فقائمته تحتوي طلبات هذه الدفعة فقط
+    pipe.delete(_processing_key(worker_id))
+    pipe.execute()
+
+
+def recover_registrations(worker_pattern):
+    """
+    إعادة طلبات العمال المتوقفين إلى بداية الطابور بنفس ترتيبها (عند بدء التشغيل)
+
+    Args:
+        worker_pattern (str): نمط معرفات العمال (مثل host:*)
+
+    Returns:
+        int: عدد الطلبات المعادة
+    """
+    recovered = 0
+    for processing_key in redis_client.scan_iter(match=_processing_key(worker_pattern)):
+        while True:
+            item = redis_client.lmove(processing_key, REGISTRATION_QUEUE_KEY, "RIGHT", "LEFT")
+            if item is None:
+                break
+            redis_client.hset(_ticket_key(json.loads(item)["ticket_id"]), "status", TICKET_QUEUED)
+            recovered += 1
+    if recovered:
+        logger.warning(f"Requeued {recovered} registrations left by stopped workers")
+    return recovered
+
+
+def get_ticket(ticket_id):
+    """
+    حالة تذكرة التسجيل ونتيجتها
+
+    Returns:
+        dict: بيانات التذكرة أو None إذا لم تكن موجودة
+    """
+    ticket = redis_client.hgetall(_ticket_key(ticket_id))
+    if not ticket:
+        return None
+
+    result = {
+        "ticket_id": ticket_id,
+        "status": ticket["status"],
+        "student_id": int(ticket["student_id"]),
+        "courses": json.loads(ticket["courses"])
+    }
+    if "status_code" in ticket:
+        result["status_code"] = int(ticket["status_code"])
+        result["result"] = json.loads(ticket["result"])
+    else:
+        # عدد الطلبات المنتظرة في الطابور حاليًا
+        result["queue_length"] = redis_client.llen(REGISTRATION_QUEUE_KEY)
+    return result
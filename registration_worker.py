@@ -0,0 +1,129 @@
+"""
+عمال طابور التسجيل: تنفيذ طلبات التسجيل المنتظرة بترتيب وصولها
+
+كل عامل يسحب دفعة من الطلبات وينفذها في معاملة واحدة (نقطة حفظ لكل طلب):
+    python registration_worker.py --workers 4
+"""
+from app import create_app
+from models import db
+from registration_queue import pop_registrations, complete_tickets, recover_registrations
+from resources import register_courses, complete_registration, release_reserved_seats
+from multiprocessing import Process
+import argparse
+import socket
+import logging
+
+logger = logging.getLogger(__name__)
+
+REGISTRATION_BATCH_SIZE = 50
+
+
+def process_batch(registrations):
+    """
+    تنفيذ دفعة من طلبات التسجيل في معاملة واحدة
+
+    فشل أحد الطلبات يلغي نقطة الحفظ الخاصة به فقط، وفشل حفظ المعاملة يلغي حجز
+    مقاعد جميع الطلبات الناجحة في الدفعة
+
+    Args:
+        registrations (list): الطلبات كما يعيدها pop_registrations
+
+    Returns:
+        dict: لكل تذكرة (نص الاستجابة, رمز الحالة)
+    """
+    results = {}
+    pending = []
+    for registration in registrations:
+        ticket_id = registration["ticket_id"]
+        student_id = registration["student_id"]
+        try:
+            with db.session.begin_nested():
+                body, status_code, reservation = register_courses(student_id, registration["courses"])
+        except Exception as e:
+            logger.error(f"Error processing registration ticket {ticket_id}: {str(e)}")
+            results[ticket_id] = ({"error": str(e)}, 500)
+            continue
+
+        if status_code == 201:
+            pending.append((ticket_id, student_id, body, reservation))
+        else:
+            results[ticket_id] = (body, status_code)
+
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.error(f"Error committing registration batch: {str(e)}")
+        for ticket_id, _, _, reservation in pending:
+            release_reserved_seats(reservation)
+            results[ticket_id] = ({"error": str(e)}, 500)
+        return results
+
+    for ticket_id, student_id, body, reservation in pending:
+        complete_registration(student_id, reservation)
+        results[ticket_id] = (body, 201)
+    return results
+
+
+def run_worker(worker_id, batch_size=REGISTRATION_BATCH_SIZE):
+    """تشغيل عامل واحد يسحب الطلبات من الطابور باستمرار"""
+    app = create_app()
+    with app.app_context():
+        # طلبات بقيت في قائمة العامل بعد خطأ، تُعاد إلى الطابور قبل سحب دفعة جديدة
+        # حتى لا تُحذف مع نتائج الدفعة التالية
+        needs_recovery = True
+        while True:
+            registrations = []
+            try:
+                if needs_recovery:
+                    recover_registrations(worker_id)
+                    needs_recovery = False
+                registrations = pop_registrations(batch_size, worker_id)
+                if not registrations:
+                    continue
+                complete_tickets(process_batch(registrations), worker_id)
+                logger.debug(f"Processed {len(registrations)} queued registrations")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"Registration worker error: {str(e)}")
+                needs_recovery = not _fail_tickets(registrations, worker_id, e)
+
+
+def _fail_tickets(registrations, worker_id, error):
+    """
+    تعليم تذاكر الدفعة كفاشلة بعد خطأ غير متوقع
+
+    Returns:
+        bool: False إذا بقيت طلبات في قائمة العامل
+    """
+    if not registrations:
+        return False
+    try:
+        complete_tickets({
+            registration["ticket_id"]: ({"error": str(error)}, 500)
+            for registration in registrations
+        }, worker_id)
+        return True
+    except Exception as e:
+        logger.error(f"Error marking {len(registrations)} registration tickets as failed: {str(e)}")
+        return False
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="تنفيذ طلبات التسجيل المنتظرة في الطابور")
+    parser.add_argument("--workers", type=int, default=2, help="عدد العمليات")
+    parser.add_argument("--batch-size", type=int, default=REGISTRATION_BATCH_SIZE, help="عدد الطلبات في كل معاملة")
+    args = parser.parse_args()
+
+    # إعادة الطلبات التي سحبها عمال هذا الخادم قبل توقفهم ولم تُخزن نتائجها
+    host = socket.gethostname()
+    recover_registrations(f"{host}:*")
+
+    workers = [
+        Process(target=run_worker, args=(f"{host}:{i}", args.batch_size))
+        for i in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
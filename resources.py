@@ -1,7 +1,3 @@
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import TfidfVectorizer
-import numpy as np
-from functools import lru_cache
 import json
 import pandas as pd
 from sklearn.preprocessing import PolynomialFeatures
@@ -10,103 +6,83 @@ from sklearn.ensemble import RandomForestClassifier
 
 from datetime import datetime
 from flask_restful import Resource, request
-from flask import jsonify
+from flask import jsonify, Response, stream_with_context
 from sqlalchemy.orm import joinedload
-from sqlalchemy import func
+from sqlalchemy import func, insert
 
 from redis_config import redis_client
 from services import (
-    get_student_data, get_prerequisites, get_course_data,
+    get_student_data, get_students_data, get_course_data, get_course_index,
+    get_prerequisite_graph,
     get_available_courses, get_registerable_courses, get_recommended_courses,
-    recommend_courses, ValidationError, check_enrollment_period, get_current_semester
+    recommend_courses, recommend_courses_batch, check_registration_eligibility,
+    ValidationError, RANKING_MODES, check_enrollment_period, get_current_semester
 )
-from models import db, Student, Course, Attendance, Class, Department, Enrollment, CourseDepartment, Professor
+from catalog import get_catalog_version, invalidate_catalog
+from offerings import get_course_offerings
+from timetable import get_timetable_index, generate_timetables
+from graduation import get_graduation_audit, invalidate_graduation_audit
+from ledger import charge_credits, commit_charge, cancel_charge, release_credits, invalidate_credit_ledger
+from seats import (
+    reserve_seats, release_seats, cancel_reservation, confirm_reservation, reset_seat_limits, reset_seat_inventory
+)
+from idempotency import idempotent
+from rate_limiting import enrollment_write_limits, low_priority_limits
+from enrollment_window import (
+    EnrollmentWindow, get_enrollment_window, get_enrollment_windows, set_enrollment_window,
+    delete_enrollment_window, window_scope
+)
+from waitlist import (
+    waitlist_priority, join_waitlist, leave_waitlist, get_waitlist_status,
+    pop_waitlist, requeue_waitlist, record_waitlist_outcome, WAITLIST_PROMOTED, WAITLIST_REMOVED
+)
+from registration_queue import enqueue_registration, get_ticket, TICKET_QUEUED
+from recommendation_cache import (
+    get_cached_recommendations, cache_recommendations, invalidate_recommendations,
+    get_recommendation_cache_stats, get_materialized_recommendations, store_materialized_recommendations
+)
+from profiles import get_interest_profile
+from co_enrollment import record_completed_courses
+from models import db, Student, Course, Attendance, Class, Department, Enrollment
 
 import logging
 import pickle
+import time
 
 logger = logging.getLogger(__name__)
 
 
 class RecommendCourses(Resource):
-    @lru_cache(maxsize=32)
     def get(self, student_id):
         try:
-            
-            student_data = get_student_data(student_id)
-            if not student_data:
-                return {"error": "Student not found"}, 404
+            # طريقة ترتيب المواد الاختيارية (content أو collaborative أو blended)
+            ranking = request.args.get('ranking', 'content')
+            if ranking not in RANKING_MODES:
+                return {"error": f"ranking يجب أن تكون إحدى القيم: {', '.join(RANKING_MODES)}"}, 400
 
-            logger.debug(f"Student data: {student_data}")
+            cached = get_cached_recommendations(student_id, ranking)
+            if cached is not None:
+                return jsonify(cached)
 
-           
-            available_courses = get_available_courses(
-                student_data["current_semester"],
-                student_data["department_id"]
-            )
-            
-            logger.debug(f"Available courses: {available_courses}")
-
-            
-            prerequisites = get_prerequisites()
-            course_data = get_course_data()
-
-            logger.debug(f"Prerequisites: {prerequisites}")
-            logger.debug(f"Course data: {course_data}")
-
-            
-            if not available_courses:
-                return {
-                    "recommendations": []
-                }
+            _, current_semester_name = get_current_semester()
 
-            result = recommend_courses(
-                student_data,
-                available_courses,
-                course_data,
-                prerequisites
-            )
-
-            
-            all_courses = []
-            
-            
-            for course_id in result["mandatory"]:
-                course_info = self._format_course(course_id, course_data)
-                course_info["نوع_المادة"] = "اجباري"
-                
-                
-                course_info["سبب_الاقتراح"] = self._get_mandatory_reason(course_id, student_data, prerequisites)
-                
-                # إضافة عدد الساعات
-                course_obj = Course.query.get(course_id)
-                if course_obj and hasattr(course_obj, 'Credits'):
-                    course_info["credits"] = course_obj.Credits
-                
-                all_courses.append(course_info)
-            
-            
-            for course_id in result["elective"]:
-                course_info = self._format_course(course_id, course_data)
-                course_info["نوع_المادة"] = "اختياري"
-                
-                
-                completed_courses = student_data.get("completed_courses", [])
-                similarity_score = self._calculate_similarity(course_id, completed_courses, course_data)
-                course_info["درجة_التشابه"] = similarity_score
-                course_info["سبب_الاقتراح"] = self._get_elective_reason(course_id, student_data, similarity_score)
-                
-                
-                course_obj = Course.query.get(course_id)
-                if course_obj and hasattr(course_obj, 'Credits'):
-                    course_info["credits"] = course_obj.Credits
-                
-                all_courses.append(course_info)
+            # التوصيات المحسوبة مسبقًا (ليلاً) إذا لم تتغير بيانات الطالب بعدها
+            all_courses = None
+            if ranking == 'content':
+                all_courses = get_materialized_recommendations(student_id, current_semester_name)
+            if all_courses is not None:
+                self._refresh_seats(all_courses)
+            else:
+                computed_at = time.time()
+                all_courses = self._compute_recommendations(student_id, current_semester_name, ranking)
+                if ranking == 'content':
+                    store_materialized_recommendations({student_id: all_courses}, computed_at, current_semester_name)
 
             response = {
                 "recommendations": all_courses
             }
 
+            cache_recommendations(student_id, response, ranking)
             return jsonify(response)
 
         except ValidationError as e:
@@ -116,13 +92,118 @@ class RecommendCourses(Resource):
             logger.error(f"Error processing recommendation for student {student_id}: {str(e)}")
             return {"error": str(e)}, 500
 
+    def _compute_recommendations(self, student_id, current_semester_name, ranking='content'):
+        """حساب توصيات الطالب عند الطلب"""
+        student_data = get_student_data(student_id)
+
+        logger.debug(f"Student data: {student_data}")
+
+        available_courses = get_available_courses(
+            student_data["current_semester"],
+            student_data["department_id"]
+        )
+        
+        logger.debug(f"Available courses: {available_courses}")
+
+        if not available_courses:
+            return []
+
+        course_data = get_course_data()
+
+        result = recommend_courses(
+            student_data,
+            available_courses,
+            course_data,
+            ranking=ranking
+        )
+
+        return self.build_recommendations(student_data, result, course_data, current_semester_name)
+
+    @classmethod
+    def build_recommendations(cls, student_data, result, course_data, current_semester_name, offerings=None):
+        """
+        تنسيق نتيجة recommend_courses إلى قائمة المواد المقترحة مع أسباب الاقتراح
+
+        Args:
+            student_data (dict): بيانات الطالب
+            result (dict): المواد الإجبارية والاختيارية المقترحة
+            course_data (dict): بيانات المواد
+            current_semester_name (str): اسم الفصل الدراسي الحالي
+            offerings (dict): بيانات الطرح (تُحمّل إذا لم تُمرر)
+
+        Returns:
+            list: المواد المقترحة بعد التنسيق
+        """
+        all_courses = []
+
+        # بيانات الطرح لجميع المواد المقترحة دفعة واحدة
+        if offerings is None:
+            offerings = get_course_offerings(result["mandatory"] + result["elective"])
+        prerequisite_graph = get_prerequisite_graph()
+        completed_set = set(student_data.get("completed_courses", []))
+        
+        for course_id in result["mandatory"]:
+            offering = offerings.get(course_id)
+            course_info = cls._format_course(course_id, course_data, offering)
+            course_info["نوع_المادة"] = "اجباري"
+            
+            
+            course_info["سبب_الاقتراح"] = cls._get_mandatory_reason(
+                course_id, student_data, prerequisite_graph, completed_set, current_semester_name
+            )
+            
+            # إضافة عدد الساعات
+            if offering:
+                course_info["credits"] = offering["credits"]
+            
+            all_courses.append(course_info)
+        
+        
+        # متجه اهتمامات الطالب مرة واحدة لجميع المواد الاختيارية
+        profile = None
+        if result["elective"]:
+            profile = get_interest_profile(
+                student_data["id"], student_data.get("completed_courses", []), get_course_index()
+            )
+
+        for course_id in result["elective"]:
+            offering = offerings.get(course_id)
+            course_info = cls._format_course(course_id, course_data, offering)
+            course_info["نوع_المادة"] = "اختياري"
+            
+            
+            completed_courses = student_data.get("completed_courses", [])
+            similarity_score = cls._calculate_similarity(course_id, completed_courses, course_data, profile)
+            course_info["درجة_التشابه"] = similarity_score
+            course_info["سبب_الاقتراح"] = cls._get_elective_reason(course_id, student_data, similarity_score)
+            
+            
+            if offering:
+                course_info["credits"] = offering["credits"]
+            
+            all_courses.append(course_info)
+
+        # تعارض مواعيد المحاضرات بين المواد المقترحة
+        conflicts = get_timetable_index().conflict_map([course_info["id"] for course_info in all_courses])
+        for course_info in all_courses:
+            course_info["تتعارض_مع"] = conflicts.get(course_info["id"], [])
+
+        return all_courses
+
+    @staticmethod
+    def _refresh_seats(all_courses):
+        """تحديث المقاعد المتاحة في التوصيات المحسوبة مسبقًا"""
+        offerings = get_course_offerings([course_info["id"] for course_info in all_courses])
+        for course_info in all_courses:
+            offering = offerings.get(course_info["id"])
+            if offering and "المقاعد_المتاحة" in course_info:
+                course_info["المقاعد_المتاحة"] = offering["available_seats"]
+
     @staticmethod
-    def _format_course(course_id, course_data):
+    def _format_course(course_id, course_data, offering=None):
         """تنسيق بيانات المادة مع معلومات المحاضرات والمقاعد المتاحة"""
         course = course_data.get(course_id, {})
         
-        logger.debug(f"Fetching class info for course ID: {course_id}")
-        
         course_details = {
             "id": course_id,
             "name": course.get("name", "غير محدد"),
@@ -130,52 +211,21 @@ class RecommendCourses(Resource):
             "description": course.get("description", "غير محدد"),
         }
         
-        # الحصول على معلومات المقاعد
-        course_obj = Course.query.get(course_id)
-        if course_obj:
-            max_seats = course_obj.MaxSeats
-            
-            current_enrolled = db.session.query(db.func.count(Enrollment.Id)).filter(
-                Enrollment.CourseId == course_id,
-                Enrollment.IsCompleted == "قيد الدراسة",
-                Enrollment.DeletedEnrollmentDate == None
-            ).scalar()
-            
-            available_seats = max_seats - current_enrolled
-            course_details["المقاعد_المتاحة"] = available_seats
-        
-        # التحقق من وجود محاضرات لهذه المادة
-        class_count = db.session.query(db.func.count(Class.Id)).filter(Class.CourseId == course_id).scalar()
-        logger.debug(f"Class count for course {course_id}: {class_count}")
+        # معلومات المقاعد من بيانات الطرح
+        if offering:
+            course_details["المقاعد_المتاحة"] = offering["available_seats"]
         
-        # الحصول على معلومات المحاضرة
-        class_info = Class.query.filter_by(CourseId=course_id).first()
+        class_info = offering.get("class") if offering else None
         
         if class_info:
-            # طباعة معلومات تصحيح
-            logger.debug(f"Found class info for course {course_id}: {class_info.Id}, Day: {class_info.Day}, ProfessorId: {class_info.ProfessorId}")
-            
-            # الحصول على معلومات الأستاذ بشكل منفصل
-            professor = Professor.query.get(class_info.ProfessorId)
-            if professor:
-                logger.debug(f"Found professor: {professor.FullName}")
-                professor_name = professor.FullName
-            else:
-                logger.debug(f"No professor found for ID: {class_info.ProfessorId}")
-                professor_name = "غير محدد"
-            
-            # تحديد المكان بناءً على البيانات المتاحة
-            location = class_info.Location if hasattr(class_info, 'Location') and class_info.Location else "غير محدد"
-            
             course_details["معلومات_المحاضرة"] = {
-                "اليوم": class_info.Day,
-                "وقت_البداية": str(class_info.StartTime),
-                "وقت_النهاية": str(class_info.EndTime),
-                "المكان": location,
-                "الدكتور": professor_name
+                "اليوم": class_info["day"],
+                "وقت_البداية": class_info["start_time"],
+                "وقت_النهاية": class_info["end_time"],
+                "المكان": class_info["location"],
+                "الدكتور": class_info["professor"]
             }
         else:
-            # طباعة معلومات تصحيح
             logger.debug(f"No class info found for course {course_id}")
             
             # إذا لم يتم العثور على معلومات المحاضرة، نضع قيم فارغة
@@ -190,7 +240,7 @@ class RecommendCourses(Resource):
         return course_details
         
     @staticmethod
-    def _calculate_similarity(course_id, completed_courses, course_data):
+    def _calculate_similarity(course_id, completed_courses, course_data, profile=None):
         """حساب درجة التشابه بين المادة والمواد المكتملة"""
         if not completed_courses:
             return 0.0
@@ -201,22 +251,21 @@ class RecommendCourses(Resource):
         if not course_desc or not any(completed_descs):
             return 0.0
             
-        vectorizer = TfidfVectorizer()
         try:
-            tfidf_matrix = vectorizer.fit_transform([course_desc] + completed_descs)
-            similarity = cosine_similarity(tfidf_matrix[0:1], tfidf_matrix[1:])[0]
-            return float(np.mean(similarity))
-        except:
+            if profile is not None:
+                return float(get_course_index().score(profile.centroid, [course_id])[0])
+            return float(get_course_index().mean_similarity(completed_courses, [course_id])[0])
+        except Exception:
             return 0.0
     
     @staticmethod
-    def _get_mandatory_reason(course_id, student_data, prerequisites):
+    def _get_mandatory_reason(course_id, student_data, prerequisite_graph, completed_courses, current_semester_name=None):
         """تحديد سبب اقتراح المادة الإجبارية"""
-        course_prereqs = prerequisites.get(course_id, [])
+        course_prereqs = prerequisite_graph.prerequisites_of(course_id)
         
         is_graduation_req = course_id in student_data.get("graduation_requirements", [])
         
-        is_prereq_for_others = any(course_id in prereqs for c_id, prereqs in prerequisites.items())
+        is_prereq_for_others = prerequisite_graph.is_prerequisite_for_others(course_id)
         
         reasons = []
         
@@ -226,12 +275,11 @@ class RecommendCourses(Resource):
         if is_prereq_for_others:
             reasons.append("متطلب سابق لمواد أخرى")
         
-        if course_prereqs:
-            completed_prereqs = [p for p in course_prereqs if p in student_data.get("completed_courses", [])]
-            if len(completed_prereqs) == len(course_prereqs):
-                reasons.append("تم استيفاء جميع المتطلبات السابقة")
+        if course_prereqs and prerequisite_graph.is_unlocked(course_id, completed_courses):
+            reasons.append("تم استيفاء جميع المتطلبات السابقة")
         
-        _, current_semester_name = get_current_semester()
+        if current_semester_name is None:
+            _, current_semester_name = get_current_semester()
         reasons.append(f"مناسبة للفصل الدراسي الحالي ({current_semester_name})")
         
         if not reasons:
@@ -268,6 +316,102 @@ class RecommendCourses(Resource):
         
         return " - ".join(reasons)
 
+class StudentGradesPosted(Resource):
+    def post(self, student_id):
+        """تحديث متجه اهتمامات الطالب ومصفوفة النجاح المشترك وإلغاء توصياته ومراجعة تخرجه وسجل ساعاته بعد رصد درجاته"""
+        try:
+            student_data = get_student_data(student_id)
+            invalidate_recommendations(student_id)
+            invalidate_graduation_audit(student_id)
+            # تتغير الساعات قيد الدراسة والحد الأقصى (المعدل) بعد رصد الدرجات
+            invalidate_credit_ledger(student_id, get_current_semester()[1])
+            record_completed_courses(student_id, student_data["completed_courses"])
+            profile = get_interest_profile(student_id, student_data["completed_courses"], get_course_index())
+            return {
+                "message": "تم تحديث ملف اهتمامات الطالب",
+                "completed_courses": len(profile.courses)
+            }, 200
+        except ValidationError as e:
+            logger.warning(f"Validation error for student {student_id}: {str(e)}")
+            return {"error": str(e)}, 400
+        except Exception as e:
+            logger.error(f"Error updating interest profile for student {student_id}: {str(e)}")
+            return {"error": f"حدث خطأ: {str(e)}"}, 500
+
+class RecommendationCacheStats(Resource):
+    def get(self):
+        """عدادات ذاكرة التوصيات المؤقتة"""
+        try:
+            return get_recommendation_cache_stats(), 200
+        except Exception as e:
+            logger.error(f"Error getting recommendation cache stats: {str(e)}")
+            return {"error": f"حدث خطأ: {str(e)}"}, 500
+
+class BatchRecommendCourses(Resource):
+    def post(self):
+        """توصيات المواد لقسم/فصل كامل أو لقائمة طلاب مع إرسال النتائج تدريجيًا (NDJSON)"""
+        try:
+            data = request.get_json(silent=True) or {}
+            student_ids = data.get('student_ids')
+            department_id = data.get('department_id')
+            semester = data.get('semester')
+            ranking = data.get('ranking', 'content')
+
+            if student_ids is not None and not isinstance(student_ids, list):
+                return {"error": "يجب أن تكون student_ids قائمة"}, 400
+            if ranking not in RANKING_MODES:
+                return {"error": f"ranking يجب أن تكون إحدى القيم: {', '.join(RANKING_MODES)}"}, 400
+
+            students_data = get_students_data(student_ids, department_id, semester)
+            course_data = get_course_data()
+
+            logger.debug(f"Batch recommendations for {len(students_data)} students")
+
+            results = recommend_courses_batch(students_data, course_data, ranking=ranking)
+
+            def generate():
+                for student_id, result, error in results:
+                    if error:
+                        line = {"student_id": student_id, "error": error}
+                    else:
+                        line = {"student_id": student_id, **result}
+                    yield json.dumps(line, ensure_ascii=False) + "\n"
+
+            return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+        except ValidationError as e:
+            logger.warning(f"Validation error in batch recommendations: {str(e)}")
+            return {"error": str(e)}, 400
+        except Exception as e:
+            logger.error(f"Error processing batch recommendations: {str(e)}")
+            return {"error": str(e)}, 500
+
+class CatalogVersion(Resource):
+    def get(self):
+        """رقم نسخة بيانات المواد الحالية"""
+        try:
+            return {"version": get_catalog_version()}, 200
+        except Exception as e:
+            logger.error(f"Error getting catalog version: {str(e)}")
+            return {"error": f"حدث خطأ: {str(e)}"}, 500
+
+class CatalogInvalidation(Resource):
+    def post(self):
+        """إبلاغ جميع العمليات بتعديل بيانات المواد لإعادة تحميلها"""
+        try:
+            version = invalidate_catalog()
+            reset_seat_limits()
+            # إعادة عد المقاعد المحجوزة من التسجيلات النشطة (تصحيح أي انحراف في Redis)
+            recounted_courses = reset_seat_inventory()
+            return {
+                "message": "تم تحديث نسخة بيانات المواد",
+                "version": version,
+                "recounted_courses": recounted_courses
+            }, 200
+        except Exception as e:
+            logger.error(f"Error invalidating catalog: {str(e)}")
+            return {"error": f"حدث خطأ: {str(e)}"}, 500
+
 class EnrollmentPeriod(Resource):
     def post(self):
         """تعيين فترة التسجيل"""
@@ -285,24 +429,29 @@ class EnrollmentPeriod(Resource):
             
             # التحقق من صحة التواريخ
             try:
-                start_dt = datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S")
-                end_dt = datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S")
+                window = EnrollmentWindow(start_time, end_time)
             except ValueError:
                 return {"error": "صيغة التاريخ غير صحيحة. يجب أن تكون بالصيغة: YYYY-MM-DD HH:MM:SS"}, 400
             
-            if end_dt <= start_dt:
+            if window.end_dt <= window.start_dt:
                 return {"error": "يجب أن يكون وقت النهاية بعد وقت البداية"}, 400
             
-            # حفظ في Redis
+            # نطاق الفترة: قسم أو مستوى أو فئة معدل (الفترة العامة إذا لم يُحدد)
+            try:
+                scope = self._scope(data)
+            except (TypeError, ValueError) as e:
+                return {"error": str(e)}, 400
+            
+            # حفظ في Redis وإبلاغ جميع العمليات
             try:
-                redis_client.set('enrollment:start_time', start_time)
-                redis_client.set('enrollment:end_time', end_time)
+                set_enrollment_window(start_time, end_time, scope)
             except Exception as e:
                 logger.error(f"Redis error: {str(e)}")
                 return {"error": "حدث خطأ أثناء حفظ فترة التسجيل"}, 500
             
             return {
                 "message": "تم تعيين فترة التسجيل بنجاح",
+                "scope": scope or "global",
                 "period": {
                     "start_time": start_time,
                     "end_time": end_time
@@ -313,39 +462,71 @@ class EnrollmentPeriod(Resource):
             return {"error": f"حدث خطأ: {str(e)}"}, 500
     
     def get(self):
-        """الحصول على فترة التسجيل الحالية"""
+        """الحصول على فترة التسجيل العامة والفترات الخاصة"""
         try:
-            start_time = redis_client.get('enrollment:start_time')
-            end_time = redis_client.get('enrollment:end_time')
+            windows = get_enrollment_windows()
             
-            if not start_time or not end_time:
+            if windows.global_window is None and not windows.scoped:
                 return {"error": "لم يتم تعيين فترة التسجيل"}, 404
                 
             return {
-                "period": {
-                    "start_time": start_time,
-                    "end_time": end_time
+                "period": windows.global_window.to_dict() if windows.global_window else None,
+                "scoped_periods": {
+                    scope: window.to_dict() for scope, window in windows.scoped.items()
                 }
             }, 200
         except Exception as e:
             logger.error(f"Error getting enrollment period: {str(e)}")
             return {"error": f"حدث خطأ: {str(e)}"}, 500
 
+    def delete(self):
+        """حذف فترة تسجيل خاصة بقسم أو مستوى أو فئة معدل"""
+        try:
+            try:
+                scope = self._scope(request.get_json(silent=True) or {})
+            except (TypeError, ValueError) as e:
+                return {"error": str(e)}, 400
+            if scope is None:
+                return {"error": "يجب تحديد department_id أو student_level أو gpa_band"}, 400
+
+            if not delete_enrollment_window(scope):
+                return {"error": "لا توجد فترة تسجيل لهذا النطاق"}, 404
+            return {"message": "تم حذف فترة التسجيل", "scope": scope}, 200
+        except Exception as e:
+            logger.error(f"Error deleting enrollment period: {str(e)}")
+            return {"error": f"حدث خطأ: {str(e)}"}, 500
+
+    @staticmethod
+    def _scope(data):
+        """نطاق الفترة من بيانات الطلب (واحد فقط من department_id أو student_level أو gpa_band)"""
+        values = {
+            key: data.get(key) for key in ('department_id', 'student_level', 'gpa_band')
+            if data.get(key) is not None
+        }
+        if len(values) > 1:
+            raise ValueError("يمكن تحديد نطاق واحد فقط: department_id أو student_level أو gpa_band")
+        return window_scope(
+            department_id=values.get('department_id'),
+            student_level=values.get('student_level'),
+            band=values.get('gpa_band')
+        )
+
 class EnrollmentPeriodStatus(Resource):
     def get(self):
-        """التحقق من حالة فترة التسجيل"""
-        start_time = redis_client.get('enrollment:start_time')
-        end_time = redis_client.get('enrollment:end_time')
+        """التحقق من حالة فترة التسجيل (الفترة الخاصة بالطالب إذا حُدد student_id)"""
+        student_id = request.args.get('student_id', type=int)
+        student = Student.query.get(student_id) if student_id else None
+        window = get_enrollment_window(student)
         
-        if not start_time or not end_time:
+        if window is None:
             return {
                 "status": "غير متاح",
                 "message": "لم يتم تعيين فترة التسجيل"
             }, 200
             
         now = datetime.now()
-        start_dt = datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S")
-        end_dt = datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S")
+        start_dt = window.start_dt
+        end_dt = window.end_dt
         
         if now < start_dt:
             return {
@@ -370,10 +551,13 @@ class EnrollmentPeriodStatus(Resource):
 
 
 class CourseEnrollment(Resource):
+    decorators = enrollment_write_limits
+
+    @idempotent
     def post(self, student_id):
         try:
-            # التحقق من فترة التسجيل
-            enrollment_active, message = check_enrollment_period()
+            # التحقق من فترة التسجيل الخاصة بالطالب
+            enrollment_active, message = check_enrollment_period(Student.query.get(student_id))
             if not enrollment_active:
                 return {"error": "لا يمكن إضافة مواد جديدة. " + message}, 400
 
@@ -391,128 +575,210 @@ class CourseEnrollment(Resource):
             if not courses or not isinstance(courses, list):
                 return {"error": "يجب تحديد قائمة المواد المطلوبة"}, 400
 
-            # التحقق من وجود الطالب
-            student = Student.query.get(student_id)
-            if not student:
-                return {"error": "الطالب غير موجود"}, 404
-            
-            # الحصول على المواد الموصى بها للطالب
-            recommend_service = RecommendCourses()
-            recommendations_response = recommend_service.get(student_id)
-            
-            # طباعة معلومات تصحيح
-            logger.debug(f"Recommendations response type: {type(recommendations_response)}")
-            logger.debug(f"Recommendations response: {recommendations_response}")
-            
-            # استخراج معرفات المواد الموصى بها
-            recommended_course_ids = []
-            
-            # إذا كانت الاستجابة هي Response object (من jsonify)
-            if hasattr(recommendations_response, 'json'):
-                recommendations_data = recommendations_response.json
-                if isinstance(recommendations_data, dict) and 'recommendations' in recommendations_data:
-                    for course in recommendations_data['recommendations']:
-                        if isinstance(course, dict) and 'id' in course:
-                            recommended_course_ids.append(course['id'])
-            # إذا كانت الاستجابة هي tuple (status code, response)
-            elif isinstance(recommendations_response, tuple) and len(recommendations_response) == 2:
-                recommendations_data = recommendations_response[0]
-                if isinstance(recommendations_data, dict) and 'recommendations' in recommendations_data:
-                    for course in recommendations_data['recommendations']:
-                        if isinstance(course, dict) and 'id' in course:
-                            recommended_course_ids.append(course['id'])
-            
-            # طباعة معلومات تصحيح
-            logger.debug(f"Recommended course IDs: {recommended_course_ids}")
-            logger.debug(f"Requested course IDs: {courses}")
-            
-            # التحقق من أن جميع المواد المطلوبة موجودة في قائمة التوصيات
-            invalid_courses = [course_id for course_id in courses if course_id not in recommended_course_ids]
-            if invalid_courses:
-                return {
-                    "error": "لا يمكن تسجيل بعض المواد لأنها غير موجودة في قائمة التوصيات",
-                    "invalid_courses": invalid_courses
-                }, 400
-            
-            # الحصول على الفصل الدراسي الحالي
-            current_semester_number, semester_name = get_current_semester()
-            
-            # حساب عدد الساعات المسجلة حاليًا
-            current_credits = get_current_enrolled_credits(student_id, semester_name)
-            
-            # حساب عدد الساعات المطلوبة
-            requested_credits = 0
-            for course_id in courses:
-                course = Course.query.get(course_id)
-                if course and hasattr(course, 'Credits'):
-                    requested_credits += course.Credits
-            
-            # الحصول على الحد الأقصى للساعات المسموح بها
-            max_credits = get_max_credits(student)
-            
-            # التحقق من عدم تجاوز الحد الأقصى للساعات
-            if current_credits + requested_credits > max_credits:
+            # وضع الطابور: قبول الطلب وإرجاع رقم تذكرة لمتابعة نتيجته
+            if request.args.get('mode') == 'queued':
+                ticket_id = enqueue_registration(student_id, courses)
                 return {
-                    "error": f"لا يمكن تسجيل هذه المواد. الحد الأقصى المسموح به هو {max_credits} ساعة.",
-                    "current_credits": current_credits,
-                    "requested_credits": requested_credits,
-                    "max_credits": max_credits
-                }, 400
-            
-            # تسجيل المواد
-            enrollments = []
-            for course_id in courses:
-                # التحقق من عدم وجود تسجيل سابق للمادة
-                existing_enrollment = Enrollment.query.filter_by(
-                    StudentId=student_id,
-                    CourseId=course_id,
-                    Semester=semester_name,
-                    DeletedEnrollmentDate=None  # فقط التسجيلات النشطة
-                ).first()
-                
-                if existing_enrollment:
-                    continue  # تخطي المواد المسجلة بالفعل
-                
-                # التحقق من وجود المادة
-                course = Course.query.get(course_id)
-                if not course:
-                    continue  # تخطي المواد غير الموجودة
-                
-                # إنشاء تسجيل جديد
-                enrollment = Enrollment(
-                    StudentId=student_id,
-                    CourseId=course_id,
-                    Semester=semester_name,
-                    NumberOFSemster=str(current_semester_number),
-                    AddedEnrollmentDate=datetime.now().date(),
-                    IsCompleted="قيد الدراسة"
-                )
-                db.session.add(enrollment)
-                
-                # تحديث عدد الطلاب المسجلين في المادة
-                if hasattr(course, 'CurrentEnrolledStudents'):
-                    course.CurrentEnrolledStudents += 1
-                
-                enrollments.append(course_id)
-            
-            if not enrollments:
-                return {"message": "لم يتم تسجيل أي مواد جديدة. قد تكون المواد مسجلة بالفعل."}, 200
-                
+                    "message": "تم استلام طلب التسجيل وسيتم تنفيذه بالترتيب",
+                    "ticket_id": ticket_id,
+                    "status": TICKET_QUEUED
+                }, 202
+
+            result, status_code, reservation = register_courses(student_id, courses)
+            if status_code != 201:
+                return result, status_code
+
             # حفظ التغييرات
-            db.session.commit()
-            
-            return {"message": f"تم تسجيل {len(enrollments)} مواد بنجاح", "enrolled_courses": enrollments}, 201
+            try:
+                db.session.commit()
+            except Exception:
+                release_reserved_seats(reservation)
+                raise
+
+            complete_registration(student_id, reservation)
+            return result, status_code
             
         except Exception as e:
             db.session.rollback()
             logger.error(f"Error in course enrollment: {str(e)}")
             return {"error": str(e)}, 500
 
+def register_courses(student_id, courses):
+    """
+    التحقق من طلب التسجيل وكتابة التسجيلات في الجلسة الحالية دون حفظها
+
+    يستخدمها التسجيل المباشر وعامل طابور التسجيل (عدة طلبات في معاملة واحدة)
+
+    Args:
+        student_id (int): معرف الطالب
+        courses (list): معرفات المواد المطلوبة
+
+    Returns:
+        tuple: (نص الاستجابة, رمز الحالة, PendingRegistration للمقاعد والساعات المحجوزة أو None)
+    """
+    # التحقق من وجود الطالب
+    student = Student.query.get(student_id)
+    if not student:
+        return {"error": "الطالب غير موجود"}, 404, None
+    
+    # التحقق من أهلية الطالب للمواد المطلوبة دون تشغيل التوصيات الكاملة
+    try:
+        invalid_courses = check_registration_eligibility(get_student_data(student_id), courses)
+    except ValidationError as e:
+        return {"error": str(e)}, 400, None
+    
+    logger.debug(f"Requested course IDs: {courses}, invalid: {invalid_courses}")
+    
+    # التحقق من أن جميع المواد المطلوبة موجودة في قائمة التوصيات
+    if invalid_courses:
+        return {
+            "error": "لا يمكن تسجيل بعض المواد لأنها غير موجودة في قائمة التوصيات",
+            "invalid_courses": invalid_courses
+        }, 400, None
+    
+    # الحصول على الفصل الدراسي الحالي
+    current_semester_number, semester_name = get_current_semester()
+    
+    # ساعات المواد المطلوبة الموجودة في استعلام واحد
+    requested_courses = dict(
+        db.session.query(Course.Id, Course.Credits).filter(Course.Id.in_(courses)).all()
+    )
+    
+    # جميع تسجيلات الطالب النشطة في الفصل الحالي في استعلام واحد
+    active_courses = get_active_courses(student_id, semester_name)
+    existing_courses = active_courses.intersection(courses)
+    
+    # المواد الجديدة فقط (تخطي المواد المسجلة بالفعل وغير الموجودة)
+    enrollments = [
+        course_id for course_id in dict.fromkeys(courses)
+        if course_id in requested_courses and course_id not in existing_courses
+    ]
+    
+    if not enrollments:
+        return {"message": "لم يتم تسجيل أي مواد جديدة. قد تكون المواد مسجلة بالفعل."}, 200, None
+
+    # التحقق من عدم تعارض مواعيد المحاضرات مع المواد المسجلة ومع بعضها
+    conflicts = get_timetable_index().conflicts(enrollments, active_courses)
+    if conflicts:
+        return {
+            "error": "يوجد تعارض في مواعيد المحاضرات",
+            "conflicts": [
+                {"course_id": course_id, "conflicts_with": other}
+                for course_id, other in conflicts
+            ]
+        }, 422, None
+
+    # حساب عدد الساعات المطلوبة للمواد الجديدة
+    requested_credits = sum(requested_courses[course_id] or 0 for course_id in enrollments)
+    
+    # إضافة الساعات ذريًا إلى سجل الطالب في Redis إذا لم تتجاوز الحد الأقصى
+    charge, current_credits, max_credits = charge_credits(
+        student_id, semester_name, requested_credits,
+        lambda: (get_current_enrolled_credits(student_id, semester_name), get_max_credits(student))
+    )
+    
+    # التحقق من عدم تجاوز الحد الأقصى للساعات
+    if charge is None:
+        return {
+            "error": f"لا يمكن تسجيل هذه المواد. الحد الأقصى المسموح به هو {max_credits} ساعة.",
+            "current_credits": current_credits,
+            "requested_credits": requested_credits,
+            "max_credits": max_credits
+        }, 400, None
+
+    # حجز المقاعد ذريًا قبل الكتابة في قاعدة البيانات
+    try:
+        reservation, full_course = reserve_seats(enrollments)
+    except Exception:
+        cancel_charge(charge)
+        raise
+    if reservation is None:
+        cancel_charge(charge)
+        return {
+            "error": "لا توجد مقاعد متاحة في المادة",
+            "course_id": full_course
+        }, 409, None
+    pending = PendingRegistration(reservation, charge)
+    
+    # تسجيل جميع المواد بجملة INSERT واحدة
+    try:
+        added_date = datetime.now().date()
+        db.session.execute(insert(Enrollment), [
+            {
+                "StudentId": student_id,
+                "CourseId": course_id,
+                "Semester": semester_name,
+                "NumberOFSemster": str(current_semester_number),
+                "AddedEnrollmentDate": added_date,
+                "IsCompleted": "قيد الدراسة"
+            }
+            for course_id in enrollments
+        ])
+    except Exception:
+        release_reserved_seats(pending)
+        raise
+
+    return {
+        "message": f"تم تسجيل {len(enrollments)} مواد بنجاح",
+        "enrolled_courses": enrollments
+    }, 201, pending
+
+class PendingRegistration:
+    """
+    المقاعد والساعات المحجوزة لطلب تسجيل لم يُحفظ بعد
+
+    Args:
+        reservation (SeatReservation): المقاعد المحجوزة
+        charge (CreditCharge): الساعات المضافة إلى سجل الطالب
+    """
+
+    def __init__(self, reservation, charge):
+        self.reservation = reservation
+        self.charge = charge
+
+def complete_registration(student_id, pending):
+    """تأكيد المقاعد والساعات المحجوزة وإلغاء توصيات الطالب ومراجعة تخرجه بعد حفظ التسجيلات"""
+    commit_charge(pending.charge)
+    reservation = pending.reservation
+    try:
+        # يُحدّث CurrentEnrolledStudents لاحقًا من عدد التسجيلات
+        confirm_reservation(reservation)
+    except Exception as e:
+        logger.error(f"Error confirming seats for courses {reservation.course_ids}: {str(e)}")
+    invalidate_recommendations(student_id)
+    invalidate_graduation_audit(student_id)
+
+def release_reserved_seats(pending):
+    """إلغاء حجز المقاعد والساعات بعد فشل حفظ التسجيلات"""
+    if pending is None:
+        return
+    cancel_charge(pending.charge)
+    reservation = pending.reservation
+    try:
+        cancel_reservation(reservation)
+    except Exception as e:
+        logger.error(f"Error releasing seats for courses {reservation.course_ids}: {str(e)}")
+
+class EnrollmentTicket(Resource):
+    def get(self, ticket_id):
+        """حالة طلب تسجيل في الطابور ونتيجته"""
+        try:
+            ticket = get_ticket(ticket_id)
+            if ticket is None:
+                return {"error": "التذكرة غير موجودة أو انتهت صلاحيتها"}, 404
+            return ticket, 200
+        except Exception as e:
+            logger.error(f"Error getting registration ticket {ticket_id}: {str(e)}")
+            return {"error": f"حدث خطأ: {str(e)}"}, 500
+
 class DeleteEnrollment(Resource):
+    decorators = enrollment_write_limits
+
+    @idempotent
     def delete(self, student_id):
         try:
-            # التحقق من فترة التسجيل
-            enrollment_active, message = check_enrollment_period()
+            # التحقق من فترة التسجيل الخاصة بالطالب
+            enrollment_active, message = check_enrollment_period(Student.query.get(student_id))
             if not enrollment_active:
                 return {"error": "لا يمكن حذف المواد. " + message}, 400
 
@@ -570,18 +836,28 @@ class DeleteEnrollment(Resource):
                 enrollment.DeletedEnrollmentDate = datetime.now().date()
                 enrollment.IsCompleted = "تم الحذف"  # تحديث حالة المادة
                 
-                # تحديث عدد الطلاب المسجلين في المادة
-                course = Course.query.get(course_id)
-                if course and hasattr(course, 'CurrentEnrolledStudents') and course.CurrentEnrolledStudents > 0:
-                    course.CurrentEnrolledStudents -= 1
-                
                 deleted_courses.append(course_id)
             
             if not deleted_courses:
                 return {"message": "لم يتم حذف أي مواد. قد تكون المواد غير مسجلة أو تم حذفها بالفعل."}, 200
+
+            # ساعات المواد المحذوفة في استعلام واحد
+            deleted_credits = db.session.query(func.coalesce(func.sum(Course.Credits), 0)).filter(
+                Course.Id.in_(deleted_courses)
+            ).scalar()
                 
             # حفظ التغييرات
             db.session.commit()
+
+            # إعادة المقاعد إلى مخزون Redis، أو إنقاص العداد في قاعدة البيانات إذا لم يكن متاحًا
+            release_seats(deleted_courses)
+            release_credits(student_id, semester_name, int(deleted_credits))
+            invalidate_recommendations(student_id)
+            invalidate_graduation_audit(student_id)
+
+            # تسجيل صاحب الأولوية في قائمة انتظار كل مادة تحرر فيها مقعد
+            for course_id in deleted_courses:
+                promote_from_waitlist(course_id)
             
             return {"message": f"تم حذف {len(deleted_courses)} مواد بنجاح", "deleted_courses": deleted_courses}, 200
             
@@ -590,53 +866,211 @@ class DeleteEnrollment(Resource):
             logger.error(f"Error in delete enrollment: {str(e)}")
             return {"error": str(e)}, 500
 
-class GraduationEligibility(Resource):
+# عدد الطلاب الذين تتم محاولة ترقيتهم لكل مقعد متحرر (المستبعدون لعدم الأهلية لا يأخذون المقعد)
+WAITLIST_PROMOTION_ATTEMPTS = 5
+
+def promote_from_waitlist(course_id):
+    """
+    تسجيل أول طالب مؤهل في قائمة انتظار المادة بعد تحرر مقعد
+
+    Returns:
+        int: معرف الطالب الذي تم تسجيله أو None
+    """
+    for _ in range(WAITLIST_PROMOTION_ATTEMPTS):
+        try:
+            entry = pop_waitlist(course_id)
+        except Exception as e:
+            logger.error(f"Error reading waitlist for course {course_id}: {str(e)}")
+            return None
+        if entry is None:
+            return None
+
+        student_id, priority = entry
+        try:
+            result, status_code, reservation = register_courses(student_id, [course_id])
+            if status_code == 201:
+                try:
+                    db.session.commit()
+                except Exception:
+                    release_reserved_seats(reservation)
+                    raise
+                complete_registration(student_id, reservation)
+                record_waitlist_outcome(student_id, course_id, WAITLIST_PROMOTED, result)
+                logger.info(f"Promoted student {student_id} from waitlist of course {course_id}")
+                return student_id
+
+            db.session.rollback()
+            if status_code == 409:
+                # أخذ طالب آخر المقعد، يبقى الطالب في مكانه
+                requeue_waitlist(student_id, course_id, priority)
+                return None
+
+            # عدم الأهلية أو تعارض المواعيد (422) أو تجاوز الساعات: يُستبعد الطالب ويُجرب التالي
+            record_waitlist_outcome(student_id, course_id, WAITLIST_REMOVED, result)
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"Error promoting student {student_id} for course {course_id}: {str(e)}")
+            requeue_waitlist(student_id, course_id, priority)
+            return None
+
+    return None
+
+class CourseWaitlist(Resource):
+    def post(self, student_id, course_id):
+        """الانضمام إلى قائمة انتظار مادة ممتلئة"""
+        try:
+            enrollment_active, message = check_enrollment_period(Student.query.get(student_id))
+            if not enrollment_active:
+                return {"error": "لا يمكن الانضمام لقائمة الانتظار. " + message}, 400
+
+            student_data = get_student_data(student_id)
+            if check_registration_eligibility(student_data, [course_id]):
+                return {"error": "الطالب غير مؤهل لتسجيل هذه المادة"}, 400
+
+            offering = get_course_offerings([course_id]).get(course_id)
+            if not offering:
+                return {"error": "المادة غير موجودة"}, 404
+            if offering["available_seats"] > 0:
+                return {
+                    "error": "توجد مقاعد متاحة في المادة، يمكن التسجيل مباشرة",
+                    "available_seats": offering["available_seats"]
+                }, 400
+
+            position = join_waitlist(
+                student_id, course_id, waitlist_priority(student_data, course_id, get_course_data())
+            )
+            return {
+                "message": "تمت الإضافة إلى قائمة الانتظار",
+                "position": position
+            }, 201
+
+        except ValidationError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            logger.error(f"Error joining waitlist for student {student_id}, course {course_id}: {str(e)}")
+            return {"error": f"حدث خطأ: {str(e)}"}, 500
+
+    def get(self, student_id, course_id):
+        """ترتيب الطالب في قائمة الانتظار أو نتيجة انتظاره"""
+        try:
+            status = get_waitlist_status(student_id, course_id)
+            if status is None:
+                return {"error": "الطالب ليس في قائمة انتظار هذه المادة"}, 404
+            return status, 200
+        except Exception as e:
+            logger.error(f"Error getting waitlist status for student {student_id}, course {course_id}: {str(e)}")
+            return {"error": f"حدث خطأ: {str(e)}"}, 500
+
+    def delete(self, student_id, course_id):
+        """الخروج من قائمة انتظار المادة"""
+        try:
+            if not leave_waitlist(student_id, course_id):
+                return {"error": "الطالب ليس في قائمة انتظار هذه المادة"}, 404
+            return {"message": "تم الخروج من قائمة الانتظار"}, 200
+        except Exception as e:
+            logger.error(f"Error leaving waitlist for student {student_id}, course {course_id}: {str(e)}")
+            return {"error": f"حدث خطأ: {str(e)}"}, 500
+
+# مولد الجداول: عدد الجداول المعادة والحد الأقصى للمواد المرشحة ووزن المواد الإجبارية
+TIMETABLES_DEFAULT_K = 3
+TIMETABLES_MAX_K = 10
+TIMETABLES_MAX_CANDIDATES = 16
+TIMETABLES_MANDATORY_WEIGHT = 2
+
+class GeneratedTimetables(Resource):
     def get(self, student_id):
+        """أفضل جداول بدون تعارض من المواد المقترحة للطالب ضمن الحد الأقصى للساعات"""
         try:
-            # 1. التحقق من وجود الطالب
-            student = db.session.query(Student).get(student_id)
+            k = request.args.get('k', TIMETABLES_DEFAULT_K, type=int)
+            if not 1 <= k <= TIMETABLES_MAX_K:
+                return {"error": f"k يجب أن تكون بين 1 و {TIMETABLES_MAX_K}"}, 400
+
+            student = Student.query.get(student_id)
             if not student:
                 return {"error": "الطالب غير موجود"}, 404
 
-            # 2. حساب مجموع الساعات المكتملة
-            total_credits = db.session.query(func.sum(Student.CreditsCompleted))\
-                .filter(Student.Id == student_id)\
-                .scalar() or 0
-            
-            # 3. التحقق من المواد الإلزامية
-            completed_courses = db.session.query(Enrollment, Course)\
-                .join(Course, Enrollment.CourseId == Course.Id)\
-                .filter(
-                    Enrollment.StudentId == student_id,
-                    Enrollment.IsCompleted == 'ناجح'
-                ).all()
+            student_data = get_student_data(student_id)
+            available_courses = get_available_courses(
+                student_data["current_semester"],
+                student_data["department_id"]
+            )
+            course_data = get_course_data()
+            result = {"mandatory": [], "elective": []}
+            if available_courses:
+                result = recommend_courses(student_data, available_courses, course_data)
 
-            mandatory_courses = db.session.query(Course)\
-                .join(CourseDepartment, Course.Id == CourseDepartment.CourseId)\
-                .filter(
-                    CourseDepartment.DepartmentId == student.DepartmentId,
-                    CourseDepartment.IsMandatory == True
-                ).all()
+            _, semester_name = get_current_semester()
+            active_courses = get_active_courses(student_id, semester_name)
+            current_credits = get_current_enrolled_credits(student_id, semester_name)
+            max_credits = get_max_credits(student)
 
-            mandatory_course_ids = {course.Id for course in mandatory_courses}
-            completed_course_ids = {course.Id for course, _ in completed_courses}
-            
-            missing_mandatory = mandatory_course_ids - completed_course_ids
+            # المواد المقترحة غير المسجلة بترتيب التوصيات (الإجباري أولاً)
+            mandatory = set(result["mandatory"])
+            candidates = [
+                course_id for course_id in result["mandatory"] + result["elective"]
+                if course_id not in active_courses
+            ][:TIMETABLES_MAX_CANDIDATES]
+            offerings = get_course_offerings(candidates)
+            credits = {course_id: offerings[course_id]["credits"] or 0 for course_id in candidates if course_id in offerings}
+            values = {
+                course_id: (course_credits + 1) * (TIMETABLES_MANDATORY_WEIGHT if course_id in mandatory else 1)
+                for course_id, course_credits in credits.items()
+            }
+
+            timetables = generate_timetables(
+                get_timetable_index(), values, credits,
+                max(max_credits - current_credits, 0), k, active_courses
+            )
+
+            return {
+                "current_credits": current_credits,
+                "max_credits": max_credits,
+                "timetables": [
+                    {
+                        "courses": [
+                            {
+                                "id": course_id,
+                                "name": course_data.get(course_id, {}).get("name", "غير محدد"),
+                                "code": course_data.get(course_id, {}).get("code", "غير محدد"),
+                                "credits": credits[course_id],
+                                "نوع_المادة": "اجباري" if course_id in mandatory else "اختياري"
+                            }
+                            for course_id in courses
+                        ],
+                        "added_credits": added_credits,
+                        "total_credits": current_credits + added_credits
+                    }
+                    for _, added_credits, courses in timetables if courses
+                ]
+            }, 200
+
+        except ValidationError as e:
+            return {"error": str(e)}, 400
+        except Exception as e:
+            logger.error(f"Error generating timetables for student {student_id}: {str(e)}")
+            return {"error": f"حدث خطأ: {str(e)}"}, 500
+
+class GraduationEligibility(Resource):
+    def get(self, student_id):
+        try:
+            # مراجعة التخرج المخزنة للطالب (تُحسب مرة واحدة لجميع استجابات التخرج)
+            audit = get_graduation_audit(student_id)
+            if audit is None:
+                return {"error": "الطالب غير موجود"}, 404
 
-            # 4. التحقق من الأهلية
-            is_eligible = total_credits >= 136 and not missing_mandatory
+            total_credits = audit.completed_credits
 
             return {
                 "student_id": student_id,
-                "student_name": student.Name,
+                "student_name": audit.student["name"],
                 "total_credits": total_credits,
-                "required_credits": 136,
-                "completed_mandatory_courses": len(mandatory_course_ids - missing_mandatory),
-                "total_mandatory_courses": len(mandatory_course_ids),
-                "is_eligible": is_eligible,
+                "required_credits": audit.required_credits,
+                "completed_mandatory_courses": audit.completed_mandatory,
+                "total_mandatory_courses": audit.total_mandatory,
+                "is_eligible": audit.is_eligible,
                 "reasons": [
-                    *(["الساعات المكتملة أقل من 136"] if total_credits < 136 else []),
-                    *(["توجد مواد إلزامية غير مكتملة"] if missing_mandatory else [])
+                    *([f"الساعات المكتملة أقل من {audit.required_credits}"] if total_credits < audit.required_credits else []),
+                    *(["توجد مواد إلزامية غير مكتملة"] if audit.missing_mandatory else [])
                 ]
             }, 200
 
@@ -646,36 +1080,38 @@ class GraduationEligibility(Resource):
 
 
 class GraduationRequirements(Resource):
+    decorators = low_priority_limits
+
     def get(self, student_id):
         try:
-            # التحقق من وجود الطالب
-            student = Student.query.get(student_id)
-            if not student:
+            # مراجعة التخرج المخزنة للطالب (تُحسب مرة واحدة لجميع استجابات التخرج)
+            audit = get_graduation_audit(student_id)
+            if audit is None:
                 return {"error": "الطالب غير موجود"}, 404
+            student = audit.student
             
-            # الحصول على معلومات القسم
-            department = Department.query.get(student.DepartmentId)
-            if not department:
+            # التحقق من وجود القسم
+            if student["department_name"] is None:
                 return {"error": "القسم غير موجود"}, 404
             
             # الحصول على الفصل الدراسي الحالي للطالب
-            current_semester = student.Semester
+            current_semester = student["semester"]
             
-            # الحصول على المعدل التراكمي الحالي للطالب
-            current_gpa = self._get_current_gpa(student)
+            # المواد التي اجتازها الطالب
+            completed_courses = audit.completed
             
-            # الحصول على المواد التي اجتازها الطالب
-            completed_courses = self._get_completed_courses(student_id)
+            # المعدل التراكمي الحالي من درجات المواد المكتملة
+            current_gpa = audit.gpa
             
             # حساب عدد الساعات المكتملة
-            if hasattr(student, 'CreditsCompleted') and student.CreditsCompleted is not None and student.CreditsCompleted > 0:
-                completed_credits = student.CreditsCompleted
+            if audit.completed_credits > 0:
+                completed_credits = audit.completed_credits
             else:
                 # حساب الساعات المكتملة من المواد المكتملة
                 completed_credits = sum(course.get('credits', 0) for course in completed_courses)
             
-            # تحديد إجمالي الساعات المطلوبة للتخرج (ثابت 136 ساعة للبكالوريوس)
-            total_required_credits = 136
+            # إجمالي الساعات المطلوبة للتخرج
+            total_required_credits = audit.required_credits
             
             # حساب الساعات المتبقية
             remaining_credits = max(0, total_required_credits - completed_credits)
@@ -686,8 +1122,8 @@ class GraduationRequirements(Resource):
             # تحديد حالة المعدل التراكمي
             gpa_status, gpa_message = self._check_gpa_status(current_gpa)
             
-            # الحصول على المواد المتبقية المطلوبة
-            remaining_courses = self._get_remaining_required_courses(student_id, department.Id)
+            # المواد المتبقية المطلوبة
+            remaining_courses = audit.remaining
             
             # تصنيف المواد المتبقية حسب النوع (إجباري، اختياري)
             categorized_remaining_courses = self._categorize_remaining_courses(remaining_courses)
@@ -710,9 +1146,9 @@ class GraduationRequirements(Resource):
             
             return {
                 "student_info": {
-                    "id": student.Id,
-                    "name": student.Name,
-                    "department": department.Name,
+                    "id": student["id"],
+                    "name": student["name"],
+                    "department": student["department_name"],
                     "current_semester": current_semester,
                     "current_gpa": float(current_gpa)  # تحويل المعدل إلى عدد عشري
                 },
@@ -734,146 +1170,6 @@ class GraduationRequirements(Resource):
             logger.error(f"Error in graduation requirements: {str(e)}")
             return {"error": f"حدث خطأ: {str(e)}"}, 500
     
-    def _get_current_gpa(self, student):
-        """
-        الحصول على المعدل التراكمي الحالي للطالب
-        """
-        try:
-            # الحصول على المعدل التراكمي
-            if hasattr(student, 'GPA') and student.GPA is not None:
-                return float(student.GPA)
-            
-            # إذا لم يكن هناك معدل في حقل GPA، نحاول حسابه من المواد المكتملة
-            enrollments = Enrollment.query.filter_by(
-                StudentId=student.Id,
-                IsCompleted="ناجح"
-            ).all()
-            
-            if not enrollments:
-                return 0.0
-            
-            total_points = 0
-            total_credits = 0
-            
-            for enrollment in enrollments:
-                course = Course.query.get(enrollment.CourseId)
-                if course and hasattr(course, 'Credits') and hasattr(enrollment, 'Grade'):
-                    grade = float(enrollment.Grade) if enrollment.Grade is not None else 0
-                    credits = float(course.Credits) if course.Credits is not None else 0
-                    
-                    # حساب النقاط
-                    points = grade * credits
-                    
-                    total_points += points
-                    total_credits += credits
-            
-            # حساب المعدل التراكمي
-            if total_credits > 0:
-                gpa = total_points / total_credits / 25  # تحويل من 100 إلى 4.0
-                return round(gpa, 2)
-            
-            return 0.0
-        except Exception as e:
-            logger.error(f"Error getting current GPA: {str(e)}")
-            return 0.0
-    
-    def _get_completed_courses(self, student_id):
-        """
-        الحصول على المواد التي اجتازها الطالب
-        """
-        try:
-            # الحصول على الطالب
-            student = Student.query.get(student_id)
-            if not student:
-                return []
-            
-            # الحصول على معرف القسم
-            department_id = student.DepartmentId
-            
-            # الحصول على جميع التسجيلات المكتملة للطالب (حالة "ناجح")
-            enrollments = Enrollment.query.filter_by(
-                StudentId=student_id,
-                IsCompleted="ناجح"
-            ).all()
-            
-            logger.debug(f"Found {len(enrollments)} completed enrollments for student {student_id}")
-            
-            completed_courses = []
-            for enrollment in enrollments:
-                # الحصول على المادة
-                course = Course.query.get(enrollment.CourseId)
-                if course:
-                    completed_courses.append({
-                        "id": course.Id,
-                        "code": course.Code if hasattr(course, 'Code') else "",
-                        "name": course.Name,
-                        "credits": course.Credits if hasattr(course, 'Credits') else 0,
-                        "type": self._get_course_type(course.Id, department_id),
-                        "grade": enrollment.Grade if hasattr(enrollment, 'Grade') else "",
-                        "semester": enrollment.Semester if hasattr(enrollment, 'Semester') else ""
-                    })
-            
-            return completed_courses
-        except Exception as e:
-            logger.error(f"Error getting completed courses: {str(e)}")
-            return []
-    
-    def _get_course_type(self, course_id, department_id):
-        """
-        تحديد نوع المادة (إجباري أو اختياري)
-        """
-        try:
-            # البحث عن المادة في جدول CourseDepartment
-            course_department = CourseDepartment.query.filter_by(
-                CourseId=course_id,
-                DepartmentId=department_id
-            ).first()
-            
-            # إذا وجدنا المادة، نحدد نوعها
-            if course_department and hasattr(course_department, 'IsMandatory'):
-                return "إجباري" if course_department.IsMandatory == 1 else "اختياري"
-            
-            # إذا لم نجد المادة، نفترض أنها إجبارية
-            return "إجباري"
-        except Exception as e:
-            logger.error(f"Error getting course type: {str(e)}")
-            return "إجباري"
-    
-    def _get_remaining_required_courses(self, student_id, department_id):
-        """
-        الحصول على المواد المتبقية المطلوبة للتخرج
-        """
-        try:
-            # الحصول على المواد المكتملة
-            completed_courses = self._get_completed_courses(student_id)
-            completed_course_ids = [course['id'] for course in completed_courses]
-            
-            # الحصول على جميع المواد المطلوبة للقسم
-            course_departments = CourseDepartment.query.filter_by(DepartmentId=department_id).all()
-            
-            remaining_courses = []
-            for course_dept in course_departments:
-                # تخطي المواد المكتملة
-                if course_dept.CourseId in completed_course_ids:
-                    continue
-                
-                # الحصول على المادة
-                course = Course.query.get(course_dept.CourseId)
-                if course:
-                    remaining_courses.append({
-                        "id": course.Id,
-                        "code": course.Code if hasattr(course, 'Code') else "",
-                        "name": course.Name,
-                        "credits": course.Credits if hasattr(course, 'Credits') else 0,
-                        "type": "إجباري" if course_dept.IsMandatory == 1 else "اختياري",
-                        "description": course.Description if hasattr(course, 'Description') else ""
-                    })
-            
-            return remaining_courses
-        except Exception as e:
-            logger.error(f"Error getting remaining required courses: {str(e)}")
-            return []
-    
     def _categorize_remaining_courses(self, remaining_courses):
         """
         تصنيف المواد المتبقية حسب النوع
@@ -1002,12 +1298,11 @@ class RecommendCoursesWithCredits(Resource):
             # الحصول على المواد المتاحة للفصل الدراسي الحالي وقسم الطالب
             available_courses = get_available_courses(student_data["current_semester"], student_data["department_id"])
 
-            # الحصول على المتطلبات السابقة وبيانات المواد
-            prerequisites = get_prerequisites()
+            # الحصول على بيانات المواد
             course_data = get_course_data()
 
             # الحصول على المواد الموصى بها
-            result = recommend_courses(student_data, available_courses, course_data, prerequisites)
+            result = recommend_courses(student_data, available_courses, course_data)
             
             # التحقق من شكل البيانات
             if isinstance(result, dict) and 'recommendations' in result and isinstance(result['recommendations'], list):
@@ -1026,32 +1321,34 @@ class RecommendCoursesWithCredits(Resource):
             logger.error(f"Error in RecommendCoursesWithCredits: {str(e)}")
             return {"error": str(e)}, 500
 
+def get_active_courses(student_id, semester_name):
+    """معرفات المواد المسجلة حاليًا للطالب في الفصل الدراسي المحدد"""
+    return {
+        course_id for (course_id,) in db.session.query(Enrollment.CourseId).filter(
+            Enrollment.StudentId == student_id,
+            Enrollment.Semester == semester_name,
+            Enrollment.DeletedEnrollmentDate == None  # فقط التسجيلات النشطة
+        ).all()
+    }
+
 def get_current_enrolled_credits(student_id, semester_name):
     """
     حساب عدد الساعات المسجلة حاليًا للطالب في الفصل الدراسي المحدد
     """
     try:
-        # الحصول على جميع التسجيلات النشطة للطالب في الفصل الدراسي المحدد
-        enrollments = Enrollment.query.filter_by(
-            StudentId=student_id,
-            Semester=semester_name,
-            DeletedEnrollmentDate=None,  # فقط التسجيلات النشطة
-            IsCompleted="قيد الدراسة"    # فقط المواد قيد الدراسة
-        ).all()
-        
-        # طباعة معلومات تصحيح
-        logger.debug(f"Found {len(enrollments)} active enrollments for student {student_id} in semester {semester_name}")
-        
-        # حساب مجموع الساعات
-        total_credits = 0
-        for enrollment in enrollments:
-            course = Course.query.get(enrollment.CourseId)
-            if course and hasattr(course, 'Credits'):
-                total_credits += course.Credits
-                logger.debug(f"Course {course.Id} ({course.Name}) has {course.Credits} credits")
+        # مجموع ساعات التسجيلات النشطة للطالب في الفصل الدراسي المحدد في استعلام واحد
+        total_credits = (db.session.query(func.coalesce(func.sum(Course.Credits), 0))
+                        .join(Enrollment, Enrollment.CourseId == Course.Id)
+                        .filter(
+                            Enrollment.StudentId == student_id,
+                            Enrollment.Semester == semester_name,
+                            Enrollment.DeletedEnrollmentDate == None,  # فقط التسجيلات النشطة
+                            Enrollment.IsCompleted == "قيد الدراسة"    # فقط المواد قيد الدراسة
+                        )
+                        .scalar())
         
         logger.debug(f"Total credits for student {student_id} in semester {semester_name}: {total_credits}")
-        return total_credits
+        return int(total_credits)
     except Exception as e:
         logger.error(f"Error calculating current enrolled credits: {str(e)}")
         return 0  # في حالة حدوث خطأ، نفترض أن الطالب لم يسجل أي ساعات
@@ -1098,6 +1395,8 @@ def get_max_credits(student):
         return 18  # قيمة افتراضية في حالة حدوث خطأ
 
 class AcademicPerformanceEvaluation(Resource):
+    decorators = low_priority_limits
+
     def get(self, student_id):
         try:
             # التحقق من وجود الطالب
@@ -1683,53 +1982,25 @@ class GraduationCheckResource(Resource):
     def get(self, student_id):
         """التحقق من استيفاء متطلبات التخرج للطالب"""
         try:
-            # الحصول على بيانات الطالب
-            student = Student.query.get(student_id)
-            if not student:
+            # مراجعة التخرج المخزنة للطالب (تُحسب مرة واحدة لجميع استجابات التخرج)
+            audit = get_graduation_audit(student_id)
+            if audit is None:
                 return {"error": "الطالب غير موجود"}, 404
+            student = audit.student
             
-            # الحصول على متطلبات التخرج للقسم
-            department = Department.query.get(student.DepartmentId)
-            if not department:
+            # التحقق من وجود القسم
+            if student["department_name"] is None:
                 return {"error": "القسم غير موجود"}, 404
             
-            # الحصول على الساعات المعتمدة المطلوبة للتخرج
-            required_credits = department.RequiredCredits if hasattr(department, 'RequiredCredits') else 136
-            
-            # حساب الساعات المعتمدة المكتملة
-            completed_credits = student.CreditsCompleted if hasattr(student, 'CreditsCompleted') else 0
+            required_credits = audit.required_credits
+            completed_credits = audit.completed_credits
             
             # حساب الساعات المتبقية
             remaining_credits = required_credits - completed_credits
             
-            # الحصول على المواد الإلزامية للقسم
-            mandatory_courses = CourseDepartment.query.filter_by(
-                DepartmentId=student.DepartmentId,
-                IsMandatory=True
-            ).all()
-            
-            total_mandatory_courses = len(mandatory_courses)
-            
-            # التحقق من المواد الإلزامية المكتملة
-            completed_mandatory_courses = 0
-            incomplete_mandatory_courses = []
-            
-            for course_dept in mandatory_courses:
-                course = Course.query.get(course_dept.CourseId)
-                if not course:
-                    continue
-                
-                # التحقق مما إذا كان الطالب قد أكمل هذه المادة
-                enrollment = Enrollment.query.filter_by(
-                    StudentId=student_id,
-                    CourseId=course.Id,
-                    IsCompleted="ناجح"
-                ).first()
-                
-                if enrollment:
-                    completed_mandatory_courses += 1
-                else:
-                    incomplete_mandatory_courses.append(course.Name)
+            total_mandatory_courses = audit.total_mandatory
+            completed_mandatory_courses = audit.completed_mandatory
+            incomplete_mandatory_courses = [course["name"] for course in audit.missing_mandatory]
             
             # تحديد ما إذا كان الطالب مؤهلاً للتخرج
             is_eligible = (completed_credits >= required_credits and 
@@ -1751,11 +2022,11 @@ class GraduationCheckResource(Resource):
                     reasons.append(f"المواد الإلزامية غير المكتملة: {', '.join(courses_to_show)}")
             
             
-            print(f"Student: {student.Name}, Remaining Credits: {remaining_credits}")
+            logger.debug(f"Student: {student['name']}, Remaining Credits: {remaining_credits}")
             
             response = {
                 "student_id": student_id,
-                "student_name": student.Name,
+                "student_name": student["name"],
                 "total_credits": completed_credits,
                 "required_credits": required_credits,
                 "remaining_credits": remaining_credits,
@@ -1774,5 +2045,5 @@ class GraduationCheckResource(Resource):
             return response
             
         except Exception as e:
-            print(f"Error in graduation check: {str(e)}")
+            logger.error(f"Error in graduation check: {str(e)}")
             return {"error": f"حدث خطأ: {str(e)}"}, 500
\ No newline at end of file
@@ -0,0 +1,554 @@
+from models import db, Course, Enrollment
+from redis_config import redis_client
+from flask import current_app
+from sqlalchemy import func, update, select, case
+from sqlalchemy.exc import DBAPIError
+import threading
+import random
+import socket
+import uuid
+import time
+import os
+import logging
+
+logger = logging.getLogger(__name__)
+
+# عدد المقاعد المحجوزة والحد الأقصى لكل مادة (Redis هو المرجع أثناء التسجيل)
+SEATS_TAKEN_KEY = 'seats:taken'
+SEATS_MAX_KEY = 'seats:max'
+
+# المواد التي تغيرت مقاعدها ولم يُحدّث CurrentEnrolledStudents في قاعدة البيانات بعد
+SEATS_DIRTY_KEY = 'seats:dirty'
+
+# حجوزات لم تُؤكد أو تُلغَ بعد: مفتاح لكل حجز بمواده، ووقت انتهاء كل حجز، وعدد الحجوزات الجارية لكل مادة
+# الحجز المنتهي (توقف العامل قبل الحفظ أو الإلغاء) تُعاد مواده للعد من قاعدة البيانات
+SEATS_HOLD_KEY = 'seats:hold:{token}'
+SEATS_HOLDS_KEY = 'seats:holds'
+SEATS_INFLIGHT_KEY = 'seats:inflight'
+SEATS_HOLD_SECONDS = 120
+
+# المواد التي يُعاد عد مقاعدها من التسجيلات النشطة عندما لا يكون فيها حجوزات جارية
+SEATS_RECOUNT_KEY = 'seats:recount'
+
+# عملية واحدة فقط تنقل التغييرات إلى قاعدة البيانات
+SEATS_RECONCILER_LOCK_KEY = 'seats:reconciler:leader'
+SEATS_RECONCILER_LOCK_SECONDS = 10
+SEATS_RECONCILE_INTERVAL_SECONDS = 2
+SEATS_RECONCILE_BATCH_SIZE = 500
+
+# تعديل CurrentEnrolledStudents مباشرة عند تعذر الوصول إلى Redis:
+# جملة UPDATE شرطية في معاملة قصيرة مع إعادة المحاولة بانتظار أسي عند تعارض الأقفال
+SEAT_COUNTER_MAX_ATTEMPTS = 5
+SEAT_COUNTER_BACKOFF_SECONDS = 0.05
+
+SEATS_BACKEND_REDIS = 'redis'
+SEATS_BACKEND_DATABASE = 'database'
+
+# حجز مقعد في جميع المواد أو لا شيء مع تسجيل الحجز كحجز جارٍ
+# -1: مواد غير محملة في Redis، 0: مادة ممتلئة، 1: تم الحجز
+_RESERVE_SCRIPT = redis_client.register_script("""
+local missing = {}
+for i = 4, #ARGV do
+    local course_id = ARGV[i]
+    if redis.call('HEXISTS', KEYS[1], course_id) == 0 or redis.call('HEXISTS', KEYS[2], course_id) == 0 then
+        table.insert(missing, course_id)
+    end
+end
+if #missing > 0 then
+    table.insert(missing, 1, -1)
+    return missing
+end
+for i = 4, #ARGV do
+    local taken = tonumber(redis.call('HGET', KEYS[1], ARGV[i]))
+    local max_seats = tonumber(redis.call('HGET', KEYS[2], ARGV[i]))
+    if taken >= max_seats then
+        return {0, ARGV[i]}
+    end
+end
+local course_ids = {}
+for i = 4, #ARGV do
+    redis.call('HINCRBY', KEYS[1], ARGV[i], 1)
+    redis.call('HINCRBY', KEYS[3], ARGV[i], 1)
+    table.insert(course_ids, ARGV[i])
+end
+redis.call('SET', KEYS[5], table.concat(course_ids, ','), 'EX', ARGV[3])
+redis.call('ZADD', KEYS[4], ARGV[2], ARGV[1])
+return {1}
+""")
+
+# إنهاء الحجز بعد الحفظ (ARGV[2] = 0) أو الإلغاء (ARGV[2] = 1)
+# إذا كان الحجز قد انتهى واستُعيد، تُعاد المواد للعد من قاعدة البيانات بدلاً من تعديل العدد
+_FINISH_HOLD_SCRIPT = redis_client.register_script("""
+for i = 3, #ARGV do
+    redis.call('SADD', KEYS[5], ARGV[i])
+end
+if redis.call('ZREM', KEYS[3], ARGV[1]) == 0 then
+    for i = 3, #ARGV do
+        redis.call('SADD', KEYS[6], ARGV[i])
+    end
+    return 0
+end
+redis.call('DEL', KEYS[4])
+for i = 3, #ARGV do
+    local inflight = tonumber(redis.call('HGET', KEYS[2], ARGV[i]) or '0')
+    if inflight > 0 then
+        redis.call('HINCRBY', KEYS[2], ARGV[i], -1)
+    end
+    if ARGV[2] == '1' then
+        local taken = tonumber(redis.call('HGET', KEYS[1], ARGV[i]))
+        if taken and taken > 0 then
+            redis.call('HINCRBY', KEYS[1], ARGV[i], -1)
+        end
+    end
+end
+return 1
+""")
+
+# استعادة حجز منتهي: لم يعد جاريًا، ومواده تُعاد للعد من قاعدة البيانات
+_EXPIRE_HOLD_SCRIPT = redis_client.register_script("""
+if redis.call('ZREM', KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+local course_ids = redis.call('GET', KEYS[2])
+redis.call('DEL', KEYS[2])
+if course_ids then
+    for course_id in string.gmatch(course_ids, '[^,]+') do
+        local inflight = tonumber(redis.call('HGET', KEYS[3], course_id) or '0')
+        if inflight > 0 then
+            redis.call('HINCRBY', KEYS[3], course_id, -1)
+        end
+        redis.call('SADD', KEYS[4], course_id)
+    end
+end
+return 1
+""")
+
+# إعادة عد المادة فقط إذا لم يكن فيها حجوزات جارية (غير محفوظة في قاعدة البيانات بعد)
+_RECOUNT_SCRIPT = redis_client.register_script("""
+if tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or '0') > 0 then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('SREM', KEYS[3], ARGV[1])
+return 1
+""")
+
+_RELEASE_SCRIPT = redis_client.register_script("""
+for _, course_id in ipairs(ARGV) do
+    local taken = tonumber(redis.call('HGET', KEYS[1], course_id))
+    if taken and taken > 0 then
+        redis.call('HINCRBY', KEYS[1], course_id, -1)
+    end
+    redis.call('SADD', KEYS[2], course_id)
+end
+return 1
+""")
+
+# الحد الأقصى يُكتب دائمًا، وعدد المحجوز (المسجلون + الحجوزات الجارية) فقط إذا لم يكن موجودًا
+# حتى لا تضيع حجوزات قائمة
+_LOAD_SCRIPT = redis_client.register_script("""
+for i = 1, #ARGV, 3 do
+    redis.call('HSET', KEYS[2], ARGV[i], ARGV[i + 1])
+    local inflight = tonumber(redis.call('HGET', KEYS[3], ARGV[i]) or '0')
+    redis.call('HSETNX', KEYS[1], ARGV[i], tonumber(ARGV[i + 2]) + inflight)
+end
+return 1
+""")
+
+
+def _active_enrollment_filter():
+    return (
+        Enrollment.IsCompleted == "قيد الدراسة",
+        Enrollment.DeletedEnrollmentDate == None
+    )
+
+
+def _active_counts(course_ids):
+    """عدد التسجيلات النشطة لكل مادة في استعلام واحد"""
+    return dict(db.session.query(Enrollment.CourseId, func.count(Enrollment.Id))
+                .filter(Enrollment.CourseId.in_(course_ids), *_active_enrollment_filter())
+                .group_by(Enrollment.CourseId)
+                .all())
+
+
+def _load_seats(course_ids):
+    """تحميل الحد الأقصى وعدد المسجلين من قاعدة البيانات للمواد غير الموجودة في Redis"""
+    max_seats = dict(db.session.query(Course.Id, Course.MaxSeats).filter(Course.Id.in_(course_ids)).all())
+    counts = _active_counts(course_ids)
+
+    args = []
+    for course_id in course_ids:
+        # المواد غير الموجودة تُحمّل بحد أقصى 0 حتى لا تُحجز
+        args.extend([course_id, max_seats.get(course_id) or 0, counts.get(course_id, 0)])
+    _LOAD_SCRIPT(keys=[SEATS_TAKEN_KEY, SEATS_MAX_KEY, SEATS_INFLIGHT_KEY], args=args)
+
+
+class SeatReservation:
+    """
+    مقاعد محجوزة لطلب تسجيل لم يُحفظ بعد
+
+    Args:
+        course_ids (list): معرفات المواد
+        backend (str): مكان الحجز (Redis أو عداد قاعدة البيانات)
+        token (str): معرف الحجز الجاري في Redis
+    """
+
+    def __init__(self, course_ids, backend, token=None):
+        self.course_ids = course_ids
+        self.backend = backend
+        self.token = token
+
+
+class _SeatsFull(Exception):
+    pass
+
+
+def _taken_seats_expression():
+    """الأكبر من CurrentEnrolledStudents وعدد التسجيلات النشطة للمادة"""
+    counter = func.coalesce(Course.CurrentEnrolledStudents, 0)
+    active_count = (select(func.count(Enrollment.Id))
+                    .where(Enrollment.CourseId == Course.Id, *_active_enrollment_filter())
+                    .correlate(Course)
+                    .scalar_subquery())
+    return case((counter > active_count, counter), else_=active_count)
+
+
+def _update_seat_counters(course_ids, delta):
+    """
+    تعديل CurrentEnrolledStudents لجميع المواد بجملة UPDATE شرطية واحدة في معاملة مستقلة
+
+    الزيادة تتم فقط إذا كان في كل مادة مقعد متاح (جميع المواد أو لا شيء)، والنقصان
+    لا ينزل عن الصفر. عند تعارض الأقفال تُعاد المحاولة بانتظار أسي محدود
+
+    Returns:
+        bool: False إذا كانت إحدى المواد ممتلئة
+    """
+    counter = func.coalesce(Course.CurrentEnrolledStudents, 0)
+    if delta > 0:
+        # العداد يتأخر عن Redis حتى فترة المطابقة، لذلك يُقارن الأكبر من العداد (الحجوزات
+        # الجارية في قاعدة البيانات) وعدد التسجيلات النشطة الفعلي
+        taken = _taken_seats_expression()
+        condition = taken < Course.MaxSeats
+        value = taken + delta
+    else:
+        condition = counter > 0
+        value = counter + delta
+    statement = (update(Course)
+                 .where(Course.Id.in_(course_ids), condition)
+                 .values(CurrentEnrolledStudents=value))
+
+    for attempt in range(SEAT_COUNTER_MAX_ATTEMPTS):
+        try:
+            with db.engine.begin() as connection:
+                updated = connection.execute(statement).rowcount
+                if delta > 0 and updated != len(course_ids):
+                    raise _SeatsFull()
+            return True
+        except _SeatsFull:
+            return False
+        except DBAPIError as e:
+            if attempt == SEAT_COUNTER_MAX_ATTEMPTS - 1:
+                raise
+            delay = SEAT_COUNTER_BACKOFF_SECONDS * (2 ** attempt) * (1 + random.random())
+            logger.warning(f"Seat counter update conflict (attempt {attempt + 1}), retrying in {delay:.3f}s: {str(e)}")
+            time.sleep(delay)
+
+
+def _full_course(course_ids):
+    full = (db.session.query(Course.Id)
+            .filter(Course.Id.in_(course_ids),
+                    _taken_seats_expression() >= Course.MaxSeats)
+            .first())
+    return full[0] if full else course_ids[0]
+
+
+# المواد التي تغيرت مقاعدها في قاعدة البيانات أثناء تعذر الوصول إلى Redis، وتُحذف من
+# seats:taken عند عودته حتى يُعاد تحميلها من التسجيلات النشطة
+_fallback_courses = set()
+_fallback_lock = threading.Lock()
+
+
+def _mark_fallback(course_ids):
+    with _fallback_lock:
+        _fallback_courses.update(course_ids)
+
+
+def _flush_fallback():
+    """حذف المواد التي تغيرت أثناء الاعتماد على قاعدة البيانات من مخزون Redis"""
+    global _fallback_courses
+    if not _fallback_courses:
+        return
+    with _fallback_lock:
+        course_ids, _fallback_courses = _fallback_courses, set()
+    try:
+        redis_client.hdel(SEATS_TAKEN_KEY, *course_ids)
+        logger.info(f"Seat inventory recovered, reloading {len(course_ids)} courses from database")
+    except Exception:
+        _mark_fallback(course_ids)
+        raise
+
+
+def _hold_key(token):
+    return SEATS_HOLD_KEY.format(token=token)
+
+
+def _reserve_redis_seats(course_ids, token):
+    _ensure_reconciler()
+    _flush_fallback()
+    hold = [token, time.time() + SEATS_HOLD_SECONDS, SEATS_HOLD_SECONDS * 10]
+    for _ in range(3):
+        result = _RESERVE_SCRIPT(
+            keys=[SEATS_TAKEN_KEY, SEATS_MAX_KEY, SEATS_INFLIGHT_KEY, SEATS_HOLDS_KEY, _hold_key(token)],
+            args=hold + course_ids
+        )
+        status = int(result[0])
+        if status == 1:
+            return None
+        if status == 0:
+            return int(result[1])
+        _load_seats([int(course_id) for course_id in result[1:]])
+
+    raise RuntimeError("Seat inventory could not be loaded")
+
+
+def _release_redis_seats(course_ids):
+    _ensure_reconciler()
+    _flush_fallback()
+    _RELEASE_SCRIPT(keys=[SEATS_TAKEN_KEY, SEATS_DIRTY_KEY], args=course_ids)
+
+
+def _finish_hold(reservation, cancel):
+    _FINISH_HOLD_SCRIPT(
+        keys=[SEATS_TAKEN_KEY, SEATS_INFLIGHT_KEY, SEATS_HOLDS_KEY, _hold_key(reservation.token),
+              SEATS_DIRTY_KEY, SEATS_RECOUNT_KEY],
+        args=[reservation.token, 1 if cancel else 0] + reservation.course_ids
+    )
+
+
+def reserve_seats(course_ids):
+    """
+    حجز مقعد في كل مادة بشكل ذري (جميع المواد أو لا شيء)
+
+    يتم الحجز في Redis، وإذا تعذر الوصول إليه يُزاد عداد المقاعد في قاعدة البيانات
+    بجملة UPDATE شرطية
+
+    Args:
+        course_ids (list): معرفات المواد
+
+    Returns:
+        tuple: (SeatReservation أو None إذا كانت مادة ممتلئة, معرف المادة الممتلئة أو None)
+    """
+    course_ids = list(dict.fromkeys(course_ids))
+    if not course_ids:
+        return SeatReservation([], SEATS_BACKEND_REDIS), None
+
+    token = uuid.uuid4().hex
+    try:
+        full_course = _reserve_redis_seats(course_ids, token)
+        if full_course is not None:
+            return None, full_course
+        return SeatReservation(course_ids, SEATS_BACKEND_REDIS, token), None
+    except Exception as e:
+        logger.error(f"Seat inventory unavailable, reserving seats in database: {str(e)}")
+
+    _mark_fallback(course_ids)
+    if not _update_seat_counters(course_ids, 1):
+        return None, _full_course(course_ids)
+    return SeatReservation(course_ids, SEATS_BACKEND_DATABASE), None
+
+
+def cancel_reservation(reservation):
+    """إلغاء حجز المقاعد بعد فشل حفظ التسجيلات"""
+    if not reservation.course_ids:
+        return
+    if reservation.backend == SEATS_BACKEND_REDIS:
+        _finish_hold(reservation, cancel=True)
+    else:
+        _mark_fallback(reservation.course_ids)
+        _update_seat_counters(reservation.course_ids, -1)
+
+
+def confirm_reservation(reservation):
+    """تسجيل المواد التي حُفظت تسجيلاتها حتى يُحدّث عدد المسجلين في قاعدة البيانات"""
+    if reservation.course_ids and reservation.backend == SEATS_BACKEND_REDIS:
+        _finish_hold(reservation, cancel=False)
+
+
+def release_seats(course_ids):
+    """
+    إعادة مقعد في كل مادة بعد حذف التسجيل
+
+    Args:
+        course_ids (list): معرفات المواد
+    """
+    course_ids = list(dict.fromkeys(course_ids))
+    if not course_ids:
+        return
+    try:
+        _release_redis_seats(course_ids)
+    except Exception as e:
+        logger.error(f"Seat inventory unavailable, releasing seats in database: {str(e)}")
+        _mark_fallback(course_ids)
+        _update_seat_counters(course_ids, -1)
+
+
+def get_taken_seats(course_ids):
+    """
+    عدد المقاعد المحجوزة لكل مادة من Redis في طلب واحد
+
+    Args:
+        course_ids (list): معرفات المواد
+
+    Returns:
+        dict: عدد المقاعد المحجوزة لكل مادة
+    """
+    course_ids = list(dict.fromkeys(course_ids))
+    if not course_ids:
+        return {}
+
+    values = redis_client.hmget(SEATS_TAKEN_KEY, course_ids)
+    missing = [course_id for course_id, value in zip(course_ids, values) if value is None]
+    if missing:
+        _load_seats(missing)
+        values = redis_client.hmget(SEATS_TAKEN_KEY, course_ids)
+
+    return {course_id: int(value or 0) for course_id, value in zip(course_ids, values)}
+
+
+def reset_seat_limits():
+    """حذف الحدود القصوى المخزنة لتُقرأ من قاعدة البيانات بعد تعديل بيانات المواد"""
+    redis_client.delete(SEATS_MAX_KEY)
+
+
+def reset_seat_inventory():
+    """
+    إعادة عد المقاعد المحجوزة لجميع المواد من التسجيلات النشطة (للاستعادة بعد انحراف Redis)
+
+    كل مادة يُعاد عدها عندما لا يكون فيها حجوزات جارية
+
+    Returns:
+        int: عدد المواد
+    """
+    course_ids = redis_client.hkeys(SEATS_TAKEN_KEY)
+    if course_ids:
+        redis_client.sadd(SEATS_RECOUNT_KEY, *course_ids)
+    return len(course_ids)
+
+
+def recover_seat_holds(now=None):
+    """
+    استعادة الحجوزات المنتهية التي لم تُؤكد أو تُلغَ (توقف العامل قبل الحفظ أو الإلغاء)
+
+    Returns:
+        int: عدد الحجوزات المستعادة
+    """
+    tokens = redis_client.zrangebyscore(SEATS_HOLDS_KEY, '-inf', now or time.time())
+    recovered = 0
+    for token in tokens:
+        recovered += _EXPIRE_HOLD_SCRIPT(
+            keys=[SEATS_HOLDS_KEY, _hold_key(token), SEATS_INFLIGHT_KEY, SEATS_RECOUNT_KEY],
+            args=[token]
+        )
+    if recovered:
+        logger.warning(f"Recovered {recovered} abandoned seat reservations")
+    return recovered
+
+
+def recount_seats(batch_size=SEATS_RECONCILE_BATCH_SIZE):
+    """
+    إعادة عد المقاعد المحجوزة من التسجيلات النشطة للمواد المعلمة (التي لا حجوزات جارية فيها)
+
+    Returns:
+        int: عدد المواد التي أُعيد عدها
+    """
+    course_ids = redis_client.srandmember(SEATS_RECOUNT_KEY, batch_size)
+    if not course_ids:
+        return 0
+    course_ids = [int(course_id) for course_id in course_ids]
+
+    counts = _active_counts(course_ids)
+    recounted = 0
+    for course_id in course_ids:
+        recounted += _RECOUNT_SCRIPT(
+            keys=[SEATS_TAKEN_KEY, SEATS_INFLIGHT_KEY, SEATS_RECOUNT_KEY],
+            args=[course_id, counts.get(course_id, 0)]
+        )
+    db.session.rollback()
+    if recounted:
+        logger.info(f"Recounted seats for {recounted} courses from active enrollments")
+    return recounted
+
+
+def reconcile_seats(batch_size=SEATS_RECONCILE_BATCH_SIZE):
+    """
+    تحديث CurrentEnrolledStudents للمواد التي تغيرت مقاعدها بجملة UPDATE واحدة
+    من عدد التسجيلات النشطة (قاعدة البيانات تبقى المرجع)
+
+    Returns:
+        int: عدد المواد التي تم تحديثها
+    """
+    course_ids = redis_client.spop(SEATS_DIRTY_KEY, batch_size)
+    if not course_ids:
+        return 0
+    course_ids = [int(course_id) for course_id in course_ids]
+
+    try:
+        active_count = (db.session.query(func.count(Enrollment.Id))
+                        .filter(Enrollment.CourseId == Course.Id, *_active_enrollment_filter())
+                        .correlate(Course)
+                        .scalar_subquery())
+        Course.query.filter(Course.Id.in_(course_ids)).update(
+            {Course.CurrentEnrolledStudents: active_count},
+            synchronize_session=False
+        )
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        redis_client.sadd(SEATS_DIRTY_KEY, *course_ids)
+        raise
+
+    logger.debug(f"Reconciled seat counts for {len(course_ids)} courses")
+    return len(course_ids)
+
+
+def _is_leader(identity):
+    if redis_client.set(SEATS_RECONCILER_LOCK_KEY, identity, nx=True, ex=SEATS_RECONCILER_LOCK_SECONDS):
+        return True
+    if redis_client.get(SEATS_RECONCILER_LOCK_KEY) == identity:
+        redis_client.expire(SEATS_RECONCILER_LOCK_KEY, SEATS_RECONCILER_LOCK_SECONDS)
+        return True
+    return False
+
+
+def _reconcile_loop(app):
+    identity = f"{socket.gethostname()}:{os.getpid()}"
+    while True:
+        try:
+            if _is_leader(identity):
+                with app.app_context():
+                    _flush_fallback()
+                    recover_seat_holds()
+                    recount_seats()
+                    while reconcile_seats() == SEATS_RECONCILE_BATCH_SIZE:
+                        pass
+        except Exception as e:
+            logger.error(f"Error reconciling seat counts: {str(e)}")
+        time.sleep(SEATS_RECONCILE_INTERVAL_SECONDS)
+
+
+_reconciler_pid = None
+_reconciler_lock = threading.Lock()
+
+
+def _ensure_reconciler():
+    """تشغيل خيط نقل التغييرات إلى قاعدة البيانات مرة واحدة لكل عملية"""
+    global _reconciler_pid
+    if _reconciler_pid == os.getpid():
+        return
+    with _reconciler_lock:
+        if _reconciler_pid == os.getpid():
+            return
+        _reconciler_pid = os.getpid()
+        app = current_app._get_current_object()
+        thread = threading.Thread(target=_reconcile_loop, args=(app,), daemon=True, name="seat-reconciler")
+        thread.start()
@@ -1,17 +1,14 @@
 from models import db, Student, Course, Attendance, Class, Department, Enrollment, CourseDepartment
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sqlalchemy.orm import joinedload
 from datetime import datetime
-from redis_config import redis_client
 
 
 
-from functools import lru_cache
 from models import db, Student, Course, Attendance, Class, Department, Enrollment, CourseDepartment
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from sqlalchemy.orm import joinedload
+from catalog import get_catalog_snapshot
+from profiles import get_interest_profile
+from co_enrollment import get_co_enrollment_model
+from enrollment_window import get_enrollment_window
+import numpy as np
 import logging
 
 logger = logging.getLogger(__name__)
@@ -19,10 +16,16 @@ logger = logging.getLogger(__name__)
 class ValidationError(Exception):
     pass
 
-@lru_cache(maxsize=128)
+# الحد الأقصى لعدد الطلاب في طلب توصيات جماعي بقائمة معرفات
+MAX_BATCH_STUDENTS = 1000
+
+# طرق ترتيب المواد الاختيارية: تشابه الأوصاف، النجاح المشترك مع الطلاب الآخرين، أو مزيج منهما
+RANKING_MODES = ('content', 'collaborative', 'blended')
+BLENDED_CONTENT_WEIGHT = 0.5
+
 def get_student_data(student_id):
     """
-    الحصول على بيانات الطالب مع التخزين المؤقت
+    الحصول على بيانات الطالب
     
     Args:
         student_id (int): معرف الطالب
@@ -63,70 +66,131 @@ def get_student_data(student_id):
         logger.error(f"Error in get_student_data: {str(e)}")
         raise
 
-@lru_cache(maxsize=128)
+def get_students_data(student_ids=None, department_id=None, semester=None, status=None):
+    """
+    الحصول على بيانات مجموعة من الطلاب باستعلامين فقط
+
+    Args:
+        student_ids (list): معرفات الطلاب (اختياري)
+        department_id (int): معرف القسم عند عدم تحديد المعرفات
+        semester (int): الفصل الدراسي للتصفية (اختياري)
+        status (str): حالة الطالب للتصفية (اختياري)
+
+    Returns:
+        list: بيانات الطلاب بنفس شكل get_student_data
+
+    Raises:
+        ValidationError: في حالة عدم تحديد الطلاب أو القسم
+    """
+    try:
+        if student_ids:
+            if len(student_ids) > MAX_BATCH_STUDENTS:
+                raise ValidationError(f"At most {MAX_BATCH_STUDENTS} student IDs are allowed per request")
+            student_filter = [Student.Id.in_(student_ids)]
+        elif department_id:
+            student_filter = [Student.DepartmentId == department_id]
+            if semester:
+                student_filter.append(Student.Semester == semester)
+        else:
+            raise ValidationError("student_ids or department_id is required")
+
+        if status:
+            student_filter.append(Student.status == status)
+
+        students = Student.query.filter(*student_filter).order_by(Student.Id).all()
+        if not students:
+            return []
+
+        # استعلام واحد لتاريخ جميع الطلاب بدلاً من استعلامين لكل طالب
+        history = {student.Id: {"ناجح": [], "راسب": []} for student in students}
+        enrollments = (db.session.query(Enrollment.StudentId, Enrollment.CourseId, Enrollment.IsCompleted)
+                      .join(Student, Student.Id == Enrollment.StudentId)
+                      .filter(*student_filter, Enrollment.IsCompleted.in_(['ناجح', 'راسب']))
+                      .all())
+        for student_id, course_id, status in enrollments:
+            history[student_id][status].append(course_id)
+
+        return [
+            {
+                "id": student.Id,
+                "name": student.Name,
+                "department_id": student.DepartmentId,
+                "current_semester": student.Semester,
+                "gpa": getattr(student, f'GPA{student.Semester}', 0.0),
+                "completed_courses": history[student.Id]["ناجح"],
+                "failed_courses": history[student.Id]["راسب"]
+            }
+            for student in students
+        ]
+    except Exception as e:
+        logger.error(f"Error in get_students_data: {str(e)}")
+        raise
+
 def get_prerequisites():
     """
-    الحصول على المتطلبات السابقة للمواد مع التخزين المؤقت
+    الحصول على المتطلبات السابقة للمواد من نسخة بيانات المواد الحالية
     
     Returns:
         dict: قاموس يحتوي على المتطلبات السابقة لكل مادة
     """
     try:
-        prerequisites = {}
-        courses = db.session.query(Course.Id, Course.PreCourseId).all()
-
-        for course_id, pre_course_id in courses:
-            prerequisites[course_id] = [pre_course_id] if pre_course_id else []
-
-        return prerequisites
+        return get_catalog_snapshot().prerequisites
     except Exception as e:
         logger.error(f"Error in get_prerequisites: {str(e)}")
         raise
 
-@lru_cache(maxsize=128)
 def get_course_data():
     """
-    الحصول على بيانات المواد مع التخزين المؤقت
+    الحصول على بيانات المواد من نسخة بيانات المواد الحالية
     
     Returns:
         dict: قاموس يحتوي على بيانات كل مادة
     """
     try:
-        courses = (db.session.query(Course)
-                  .options(joinedload(Course.course_departments))
-                  .all())
-        
-        result = {}
-        for course in courses:
-            course_departments = course.course_departments
-
-            if course_departments:
-                for cd in course_departments:
-                    result[course.Id] = {
-                        "id": course.Id,
-                        "name": course.Name,
-                        "code": course.Code,
-                        "description": course.Description,
-                        "semester": course.Semester,
-                        "department_id": cd.DepartmentId,
-                        "is_mandatory": bool(cd.IsMandatory)
-                    }
-            else:
-                result[course.Id] = {
-                    "id": course.Id,
-                    "name": course.Name,
-                    "code": course.Code,
-                    "description": course.Description,
-                    "semester": course.Semester,
-                    "department_id": None,
-                    "is_mandatory": False
-                }
-        
-        return result
+        return get_catalog_snapshot().course_data
     except Exception as e:
         logger.error(f"Error in get_course_data: {str(e)}")
         raise
 
+def get_prerequisite_graph():
+    """
+    الحصول على مخطط المتطلبات السابقة المترجم لنسخة بيانات المواد الحالية
+
+    Returns:
+        PrerequisiteGraph: مخطط المتطلبات السابقة
+    """
+    try:
+        return get_catalog_snapshot().prerequisite_graph
+    except Exception as e:
+        logger.error(f"Error in get_prerequisite_graph: {str(e)}")
+        raise
+
+def get_eligibility_index():
+    """
+    الحصول على فهرس الأهلية (ترقيم المواد ومصفوفة المتطلبات) لنسخة بيانات المواد الحالية
+
+    Returns:
+        EligibilityIndex: فهرس الأهلية
+    """
+    try:
+        return get_catalog_snapshot().eligibility_index
+    except Exception as e:
+        logger.error(f"Error in get_eligibility_index: {str(e)}")
+        raise
+
+def get_course_index():
+    """
+    الحصول على فهرس أوصاف المواد المبني مرة واحدة لكل نسخة من بيانات المواد
+
+    Returns:
+        CourseIndex: فهرس أوصاف المواد
+    """
+    try:
+        return get_catalog_snapshot().course_index
+    except Exception as e:
+        logger.error(f"Error in get_course_index: {str(e)}")
+        raise
+
 def get_available_courses(semester, department_id):
     """
     الحصول على المواد المتاحة للفصل الدراسي والقسم
@@ -142,18 +206,24 @@ def get_available_courses(semester, department_id):
         if not semester or not department_id:
             raise ValidationError("Semester and department_id are required")
 
-        courses = (db.session.query(Course)
-                 .join(CourseDepartment, Course.Id == CourseDepartment.CourseId)
-                 .filter(Course.Semester == semester, 
-                        CourseDepartment.DepartmentId == department_id, 
-                        Course.Status == 'نشط')
-                 .all())
-        return [course.Id for course in courses]
+        return list(get_catalog_snapshot().available_courses.get((semester, department_id), []))
     except Exception as e:
         logger.error(f"Error in get_available_courses: {str(e)}")
         raise
 
-def get_registerable_courses(student_data, available_courses, course_data):
+def _validate_registration_data(student_data, available_courses, course_data):
+    if not all([student_data, available_courses, course_data]):
+        raise ValidationError("Missing required data for course registration")
+
+    current_semester = student_data.get("current_semester")
+    student_department = student_data.get("department_id")
+
+    if not current_semester or not student_department:
+        raise ValidationError("Missing semester or department information")
+
+    return current_semester, student_department
+
+def get_registerable_courses(student_data, available_courses, course_data, eligibility_index=None):
     """
     الحصول على المواد التي يمكن للطالب تسجيلها
     
@@ -161,40 +231,114 @@ def get_registerable_courses(student_data, available_courses, course_data):
         student_data (dict): بيانات الطالب
         available_courses (list): المواد المتاحة
         course_data (dict): بيانات المواد
+        eligibility_index (EligibilityIndex): فهرس الأهلية (الافتراضي get_eligibility_index)
 
     Returns:
         list: قائمة بالمواد التي يمكن تسجيلها
     """
     try:
-        if not all([student_data, available_courses, course_data]):
-            raise ValidationError("Missing required data for course registration")
+        current_semester, student_department = _validate_registration_data(
+            student_data, available_courses, course_data
+        )
 
-        current_semester = student_data.get("current_semester")
-        student_department = student_data.get("department_id")
+        index = eligibility_index or get_eligibility_index()
+        registerable = index.registerable(
+            index.mask(available_courses),
+            index.mask(student_data["failed_courses"]),
+            current_semester,
+            student_department
+        )
+        return index.courses(registerable)
 
-        if not current_semester or not student_department:
-            raise ValidationError("Missing semester or department information")
+    except Exception as e:
+        logger.error(f"Error in get_registerable_courses: {str(e)}")
+        raise
 
-        current_semester_courses = [
-            course for course in available_courses
-            if course_data.get(course, {}).get("semester") == current_semester
-            and student_department == course_data.get(course, {}).get("department_id")
-        ]
+def get_eligible_courses(student_data, available_courses, course_data, eligibility_index=None):
+    """
+    المواد الإجبارية والاختيارية التي استوفى الطالب متطلباتها السابقة
 
-        failed_mandatory_courses = [
-            course for course in student_data["failed_courses"]
-            if course_data.get(course, {}).get("is_mandatory") == True
-            and student_department == course_data.get(course, {}).get("department_id")
-        ]
+    Args:
+        student_data (dict): بيانات الطالب
+        available_courses (list): المواد المتاحة
+        course_data (dict): بيانات المواد
+        eligibility_index (EligibilityIndex): فهرس الأهلية (الافتراضي get_eligibility_index)
+
+    Returns:
+        tuple: (المواد الإجبارية, المواد الاختيارية)
+    """
+    current_semester, student_department = _validate_registration_data(
+        student_data, available_courses, course_data
+    )
+
+    index = eligibility_index or get_eligibility_index()
+    mandatory, elective = index.eligible(
+        index.mask(student_data["completed_courses"]),
+        index.mask(student_data["failed_courses"]),
+        index.mask(available_courses),
+        current_semester,
+        student_department
+    )
+    return index.courses(mandatory), index.courses(elective)
+
+def check_registration_eligibility(student_data, course_ids, eligibility_index=None):
+    """
+    التحقق من إمكانية تسجيل الطالب لمجموعة مواد
 
-        registerable_courses = list(set(current_semester_courses + failed_mandatory_courses))
-        return registerable_courses
+    يعتمد فقط على نسخة بيانات المواد وتاريخ الطالب دون ترتيب التوصيات أو تنسيقها
 
+    Args:
+        student_data (dict): بيانات الطالب
+        course_ids (list): المواد المطلوب تسجيلها
+        eligibility_index (EligibilityIndex): فهرس الأهلية (الافتراضي get_eligibility_index)
+
+    Returns:
+        list: المواد غير المسموح بتسجيلها (فارغة إذا كانت جميع المواد مسموحة)
+
+    Raises:
+        ValidationError: في حالة نقص بيانات الطالب
+    """
+    try:
+        available_courses = get_available_courses(
+            student_data.get("current_semester"),
+            student_data.get("department_id")
+        )
+        if not available_courses:
+            return list(course_ids)
+
+        index = eligibility_index or get_eligibility_index()
+        mandatory, elective = index.eligible(
+            index.mask(student_data["completed_courses"]),
+            index.mask(student_data["failed_courses"]),
+            index.mask(available_courses),
+            student_data["current_semester"],
+            student_data["department_id"]
+        )
+        allowed = mandatory | elective
+
+        return [
+            course_id for course_id in course_ids
+            if course_id not in index.ordinals or not allowed[index.ordinals[course_id]]
+        ]
     except Exception as e:
-        logger.error(f"Error in get_registerable_courses: {str(e)}")
+        logger.error(f"Error in check_registration_eligibility: {str(e)}")
         raise
 
-def recommend_courses(student_data, available_courses, course_data, prerequisites):
+def _has_descriptions(course_ids, course_data):
+    return any(course_data.get(course, {}).get("description") for course in course_ids)
+
+def _validate_ranking(ranking):
+    if ranking not in RANKING_MODES:
+        raise ValidationError(f"ranking must be one of: {', '.join(RANKING_MODES)}")
+
+def _blend_scores(ranking, content_scores, collaborative_scores):
+    if ranking == 'content':
+        return content_scores
+    if ranking == 'collaborative':
+        return collaborative_scores
+    return BLENDED_CONTENT_WEIGHT * content_scores + (1 - BLENDED_CONTENT_WEIGHT) * collaborative_scores
+
+def recommend_courses(student_data, available_courses, course_data, course_index=None, ranking='content'):
     """
     توصية المواد للطالب
     
@@ -202,37 +346,20 @@ def recommend_courses(student_data, available_courses, course_data, prerequisite
         student_data (dict): بيانات الطالب
         available_courses (list): المواد المتاحة
         course_data (dict): بيانات المواد
-        prerequisites (dict): المتطلبات السابقة
+        course_index (CourseIndex): فهرس أوصاف المواد (الافتراضي get_course_index)
+        ranking (str): طريقة ترتيب المواد الاختيارية (content أو collaborative أو blended)
 
     Returns:
         dict: قاموس يحتوي على المواد الموصى بها (إجبارية واختيارية)
     """
     try:
-        if not all([student_data, available_courses, course_data, prerequisites]):
+        if not all([student_data, available_courses, course_data]):
             raise ValidationError("Missing required data for course recommendation")
+        _validate_ranking(ranking)
 
-        registerable_courses = get_registerable_courses(student_data, available_courses, course_data)
-
-        course_descriptions = {
-            course_id: course_data.get(course_id, {}).get("description", "")
-            for course_id in course_data
-        }
-
-        eligible_courses = [
-            course for course in registerable_courses
-            if all(prereq in student_data["completed_courses"] 
-                  for prereq in prerequisites.get(course, []))
-        ]
-
-        mandatory_courses = [
-            course for course in eligible_courses
-            if course_data.get(course, {}).get("is_mandatory") == True
-        ]
-        
-        elective_courses = [
-            course for course in eligible_courses
-            if course_data.get(course, {}).get("is_mandatory") == False
-        ]
+        mandatory_courses, elective_courses = get_eligible_courses(
+            student_data, available_courses, course_data
+        )
 
         if not elective_courses:
             return {
@@ -241,22 +368,22 @@ def recommend_courses(student_data, available_courses, course_data, prerequisite
             }
 
         studied_courses = student_data["completed_courses"]
-        studied_descriptions = [course_descriptions.get(course, "") for course in studied_courses]
-        available_descriptions = [course_descriptions.get(course, "") for course in elective_courses]
 
-        if not any(studied_descriptions) or not any(available_descriptions):
-            return {
-                "mandatory": mandatory_courses,
-                "elective": elective_courses
-            }
+        content_scores = np.zeros(len(elective_courses))
+        if (ranking != 'collaborative'
+                and _has_descriptions(studied_courses, course_data)
+                and _has_descriptions(elective_courses, course_data)):
+            if course_index is None:
+                course_index = get_course_index()
+            # متجه اهتمامات الطالب محفوظ ويُحدّث بإضافة المواد الجديدة فقط
+            profile = get_interest_profile(student_data["id"], studied_courses, course_index)
+            content_scores = course_index.score(profile.centroid, elective_courses)
 
-        vectorizer = TfidfVectorizer()
-        tfidf_matrix = vectorizer.fit_transform(studied_descriptions + available_descriptions)
-        similarity_matrix = cosine_similarity(
-            tfidf_matrix[:len(studied_descriptions)], 
-            tfidf_matrix[len(studied_descriptions):]
-        )
-        similarity_scores = similarity_matrix.mean(axis=0)
+        collaborative_scores = np.zeros(len(elective_courses))
+        if ranking != 'content':
+            collaborative_scores = get_co_enrollment_model().score(studied_courses, elective_courses)
+
+        similarity_scores = _blend_scores(ranking, content_scores, collaborative_scores)
 
         course_similarity = list(zip(elective_courses, similarity_scores))
         sorted_courses = [course for course, _ in sorted(
@@ -274,6 +401,106 @@ def recommend_courses(student_data, available_courses, course_data, prerequisite
         logger.error(f"Error in recommend_courses: {str(e)}")
         raise
 
+def recommend_courses_batch(students_data, course_data, course_index=None, eligibility_index=None, ranking='content'):
+    """
+    توصية المواد لمجموعة من الطلاب في تمريرة واحدة
+
+    يتم تحميل المواد المتاحة مرة واحدة لكل (فصل، قسم) وحساب درجات التشابه
+    لكل طلاب المجموعة بضرب مصفوفة المواد المكتملة في مصفوفة متجهات المواد
+
+    Args:
+        students_data (list): بيانات الطلاب كما تعيدها get_students_data
+        course_data (dict): بيانات المواد
+        course_index (CourseIndex): فهرس أوصاف المواد (الافتراضي get_course_index)
+        eligibility_index (EligibilityIndex): فهرس الأهلية (الافتراضي get_eligibility_index)
+        ranking (str): طريقة ترتيب المواد الاختيارية (content أو collaborative أو blended)
+
+    Yields:
+        tuple: (معرف الطالب, التوصيات أو None, رسالة الخطأ أو None)
+    """
+    _validate_ranking(ranking)
+    if course_index is None:
+        course_index = get_course_index()
+    if eligibility_index is None:
+        eligibility_index = get_eligibility_index()
+
+    groups = {}
+    for student_data in students_data:
+        key = (student_data["current_semester"], student_data["department_id"])
+        groups.setdefault(key, []).append(student_data)
+
+    for (semester, department_id), group in groups.items():
+        try:
+            available_courses = get_available_courses(semester, department_id)
+        except ValidationError as e:
+            for student_data in group:
+                yield student_data["id"], None, str(e)
+            continue
+
+        if not available_courses:
+            for student_data in group:
+                yield student_data["id"], {"mandatory": [], "elective": []}, None
+            continue
+
+        try:
+            _validate_registration_data(group[0], available_courses, course_data)
+        except ValidationError as e:
+            for student_data in group:
+                yield student_data["id"], None, str(e)
+            continue
+
+        # أهلية جميع طلاب المجموعة بعمليات على مصفوفات (طالب × مادة)
+        mandatory_matrix, elective_matrix = eligibility_index.eligible(
+            eligibility_index.matrix([student_data["completed_courses"] for student_data in group]),
+            eligibility_index.matrix([student_data["failed_courses"] for student_data in group]),
+            eligibility_index.mask(available_courses),
+            semester,
+            department_id
+        )
+        eligible = [
+            (student_data, eligibility_index.courses(mandatory_matrix[i]), eligibility_index.courses(elective_matrix[i]))
+            for i, student_data in enumerate(group)
+        ]
+
+        # الطلاب الذين يحتاجون ترتيب المواد الاختيارية
+        ranked = [i for i, (_, _, elective_courses) in enumerate(eligible) if elective_courses]
+        candidate_courses = sorted({course for i in ranked for course in eligible[i][2]})
+        columns = {course: j for j, course in enumerate(candidate_courses)}
+        studied_lists = [eligible[i][0]["completed_courses"] for i in ranked]
+
+        content_scores = np.zeros((len(ranked), len(candidate_courses)))
+        if ranking != 'collaborative':
+            described = [
+                row for row, i in enumerate(ranked)
+                if _has_descriptions(eligible[i][0]["completed_courses"], course_data)
+                and _has_descriptions(eligible[i][2], course_data)
+            ]
+            if described:
+                content_scores[described] = course_index.mean_similarity_matrix(
+                    [studied_lists[row] for row in described],
+                    candidate_courses
+                )
+
+        collaborative_scores = np.zeros((len(ranked), len(candidate_courses)))
+        if ranking != 'content' and ranked:
+            collaborative_scores = get_co_enrollment_model().score_matrix(studied_lists, candidate_courses)
+
+        scores = _blend_scores(ranking, content_scores, collaborative_scores)
+        score_rows = {i: row for row, i in enumerate(ranked)}
+
+        for i, (student_data, mandatory_courses, elective_courses) in enumerate(eligible):
+            if i in score_rows:
+                student_scores = scores[score_rows[i]]
+                elective_courses = sorted(
+                    elective_courses,
+                    key=lambda course: student_scores[columns[course]],
+                    reverse=True
+                )
+            yield student_data["id"], {
+                "mandatory": mandatory_courses,
+                "elective": elective_courses
+            }, None
+
 def get_current_semester():
     """الحصول على الفصل الدراسي الحالي بناءً على التاريخ الحالي"""
     current_date = datetime.now()
@@ -338,8 +565,7 @@ def get_recommended_courses(student_id):
         # 3. الحصول على بيانات الطالب
         student_data = get_student_data(student_id)
         
-        # 4. الحصول على المتطلبات السابقة وبيانات المواد
-        prerequisites = get_prerequisites()
+        # 4. الحصول على بيانات المواد
         course_data = get_course_data()
         
         # 5. الحصول على المواد المتاحة كقائمة معرفات
@@ -349,8 +575,7 @@ def get_recommended_courses(student_id):
         recommendations = recommend_courses(
             student_data,
             available_course_ids,
-            course_data,
-            prerequisites
+            course_data
         )
         
         # 7. دمج المواد الإلزامية والاختيارية
@@ -384,21 +609,23 @@ def get_recommended_courses(student_id):
         logger.error(f"Error in get_recommended_courses: {str(e)}")
         return None
 
-def check_enrollment_period():
-    """التحقق من فترة التسجيل"""
-    start_time = redis_client.get('enrollment:start_time')
-    end_time = redis_client.get('enrollment:end_time')
+def check_enrollment_period(student=None):
+    """
+    التحقق من فترة التسجيل
+
+    Args:
+        student (Student): الطالب لاختيار فترة قسمه أو مستواه أو فئة معدله (الفترة العامة إذا لم يُحدد)
+    """
+    window = get_enrollment_window(student)
     
-    if not start_time or not end_time:
+    if window is None:
         return False, "لم يتم تعيين فترة التسجيل"
         
     now = datetime.now()
-    start_dt = datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S")
-    end_dt = datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S")
     
-    if now < start_dt:
+    if now < window.start_dt:
         return False, "لم يبدأ التسجيل بعد"
-    elif now > end_dt:
+    elif now > window.end_dt:
         return False, "انتهت فترة التسجيل"
         
     return True, None
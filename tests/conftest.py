@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import fakeredis
+    import redis
+except ImportError:
+    pass
+else:
+    # الوحدات تتصل بـ Redis عند استيرادها، فتُستبدل بـ Redis في الذاكرة قبل ذلك
+    redis.Redis = fakeredis.FakeRedis
+
+
+@pytest.fixture
+def redis_client():
+    from redis_config import redis_client
+    redis_client.flushdb()
+    yield redis_client
+    redis_client.flushdb()
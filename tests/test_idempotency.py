@@ -0,0 +1,37 @@
+import json
+import time
+
+import pytest
+
+pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+from flask import Flask
+
+import idempotency
+from idempotency import idempotent, IDEMPOTENCY_HEADER, IDEMPOTENCY_KEY
+
+
+@pytest.fixture
+def app():
+    return Flask(__name__)
+
+
+def test_lock_is_renewed_while_request_runs(app, redis_client, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_LOCK_SECONDS", 1)
+    redis_key = IDEMPOTENCY_KEY.format(path="/enrollment/add/1", key="abc")
+    states = []
+
+    @idempotent
+    def slow():
+        time.sleep(1.5)
+        states.append(json.loads(redis_client.get(redis_key))["state"])
+        return {"message": "ok"}, 201
+
+    with app.test_request_context("/enrollment/add/1", method="POST", json={"courses": [1]},
+                                  headers={IDEMPOTENCY_HEADER: "abc"}):
+        assert slow() == ({"message": "ok"}, 201)
+
+    assert states == ["processing"]
+    assert json.loads(redis_client.get(redis_key))["state"] == "done"
+
@@ -0,0 +1,97 @@
+import pytest
+
+pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+
+import ledger
+from ledger import charge_credits, commit_charge, cancel_charge, release_credits, invalidate_credit_ledger
+
+STUDENT_ID = 1
+SEMESTER = "الفصل الأول"
+
+
+def load(current=0, cap=18):
+    return lambda: (current, cap)
+
+
+def ledger_current(redis_client):
+    return int(redis_client.hget(ledger._ledger_key(STUDENT_ID, SEMESTER), "current"))
+
+
+def test_interleaved_charges_respect_cap(redis_client):
+    # الطلب A لم يُحفظ بعد، وقاعدة البيانات لا تحتوي ساعاته
+    first, _, _ = charge_credits(STUDENT_ID, SEMESTER, 12, load())
+    assert first is not None
+
+    second, current, cap = charge_credits(STUDENT_ID, SEMESTER, 9, load())
+    assert second is None
+    assert (current, cap) == (12, 18)
+
+    commit_charge(first)
+    second, _, _ = charge_credits(STUDENT_ID, SEMESTER, 9, load(current=12))
+    assert second is None
+    assert ledger_current(redis_client) == 12
+
+
+def test_rejection_does_not_reload_ledger(redis_client):
+    charge_credits(STUDENT_ID, SEMESTER, 12, load())
+
+    def fail():
+        raise AssertionError("database should not be read")
+
+    charge, _, _ = charge_credits(STUDENT_ID, SEMESTER, 9, fail)
+    assert charge is None
+
+
+def test_cancel_returns_credits(redis_client):
+    first, _, _ = charge_credits(STUDENT_ID, SEMESTER, 12, load())
+    cancel_charge(first)
+    cancel_charge(first)
+    assert ledger_current(redis_client) == 0
+
+    second, _, _ = charge_credits(STUDENT_ID, SEMESTER, 9, load())
+    assert second is not None
+
+
+def test_expired_charge_is_reclaimed(redis_client, monkeypatch):
+    monkeypatch.setattr(ledger, "CREDIT_HOLD_SECONDS", 0)
+    abandoned, _, _ = charge_credits(STUDENT_ID, SEMESTER, 12, load())
+    monkeypatch.setattr(ledger, "CREDIT_HOLD_SECONDS", 120)
+
+    charge, current, _ = charge_credits(STUDENT_ID, SEMESTER, 9, load())
+    assert charge is not None
+    assert current == 0
+
+    # إلغاء الحجز المستعاد لا يُنقص ساعات الطلب الآخر
+    cancel_charge(abandoned)
+    assert ledger_current(redis_client) == 9
+
+
+def test_commit_after_expiry_restores_credits(redis_client, monkeypatch):
+    monkeypatch.setattr(ledger, "CREDIT_HOLD_SECONDS", 0)
+    slow, _, _ = charge_credits(STUDENT_ID, SEMESTER, 12, load())
+    monkeypatch.setattr(ledger, "CREDIT_HOLD_SECONDS", 120)
+    charge_credits(STUDENT_ID, SEMESTER, 9, load())
+
+    # الساعات المحفوظة تُحسب في السجل حتى لو انتهى حجزها قبل الحفظ
+    commit_charge(slow)
+    assert ledger_current(redis_client) == 21
+
+
+def test_release_credits(redis_client):
+    charge, _, _ = charge_credits(STUDENT_ID, SEMESTER, 12, load())
+    commit_charge(charge)
+    release_credits(STUDENT_ID, SEMESTER, 6)
+    assert ledger_current(redis_client) == 6
+
+    release_credits(STUDENT_ID, SEMESTER, 60)
+    assert ledger_current(redis_client) == 0
+
+
+def test_invalidate_keeps_pending_charges(redis_client):
+    charge_credits(STUDENT_ID, SEMESTER, 12, load())
+    invalidate_credit_ledger(STUDENT_ID, SEMESTER)
+
+    charge, current, _ = charge_credits(STUDENT_ID, SEMESTER, 9, load())
+    assert charge is None
+    assert current == 12
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+pytest.importorskip("fakeredis")
+
+from registration_queue import (
+    enqueue_registration, pop_registrations, complete_tickets, recover_registrations, get_ticket,
+    REGISTRATION_QUEUE_KEY, TICKET_QUEUED, TICKET_PROCESSING, TICKET_DONE, TICKET_FAILED
+)
+
+
+def queued_tickets(redis_client):
+    return [json.loads(item)["ticket_id"] for item in redis_client.lrange(REGISTRATION_QUEUE_KEY, 0, -1)]
+
+
+def test_popped_registrations_stay_in_worker_list(redis_client):
+    tickets = [enqueue_registration(student_id, [1, 2]) for student_id in range(3)]
+
+    registrations = pop_registrations(2, "host:0", timeout=0.1)
+    assert [registration["ticket_id"] for registration in registrations] == tickets[:2]
+    assert get_ticket(tickets[0])["status"] == TICKET_PROCESSING
+    assert redis_client.llen("registration:processing:host:0") == 2
+    assert queued_tickets(redis_client) == tickets[2:]
+
+
+def test_complete_stores_results_and_clears_worker_list(redis_client):
+    tickets = [enqueue_registration(student_id, [1]) for student_id in range(2)]
+    pop_registrations(2, "host:0", timeout=0.1)
+
+    complete_tickets({tickets[0]: ({"message": "ok"}, 201), tickets[1]: ({"error": "boom"}, 500)}, "host:0")
+    assert get_ticket(tickets[0])["status"] == TICKET_DONE
+    assert get_ticket(tickets[0])["result"] == {"message": "ok"}
+    assert get_ticket(tickets[1])["status"] == TICKET_FAILED
+    assert not redis_client.exists("registration:processing:host:0")
+
+
+def test_recover_requeues_in_order_at_head(redis_client):
+    tickets = [enqueue_registration(student_id, [1]) for student_id in range(4)]
+    pop_registrations(2, "host:0", timeout=0.1)
+    pop_registrations(1, "other:0", timeout=0.1)
+
+    assert recover_registrations("host:*") == 2
+    assert queued_tickets(redis_client) == [tickets[0], tickets[1], tickets[3]]
+    assert get_ticket(tickets[0])["status"] == TICKET_QUEUED
+    assert get_ticket(tickets[2])["status"] == TICKET_PROCESSING
+
+
+def test_pop_from_empty_queue(redis_client):
+    assert pop_registrations(5, "host:0", timeout=0.1) == []
@@ -0,0 +1,23 @@
+import pytest
+
+pytest.importorskip("fakeredis")
+pytest.importorskip("flask_restful")
+
+from registration_queue import enqueue_registration, pop_registrations, get_ticket, TICKET_FAILED
+from registration_worker import _fail_tickets
+
+
+def test_failed_batch_marks_tickets_failed(redis_client):
+    tickets = [enqueue_registration(student_id, [1]) for student_id in range(2)]
+    registrations = pop_registrations(2, "host:0", timeout=0.1)
+
+    assert _fail_tickets(registrations, "host:0", RuntimeError("database is down"))
+    for ticket_id in tickets:
+        ticket = get_ticket(ticket_id)
+        assert ticket["status"] == TICKET_FAILED
+        assert ticket["result"] == {"error": "database is down"}
+    assert not redis_client.exists("registration:processing:host:0")
+
+
+def test_failed_pop_leaves_worker_list_for_recovery(redis_client):
+    assert not _fail_tickets([], "host:0", RuntimeError("redis is down"))
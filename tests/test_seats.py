@@ -0,0 +1,134 @@
+import os
+import time
+from datetime import date
+
+import pytest
+
+pytest.importorskip("fakeredis")
+pytest.importorskip("lupa")
+pytest.importorskip("flask_sqlalchemy")
+
+from flask import Flask
+
+import seats
+from models import db, Course, Enrollment
+from seats import (
+    reserve_seats, confirm_reservation, cancel_reservation, release_seats, get_taken_seats,
+    recover_seat_holds, recount_seats, reset_seat_inventory, SEATS_HOLD_SECONDS,
+    SEATS_TAKEN_KEY, SEATS_INFLIGHT_KEY, SEATS_HOLDS_KEY, SEATS_DIRTY_KEY, SEATS_RECOUNT_KEY
+)
+
+
+@pytest.fixture
+def app(redis_client, monkeypatch):
+    # بدون خيط المطابقة الخلفي
+    monkeypatch.setattr(seats, "_reconciler_pid", os.getpid())
+    app = Flask(__name__)
+    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite://"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Course(Id=1, Name="Algorithms", Code="CS301", Description="", Credits=3, Status="نشط",
+                   Semester=1, MaxSeats=2, CurrentEnrolledStudents=0),
+            Course(Id=2, Name="Databases", Code="CS302", Description="", Credits=3, Status="نشط",
+                   Semester=1, MaxSeats=1, CurrentEnrolledStudents=0),
+        ])
+        db.session.commit()
+        yield app
+        db.session.remove()
+        db.drop_all()
+
+
+def enroll(student_id, course_id):
+    db.session.add(Enrollment(StudentId=student_id, CourseId=course_id, Semester="الفصل الأول",
+                              NumberOFSemster="1", AddedEnrollmentDate=date.today(), IsCompleted="قيد الدراسة"))
+    db.session.commit()
+
+
+def test_reserve_and_confirm(app, redis_client):
+    reservation, full_course = reserve_seats([1, 2])
+    assert full_course is None
+    assert get_taken_seats([1, 2]) == {1: 1, 2: 1}
+    assert redis_client.hgetall(SEATS_INFLIGHT_KEY) == {"1": "1", "2": "1"}
+
+    confirm_reservation(reservation)
+    assert get_taken_seats([1, 2]) == {1: 1, 2: 1}
+    assert redis_client.hgetall(SEATS_INFLIGHT_KEY) == {"1": "0", "2": "0"}
+    assert redis_client.zcard(SEATS_HOLDS_KEY) == 0
+    assert redis_client.smembers(SEATS_DIRTY_KEY) == {"1", "2"}
+
+
+def test_full_course_reserves_nothing(app):
+    reserve_seats([2])
+    reservation, full_course = reserve_seats([1, 2])
+    assert reservation is None
+    assert full_course == 2
+    assert get_taken_seats([1, 2]) == {1: 0, 2: 1}
+
+
+def test_cancel_and_release_return_seats(app, redis_client):
+    reservation, _ = reserve_seats([1, 2])
+    cancel_reservation(reservation)
+    assert get_taken_seats([1, 2]) == {1: 0, 2: 0}
+
+    reservation, _ = reserve_seats([1])
+    confirm_reservation(reservation)
+    release_seats([1])
+    release_seats([1])
+    assert get_taken_seats([1]) == {1: 0}
+
+
+def test_loaded_inventory_counts_active_enrollments(app):
+    enroll(10, 2)
+    reservation, full_course = reserve_seats([2])
+    assert reservation is None
+    assert full_course == 2
+
+
+def test_abandoned_hold_is_recovered(app, redis_client):
+    abandoned, _ = reserve_seats([2])
+    assert recover_seat_holds() == 0
+
+    assert recover_seat_holds(now=time.time() + SEATS_HOLD_SECONDS + 1) == 1
+    assert redis_client.hget(SEATS_INFLIGHT_KEY, "2") == "0"
+    assert redis_client.smembers(SEATS_RECOUNT_KEY) == {"2"}
+
+    assert recount_seats() == 1
+    assert get_taken_seats([2]) == {2: 0}
+
+    # تأكيد الحجز بعد استعادته يعيد عد المادة بدلاً من تعديل العدد
+    enroll(11, 2)
+    confirm_reservation(abandoned)
+    assert get_taken_seats([2]) == {2: 0}
+    assert recount_seats() == 1
+    assert get_taken_seats([2]) == {2: 1}
+
+
+def test_recount_waits_for_pending_reservations(app, redis_client):
+    reservation, _ = reserve_seats([1])
+    assert reset_seat_inventory() == 1
+
+    assert recount_seats() == 0
+    assert get_taken_seats([1]) == {1: 1}
+
+    enroll(10, 1)
+    confirm_reservation(reservation)
+    assert recount_seats() == 1
+    assert get_taken_seats([1]) == {1: 1}
+
+
+def test_fallback_courses_reload_from_database(app, redis_client):
+    reservation, _ = reserve_seats([1])
+    enroll(10, 1)
+    confirm_reservation(reservation)
+
+    # تسجيل أثناء تعذر الوصول إلى Redis (عداد قاعدة البيانات فقط)
+    seats._mark_fallback([1])
+    enroll(11, 1)
+    assert get_taken_seats([1]) == {1: 1}
+
+    reservation, full_course = reserve_seats([1])
+    assert reservation is None
+    assert full_course == 1
+    assert redis_client.hget(SEATS_TAKEN_KEY, "1") == "2"
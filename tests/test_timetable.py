@@ -0,0 +1,47 @@
+from datetime import time
+
+import pytest
+
+pytest.importorskip("fakeredis")
+
+from timetable import TimetableIndex, generate_timetables
+
+
+def make_index(*classes):
+    return TimetableIndex(list(classes))
+
+
+def test_back_to_back_classes_do_not_conflict():
+    index = make_index(
+        (1, "الأحد", time(8, 30), time(9, 52)),
+        (2, "الأحد", time(9, 52), time(11, 0)),
+    )
+    assert index.conflicts([2], [1]) == []
+
+
+def test_overlapping_classes_conflict():
+    index = make_index(
+        (1, "الأحد", time(8, 30), time(9, 52)),
+        (2, "الأحد", time(9, 51), time(11, 0)),
+        (3, "الإثنين", time(9, 0), time(10, 0)),
+    )
+    assert index.conflicts([2, 3], [1]) == [(2, 1)]
+    assert index.conflict_map([1, 2, 3]) == {2: [1], 1: [2]}
+
+
+def test_same_time_on_different_days_does_not_conflict():
+    index = make_index(
+        (1, "sunday", time(9, 0), time(10, 0)),
+        (2, "Monday", time(9, 0), time(10, 0)),
+    )
+    assert index.conflicts([2], [1]) == []
+
+
+def test_generated_timetables_include_back_to_back_classes():
+    index = make_index(
+        (1, "الأحد", time(8, 0), time(9, 52)),
+        (2, "الأحد", time(9, 52), time(11, 0)),
+        (3, "الأحد", time(9, 0), time(10, 0)),
+    )
+    timetables = generate_timetables(index, {1: 3, 2: 2, 3: 4}, {1: 3, 2: 3, 3: 3}, max_credits=9, k=2)
+    assert [courses for _, _, courses in timetables] == [[1, 2], [3]]
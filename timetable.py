@@ -0,0 +1,210 @@
+from models import db, Class
+from catalog import get_catalog_version
+import threading
+import heapq
+import logging
+
+logger = logging.getLogger(__name__)
+
+# جدول المادة الأسبوعي عدد صحيح بـ bit لكل دقيقة، فالمحاضرات المتتالية (نهاية إحداها بداية الأخرى) لا تتعارض
+MINUTES_PER_DAY = 24 * 60
+
+DAY_INDEX = {
+    "السبت": 0, "saturday": 0,
+    "الأحد": 1, "الاحد": 1, "sunday": 1,
+    "الإثنين": 2, "الاثنين": 2, "monday": 2,
+    "الثلاثاء": 3, "tuesday": 3,
+    "الأربعاء": 4, "الاربعاء": 4, "wednesday": 4,
+    "الخميس": 5, "thursday": 5,
+    "الجمعة": 6, "friday": 6,
+}
+
+
+def _minutes(value):
+    return value.hour * 60 + value.minute
+
+
+def class_mask(day, start_time, end_time):
+    """
+    دقائق المحاضرة في الأسبوع كـ bitmask
+
+    Args:
+        day (str): اليوم بالعربية أو الإنجليزية
+        start_time (datetime.time): وقت البداية
+        end_time (datetime.time): وقت النهاية
+
+    Returns:
+        int: الـ bitmask أو None إذا كان اليوم أو الوقت غير صالح
+    """
+    day_index = DAY_INDEX.get((day or "").strip().lower())
+    if day_index is None or start_time is None or end_time is None:
+        return None
+
+    first = _minutes(start_time)
+    last = _minutes(end_time)
+    if last <= first:
+        return None
+
+    offset = day_index * MINUTES_PER_DAY
+    return ((1 << (last - first)) - 1) << (offset + first)
+
+
+class TimetableIndex:
+    """
+    جدول محاضرات كل مادة كـ bitmask أسبوعي
+
+    تعارض مادتين هو AND بين الـ bitmask الخاص بهما، دون مقارنة المحاضرات زوجًا بزوج
+
+    Args:
+        classes (list): صفوف (معرف المادة, اليوم, وقت البداية, وقت النهاية)
+        version (int): رقم نسخة بيانات المواد التي بُني منها الفهرس
+    """
+
+    def __init__(self, classes, version=None):
+        self.version = version
+        self.masks = {}
+        for course_id, day, start_time, end_time in classes:
+            mask = class_mask(day, start_time, end_time)
+            if mask is None:
+                logger.warning(f"Skipping class of course {course_id} with invalid schedule: {day} {start_time}-{end_time}")
+                continue
+            self.masks[course_id] = self.masks.get(course_id, 0) | mask
+
+    def mask(self, course_ids):
+        """اتحاد جداول المواد"""
+        occupied = 0
+        for course_id in course_ids:
+            occupied |= self.masks.get(course_id, 0)
+        return occupied
+
+    def conflicts(self, course_ids, fixed_courses=()):
+        """
+        تعارضات المواد المطلوبة مع المواد الثابتة (المسجلة) ومع بعضها
+
+        Args:
+            course_ids (list): المواد المطلوبة
+            fixed_courses (iterable): المواد المسجلة بالفعل
+
+        Returns:
+            list: أزواج (المادة المطلوبة, المادة المتعارضة معها)
+        """
+        placed = list(dict.fromkeys(fixed_courses))
+        occupied = self.mask(placed)
+        conflicts = []
+        for course_id in course_ids:
+            mask = self.masks.get(course_id, 0)
+            if mask & occupied:
+                # البحث عن المادة المتعارضة فقط عند وجود تعارض
+                conflicts.extend(
+                    (course_id, other) for other in placed
+                    if other != course_id and self.masks.get(other, 0) & mask
+                )
+            occupied |= mask
+            placed.append(course_id)
+        return conflicts
+
+    def conflict_map(self, course_ids):
+        """
+        المواد المتعارضة مع كل مادة داخل المجموعة
+
+        Returns:
+            dict: قائمة المواد المتعارضة لكل مادة لها تعارض
+        """
+        result = {}
+        for course_id, other in self.conflicts(course_ids):
+            result.setdefault(course_id, []).append(other)
+            result.setdefault(other, []).append(course_id)
+        return result
+
+
+def generate_timetables(index, course_values, course_credits, max_credits, k=3, fixed_courses=()):
+    """
+    أفضل k جداول بدون تعارض من المواد المرشحة (بحث branch and bound على الـ bitmask)
+
+    كل جدول مكتمل: لا يمكن إضافة أي مادة مرشحة أخرى إليه دون تعارض أو تجاوز الساعات
+
+    Args:
+        index (TimetableIndex): فهرس الجداول
+        course_values (dict): قيمة كل مادة مرشحة (الأعلى أفضل)
+        course_credits (dict): ساعات كل مادة
+        max_credits (int): الساعات المتاحة للإضافة
+        k (int): عدد الجداول المطلوبة
+        fixed_courses (iterable): المواد المسجلة بالفعل
+
+    Returns:
+        list: (قيمة الجدول, الساعات, قائمة المواد) من الأفضل للأقل
+    """
+    candidates = sorted(course_values, key=lambda course_id: (-course_values[course_id], course_id))
+    masks = [index.masks.get(course_id, 0) for course_id in candidates]
+    values = [course_values[course_id] for course_id in candidates]
+    credits = [course_credits.get(course_id) or 0 for course_id in candidates]
+
+    # أقصى قيمة يمكن إضافتها من المواد المتبقية (حد أعلى للتقليم)
+    remaining = [0] * (len(candidates) + 1)
+    for i in range(len(candidates) - 1, -1, -1):
+        remaining[i] = remaining[i + 1] + values[i]
+
+    best = []  # min-heap بطول k
+    chosen = []
+    skipped = []
+
+    def search(i, mask, value, total_credits):
+        if len(best) == k and value + remaining[i] <= best[0][0]:
+            return
+
+        if i == len(candidates):
+            # تجاهل الجداول التي يمكن إضافة مادة متخطاة إليها (يوجد جدول أفضل يحتويها)
+            for j in skipped:
+                if not masks[j] & mask and total_credits + credits[j] <= max_credits:
+                    return
+            entry = (value, total_credits, [candidates[j] for j in chosen])
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            else:
+                heapq.heappushpop(best, entry)
+            return
+
+        if not masks[i] & mask and total_credits + credits[i] <= max_credits:
+            chosen.append(i)
+            search(i + 1, mask | masks[i], value + values[i], total_credits + credits[i])
+            chosen.pop()
+
+        skipped.append(i)
+        search(i + 1, mask, value, total_credits)
+        skipped.pop()
+
+    search(0, index.mask(fixed_courses), 0, 0)
+    return sorted(best, key=lambda entry: (-entry[0], -entry[1], entry[2]))
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def _load_index(version):
+    classes = db.session.query(Class.CourseId, Class.Day, Class.StartTime, Class.EndTime).all()
+    index = TimetableIndex(classes, version)
+    logger.debug(f"Built timetable index for {len(index.masks)} courses (catalog v{version})")
+    return index
+
+
+def get_timetable_index():
+    """
+    فهرس جداول المحاضرات داخل العملية
+
+    يُعاد بناؤه فقط عند تغير نسخة بيانات المواد (تعديل المحاضرات يتبعه إلغاء نسخة المواد)
+
+    Returns:
+        TimetableIndex: فهرس الجداول
+    """
+    global _index
+
+    version = get_catalog_version()
+    index = _index
+    if index is not None and index.version == version:
+        return index
+
+    with _index_lock:
+        if _index is None or _index.version != version:
+            _index = _load_index(version)
+        return _index
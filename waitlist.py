@@ -0,0 +1,128 @@
+from redis_config import redis_client
+import json
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# قائمة انتظار لكل مادة: الأقل درجة يُرقّى أولاً
+WAITLIST_KEY = 'waitlist:{course_id}'
+
+# نتيجة انتظار الطالب في كل مادة بعد خروجه من القائمة (ترقية أو استبعاد)
+WAITLIST_OUTCOME_KEY = 'waitlist:outcome:{student_id}'
+WAITLIST_OUTCOME_TTL_SECONDS = 7 * 24 * 3600
+
+WAITLIST_PROMOTED = 'promoted'
+WAITLIST_REMOVED = 'removed'
+
+# مكونات درجة الأولوية: الفئة ثم المعدل (الأعلى أولاً) ثم وقت الانضمام
+# (أعداد صحيحة أقل من 2^53 حتى تبقى دقيقة في Redis)
+_TIER_WEIGHT = 10 ** 14
+_GPA_WEIGHT = 10 ** 10
+_MAX_GPA = 4.0
+
+
+def _waitlist_key(course_id):
+    return WAITLIST_KEY.format(course_id=course_id)
+
+
+def _outcome_key(student_id):
+    return WAITLIST_OUTCOME_KEY.format(student_id=student_id)
+
+
+def waitlist_priority(student_data, course_id, course_data):
+    """
+    درجة أولوية الطالب في قائمة انتظار المادة
+
+    المواد الإجبارية التي رسب فيها الطالب أولاً، ثم المعدل الأعلى، ثم الأسبق انضمامًا
+
+    Returns:
+        int: درجة الأولوية (الأقل أولاً)
+    """
+    failed_mandatory = (
+        course_id in student_data.get("failed_courses", [])
+        and course_data.get(course_id, {}).get("is_mandatory") == True
+    )
+    tier = 0 if failed_mandatory else 1
+    gpa = min(max(float(student_data.get("gpa") or 0.0), 0.0), _MAX_GPA)
+    gpa_rank = int(round((_MAX_GPA - gpa) * 1000))
+    return tier * _TIER_WEIGHT + gpa_rank * _GPA_WEIGHT + int(time.time())
+
+
+def join_waitlist(student_id, course_id, priority):
+    """
+    إضافة الطالب إلى قائمة انتظار المادة (لا يتغير ترتيبه إذا كان موجودًا)
+
+    Returns:
+        int: ترتيب الطالب في القائمة (يبدأ من 1)
+    """
+    pipe = redis_client.pipeline()
+    pipe.zadd(_waitlist_key(course_id), {student_id: priority}, nx=True)
+    pipe.hdel(_outcome_key(student_id), course_id)
+    pipe.zrank(_waitlist_key(course_id), student_id)
+    _, _, rank = pipe.execute()
+    return rank + 1
+
+
+def leave_waitlist(student_id, course_id):
+    """
+    حذف الطالب من قائمة انتظار المادة
+
+    Returns:
+        bool: True إذا كان الطالب في القائمة
+    """
+    return bool(redis_client.zrem(_waitlist_key(course_id), student_id))
+
+
+def get_waitlist_status(student_id, course_id):
+    """
+    ترتيب الطالب في قائمة انتظار المادة أو نتيجة انتظاره
+
+    Returns:
+        dict: الترتيب وطول القائمة، أو نتيجة الانتظار، أو None
+    """
+    pipe = redis_client.pipeline()
+    pipe.zrank(_waitlist_key(course_id), student_id)
+    pipe.zcard(_waitlist_key(course_id))
+    pipe.hget(_outcome_key(student_id), course_id)
+    rank, length, outcome = pipe.execute()
+
+    if rank is not None:
+        return {"status": "waiting", "position": rank + 1, "waitlist_length": length}
+    if outcome:
+        return json.loads(outcome)
+    return None
+
+
+def pop_waitlist(course_id):
+    """
+    سحب صاحب أعلى أولوية من قائمة انتظار المادة
+
+    Returns:
+        tuple: (معرف الطالب, درجة الأولوية) أو None إذا كانت القائمة فارغة
+    """
+    popped = redis_client.zpopmin(_waitlist_key(course_id))
+    if not popped:
+        return None
+    student_id, priority = popped[0]
+    return int(student_id), int(priority)
+
+
+def requeue_waitlist(student_id, course_id, priority):
+    """إعادة الطالب إلى قائمة الانتظار بنفس أولويته (لم يكن المقعد متاحًا)"""
+    redis_client.zadd(_waitlist_key(course_id), {student_id: priority}, nx=True)
+
+
+def record_waitlist_outcome(student_id, course_id, status, result=None):
+    """تخزين نتيجة انتظار الطالب في المادة"""
+    try:
+        pipe = redis_client.pipeline()
+        pipe.hset(_outcome_key(student_id), course_id, json.dumps({
+            "status": status,
+            "result": result,
+            "at": time.time()
+        }, ensure_ascii=False))
+        pipe.expire(_outcome_key(student_id), WAITLIST_OUTCOME_TTL_SECONDS)
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Error recording waitlist outcome for student {student_id}, course {course_id}: {str(e)}")